@@ -0,0 +1,309 @@
+# wire_bench.py
+"""
+Micro-benchmarks for the vendored ibapi wire layer.
+
+Measures messages/sec and traced allocation bytes per message for framing (comm.read_msg),
+field splitting (comm.read_fields), field decoding (utils.decode), dispatch
+(Decoder.interpret / interpretWithSignature), field encoding (comm.make_field) and
+EClient.placeOrder message construction, over a corpus of representative framed messages.
+
+Usage:
+    python benchmarks/wire_bench.py                         # run and print results
+    python benchmarks/wire_bench.py --save baseline.json    # run and store a baseline
+    python benchmarks/wire_bench.py --compare baseline.json # run and compare against a baseline
+"""
+
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+from decimal import Decimal
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'vendor'))
+
+from ibapi import comm, decoder, orderdecoder, utils
+from ibapi.client import EClient
+from ibapi.comm import make_field
+from ibapi.contract import Contract
+from ibapi.decoder import Decoder
+from ibapi.message import IN
+from ibapi.order import Order
+from ibapi.server_versions import MAX_CLIENT_VER
+from ibapi.wrapper import EWrapper
+
+SERVER_VERSION = MAX_CLIENT_VER
+
+
+class NullWrapper(EWrapper):
+    """Wrapper whose callbacks do nothing, so only decoding cost is measured."""
+
+    def __getattribute__(self, name):
+        attr = object.__getattribute__(self, name)
+        if callable(attr) and not name.startswith('_'):
+            return _noop
+        return attr
+
+
+def _noop(*args, **kwargs):
+    pass
+
+
+class NullConnection:
+    def __init__(self):
+        self.sent = 0
+
+    def isConnected(self):
+        return True
+
+    def sendMsg(self, msg):
+        self.sent += len(msg)
+        return len(msg)
+
+    def disconnect(self):
+        pass
+
+
+def payload(*values):
+    return "".join(make_field(value) for value in values).encode()
+
+
+def frame(text):
+    return comm.make_msg(text.decode())
+
+
+# Representative values returned while synthesizing messages with a complex layout
+SYNTH_VALUES = {
+    int: "0",
+    float: "101.25",
+    str: "SAMPLE",
+    Decimal: "100",
+    bool: "0",
+}
+
+
+def synthesize(msg_id):
+    """
+    Build a well-formed message for decoders with long, version-dependent layouts (contract
+    details, open orders) by running the real decoder on a field stream that records the type
+    each field is decoded as.
+    """
+    types = []
+
+    class Fields:
+        def __iter__(self):
+            return self
+
+        def __next__(self):
+            types.append(None)
+            return b"0" if len(types) > 1 else str(msg_id).encode()
+
+    def recording_decode(the_type, fields, show_unset=False, use_unicode=False):
+        next(fields)
+        types[-1] = the_type
+        return original_decode(the_type, iter([SYNTH_VALUES.get(the_type, "0").encode()]), show_unset, use_unicode)
+
+    original_decode = utils.decode
+    decoder.decode = orderdecoder.decode = recording_decode
+    try:
+        dec = Decoder(NullWrapper(), SERVER_VERSION)
+        dec.msgId2handleInfo[msg_id].processMeth(dec, Fields())
+    finally:
+        decoder.decode = orderdecoder.decode = original_decode
+
+    fields = [str(msg_id)] + [SYNTH_VALUES.get(the_type, "0") for the_type in types[1:]]
+    return "".join(field + "\0" for field in fields).encode()
+
+
+def build_corpus():
+    tick_stream = []
+    for i in range(1000):
+        tick_stream.append(payload(IN.TICK_PRICE, 6, 1000 + i % 20, (1, 2, 4)[i % 3], 101.25 + i % 7, 300, 0))
+        tick_stream.append(payload(IN.TICK_SIZE, 6, 1000 + i % 20, (0, 3, 5)[i % 3], 200 + i))
+
+    bars = [IN.HISTORICAL_DATA, 42, "20240102 09:30:00", "20240102 16:00:00", 390]
+    for i in range(390):
+        bars += [str(1704205800 + i * 60), 101.0 + i * 0.01, 101.5, 100.5, 101.25, 1200, 101.1, 15]
+    bar_dump = [payload(*bars)]
+
+    order_status = [payload(IN.ORDER_STATUS, 100 + i, "Submitted", 10, 90, 0.0, 555 + i, 0, 0.0, 1, "", 0.0)
+                    for i in range(500)]
+
+    return {
+        'tick_stream': tick_stream,
+        'bar_dump': bar_dump,
+        'contract_details': [synthesize(IN.CONTRACT_DATA)] * 200,
+        'order_status': order_status,
+        'open_order': [synthesize(IN.OPEN_ORDER)] * 200,
+    }
+
+
+def measure(fn, count, repeat):
+    """
+    Return (messages/sec, traced allocation bytes per message) for `fn`, which processes
+    `count` messages per call. CPython exposes no allocation counter, so allocations are
+    reported as traced peak bytes.
+    """
+    fn()  # warm-up
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return count / best, (peak - base) / count
+
+
+def bench_read_msg(framed):
+    buf = b"".join(framed)
+
+    def run():
+        rest = buf
+        while rest:
+            _, msg, rest = comm.read_msg(rest)
+            if not msg:
+                break
+    return run
+
+
+def bench_read_fields(payloads):
+    def run():
+        for text in payloads:
+            comm.read_fields(text)
+    return run
+
+
+def bench_decode(field_lists):
+    def run():
+        for fields in field_lists:
+            it = iter(fields)
+            next(it)
+            utils.decode(int, it)
+            utils.decode(int, it)
+            utils.decode(int, it)
+            utils.decode(float, it)
+            utils.decode(Decimal, it)
+    return run
+
+
+def bench_interpret(field_lists):
+    dec = Decoder(NullWrapper(), SERVER_VERSION)
+
+    def run():
+        for fields in field_lists:
+            dec.interpret(fields)
+    return run
+
+
+def bench_make_field(values):
+    def run():
+        for value in values:
+            make_field(value)
+    return run
+
+
+def bench_place_order(count):
+    client = EClient(NullWrapper())
+    client.conn = NullConnection()
+    client.connState = EClient.CONNECTED
+    client.serverVersion_ = SERVER_VERSION
+
+    contract = Contract()
+    contract.symbol = "AAPL"
+    contract.secType = "STK"
+    contract.exchange = "SMART"
+    contract.currency = "USD"
+
+    order = Order()
+    order.action = "BUY"
+    order.orderType = "LMT"
+    order.totalQuantity = Decimal(100)
+    order.lmtPrice = 101.25
+
+    def run():
+        for order_id in range(count):
+            client.placeOrder(order_id, contract, order)
+    return run
+
+
+def run_benchmarks(repeat):
+    corpus = build_corpus()
+    results = {}
+
+    for kind, payloads in corpus.items():
+        framed = [frame(text) for text in payloads]
+        field_lists = [comm.read_fields(text) for text in payloads]
+        count = len(payloads)
+        results[f"read_msg/{kind}"] = measure(bench_read_msg(framed), count, repeat)
+        results[f"read_fields/{kind}"] = measure(bench_read_fields(payloads), count, repeat)
+        results[f"interpret/{kind}"] = measure(bench_interpret(field_lists), count, repeat)
+
+    tick_fields = [comm.read_fields(text) for text in corpus['tick_stream'] if text.startswith(b"1\0")]
+    results["decode/tick_price"] = measure(bench_decode(tick_fields), len(tick_fields), repeat)
+
+    signature_fields = [comm.read_fields(payload(IN.TICK_GENERIC, 6, 1000 + i, 49, 0.0)) for i in range(1000)]
+    results["interpretWithSignature/tick_generic"] = measure(
+        bench_interpret(signature_fields), len(signature_fields), repeat)
+
+    values = ["AAPL", 101.25, 100, True, "SMART", "", 0] * 200
+    results["make_field/mixed"] = measure(bench_make_field(values), len(values), repeat)
+    results["placeOrder/limit"] = measure(bench_place_order(500), 500, repeat)
+
+    return {name: {'msgs_per_sec': rate, 'bytes_per_msg': alloc} for name, (rate, alloc) in results.items()}
+
+
+def print_results(results, baseline=None, threshold=0.1):
+    regressions = []
+    header = f"{'stage':45} {'msgs/sec':>14} {'bytes/msg':>11}"
+    if baseline:
+        header += f" {'vs baseline':>12}"
+    print(header)
+    for name, result in results.items():
+        line = f"{name:45} {result['msgs_per_sec']:14,.0f} {result['bytes_per_msg']:11,.1f}"
+        if baseline and name in baseline:
+            change = result['msgs_per_sec'] / baseline[name]['msgs_per_sec'] - 1
+            line += f" {change:+11.1%}"
+            if change < -threshold:
+                regressions.append(name)
+                line += "  REGRESSION"
+        print(line)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the vendored ibapi wire layer")
+    parser.add_argument('--repeat', type=int, default=5, help="Timed runs per stage; the best is reported")
+    parser.add_argument('--save', metavar='PATH', help="Store the results as a baseline")
+    parser.add_argument('--compare', metavar='PATH', help="Compare against a stored baseline")
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help="Throughput drop against the baseline reported as a regression")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.repeat)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r') as file:
+            baseline = json.load(file)
+
+    regressions = print_results(results, baseline, args.threshold)
+
+    if args.save:
+        with open(args.save, 'w') as file:
+            json.dump(results, file, indent=2)
+
+    if regressions:
+        print(f"{len(regressions)} stages regressed by more than {args.threshold:.0%}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
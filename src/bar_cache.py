@@ -0,0 +1,178 @@
+# bar_cache.py
+
+import json
+import logging
+import os
+import threading
+
+import numpy as np
+
+from clock import SYSTEM_CLOCK
+from utils.import_helper import add_vendor_to_path
+
+add_vendor_to_path()
+from ibapi.common import UNSET_DECIMAL
+
+logger = logging.getLogger(__name__)
+
+
+class BarCache:
+    """
+    Local store of 1-minute bars, one memory-mapped NumPy array per conId.
+
+    The index file keeps the number of stored bars, the allocated capacity and the
+    timestamp of the last stored bar for every conId, so only the missing tail has
+    to be requested from TWS.
+    """
+
+    BAR_DTYPE = np.dtype([
+        ('time', '<i8'),
+        ('open', '<f8'),
+        ('high', '<f8'),
+        ('low', '<f8'),
+        ('close', '<f8'),
+        ('volume', '<f8'),
+    ])
+    INDEX_FILE = 'index.json'
+    MAX_DURATION_SECONDS = 86400  # Longest duration TWS accepts in seconds ("S") units
+
+    def __init__(self, directory, initial_capacity=4096, fresh_seconds=60, clock=SYSTEM_CLOCK):
+        self.clock = clock
+        self.directory = directory
+        self.initial_capacity = initial_capacity
+        self.fresh_seconds = fresh_seconds
+        self.lock = threading.Lock()
+        self.arrays = {}
+        os.makedirs(self.directory, exist_ok=True)
+        self.index = self._load_index()
+
+    def _index_path(self):
+        return os.path.join(self.directory, self.INDEX_FILE)
+
+    def _data_path(self, con_id):
+        return os.path.join(self.directory, f"{con_id}.bars")
+
+    def _load_index(self):
+        path = self._index_path()
+        if not os.path.exists(path):
+            return {}
+        try:
+            with open(path, 'r') as file:
+                return json.load(file)
+        except (OSError, ValueError) as e:
+            logger.error(f"Error loading bar cache index from {path}: {e}. Starting with an empty cache.")
+            return {}
+
+    def _save_index(self):
+        path = self._index_path()
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as file:
+            json.dump(self.index, file)
+        os.replace(tmp_path, path)
+
+    def _open(self, con_id, capacity):
+        path = self._data_path(con_id)
+        size = capacity * self.BAR_DTYPE.itemsize
+        with open(path, 'ab') as file:
+            if file.tell() < size:
+                file.truncate(size)
+        array = np.memmap(path, dtype=self.BAR_DTYPE, mode='r+', shape=(capacity,))
+        self.arrays[con_id] = array
+        return array
+
+    def _array(self, con_id):
+        key = str(con_id)
+        if key in self.arrays:
+            return self.arrays[key]
+        entry = self.index.get(key)
+        if entry is None:
+            return None
+        return self._open(key, entry['capacity'])
+
+    @staticmethod
+    def parse_bar_time(bar_date):
+        # Bars are requested with formatDate=2, so the date field holds epoch seconds
+        return int(str(bar_date).split()[0])
+
+    def last_time(self, con_id):
+        entry = self.index.get(str(con_id))
+        if entry is None or entry['count'] == 0:
+            return None
+        return entry['last_time']
+
+    def get_bars(self, con_id):
+        """
+        Return a read-only view of all stored bars for a conId, oldest first.
+        """
+        with self.lock:
+            array = self._array(con_id)
+            if array is None:
+                return np.empty(0, dtype=self.BAR_DTYPE)
+            view = array[:self.index[str(con_id)]['count']].view(np.ndarray)
+            view.flags.writeable = False
+            return view
+
+    def last_close(self, con_id):
+        bars = self.get_bars(con_id)
+        if len(bars) == 0:
+            return None
+        return float(bars['close'][-1])
+
+    def missing_duration(self, con_id, now=None):
+        """
+        Return the TWS duration string covering the bars missing since the last stored bar,
+        or None if the stored data is recent enough to be used as is.
+        """
+        now = int(now if now is not None else self.clock.time())
+        last = self.last_time(con_id)
+        if last is None:
+            return "1 D"
+        gap = now - last
+        if gap <= self.fresh_seconds:
+            return None
+        if gap >= self.MAX_DURATION_SECONDS:
+            return "1 D"
+        return f"{max(gap + 60, 60)} S"
+
+    def append(self, con_id, bars):
+        """
+        Append bars newer than the last stored bar. Returns the number of bars written.
+        """
+        key = str(con_id)
+        with self.lock:
+            last = self.last_time(key)
+            rows = []
+            for bar in bars:
+                bar_time = self.parse_bar_time(bar.date)
+                if last is not None and bar_time <= last:
+                    continue
+                volume = float('nan') if bar.volume == UNSET_DECIMAL else float(bar.volume)
+                rows.append((bar_time, float(bar.open), float(bar.high), float(bar.low), float(bar.close), volume))
+                last = bar_time
+
+            if not rows:
+                return 0
+
+            entry = self.index.get(key, {'count': 0, 'capacity': 0, 'last_time': None})
+            needed = entry['count'] + len(rows)
+            array = self._array(key)
+            if array is None or needed > entry['capacity']:
+                capacity = max(self.initial_capacity, entry['capacity'])
+                while capacity < needed:
+                    capacity *= 2
+                if array is not None:
+                    array.flush()
+                    del self.arrays[key]
+                array = self._open(key, capacity)
+                entry['capacity'] = capacity
+
+            array[entry['count']:needed] = np.array(rows, dtype=self.BAR_DTYPE)
+            array.flush()
+
+            entry['count'] = needed
+            entry['last_time'] = last
+            self.index[key] = entry
+            self._save_index()
+
+            logger.debug(f"Stored {len(rows)} new bars for conId {key} ({needed} total)")
+            return len(rows)
@@ -2,7 +2,6 @@
 
 import logging
 import threading
-import time
 
 import exchange_calendars as xcals
 import pandas as pd
@@ -14,26 +13,76 @@ from ibapi.client import EClient
 from ibapi.wrapper import EWrapper
 from ibapi.contract import Contract
 from ibapi.order import Order
+from ibapi.order_cancel import OrderCancel
+from ibapi.execution import ExecutionFilter
 from ibapi.common import BarData
+from ibapi.comm import read_fields
+from ibapi.const import NO_VALID_ID, MAX_MSG_LEN
+from ibapi.errors import BAD_LENGTH
+from ibapi.utils import BadMessage
+
+from callback_bus import CallbackBus
+from message_lanes import LaneQueue
+from request_store import RequestStore
+from symbol_resolver import SymbolResolver
+from clock import SYSTEM_CLOCK
 
 logger = logging.getLogger(__name__)
 
 
 class IBApi(EWrapper, EClient):
-    def __init__(self):
+    # Notices after which the request they refer to goes on, e.g. a data farm status (2100-2199),
+    # partially subscribed (10090) or delayed (10167) market data
+    WARNING_CODES = frozenset(range(2100, 2200)) | frozenset([10090, 10167])
+
+    def __init__(self, msg_queue=None, clock=SYSTEM_CLOCK):
         EClient.__init__(self, self)
+        self.msg_queue = msg_queue or LaneQueue()
+        self.bus = CallbackBus()
         self.connected = threading.Event()
         self.nextorderId = None
         self.lock = threading.Lock()
         self.account_summary = {}
         self.positions = {}
-        self.contract_details = {}
-        self.historical_data = {}
+        self.contract_details = RequestStore("contract details", clock=clock)
+        self.historical_data = RequestStore("historical data", max_entries=20, clock=clock)
         self.event = threading.Event()
-        self.last_price = None
         self.symbol_search_results = []
         self.server_time = None
-        self.real_time_data_available = None
+        self.open_orders = {}
+        self.open_orders_event = threading.Event()
+        self.order_statuses = {}
+        self.order_status_handler = None
+        self.connection_lost = threading.Event()
+
+    def run(self):
+        """
+        Message loop that services the priority lanes of the LaneQueue in batches,
+        replacing the one-message-per-poll loop of EClient.run.
+        """
+        try:
+            while self.isConnected() or not self.msg_queue.empty():
+                try:
+                    for text in self.msg_queue.get_batch(timeout=0.2):
+                        if len(text) > MAX_MSG_LEN:
+                            self.error(NO_VALID_ID, BAD_LENGTH.code(), f"{BAD_LENGTH.msg()}:{len(text)}:{text}")
+                            return
+                        try:
+                            self.decoder.interpret(read_fields(text))
+                        except BadMessage:
+                            logger.info("BadMessage")
+                except (KeyboardInterrupt, SystemExit):
+                    logger.info("detected KeyboardInterrupt, SystemExit")
+                    self.keyboardInterrupt()
+                    self.keyboardInterruptHard()
+        finally:
+            self.disconnect()
+
+    def lane_latency_stats(self):
+        return self.msg_queue.latency_stats()
+
+    def message_queue_stats(self):
+        return self.msg_queue.stats()
 
     def nextValidId(self, orderId: int):
         super().nextValidId(orderId)
@@ -43,57 +92,133 @@ class IBApi(EWrapper, EClient):
 
     def error(self, reqId, errorCode, errorString, advancedOrderRejectJson=""):
         if errorCode in [2104, 2106, 2158]:
-            logger.info(f"Connection info: {errorString}")
+            logger.info("Connection info: %s", errorString)
         elif errorCode == 200 and "No security definition has been found" in errorString:
-            logger.warning(f"No security definition found for reqId {reqId}: {errorString}")
+            logger.warning("No security definition found for reqId %s: %s", reqId, errorString)
+            self.fail_request(reqId, errorString)
             self.event.set()
         elif errorCode == 200 and "Invalid exchange" in errorString:
-            logger.warning(f"Invalid exchange for reqId {reqId}: {errorString}")
+            logger.warning("Invalid exchange for reqId %s: %s", reqId, errorString)
+            self.fail_request(reqId, errorString)
             self.event.set()
         elif errorCode == 10168:
-            logger.info(f"Market data farm connection message: {errorString}")
-        elif errorCode == 10167:
-            logger.error(f"Historical Market Data Service error for reqId {reqId}: {errorString}")
-            self.event.set()
+            logger.info("Market data farm connection message: %s", errorString)
+        elif errorCode in self.WARNING_CODES:
+            logger.warning("Warning. Id: %s Code: %s Msg: %s", reqId, errorCode, errorString)
         else:
-            logger.error(f"Error. Id: {reqId} Code: {errorCode} Msg: {errorString}")
+            logger.error("Error. Id: %s Code: %s Msg: %s", reqId, errorCode, errorString)
+            self.fail_request(reqId, errorString)
 
         if advancedOrderRejectJson:
-            logger.error(f"Advanced order reject JSON: {advancedOrderRejectJson}")
+            logger.error("Advanced order reject JSON: %s", advancedOrderRejectJson)
+
+        self.bus.publish('error', reqId, errorCode, errorString, req_id=reqId)
+
+    def fail_request(self, reqId, errorString):
+        self.contract_details.fail(reqId, errorString)
+        self.historical_data.fail(reqId, errorString)
+
+    def request_store_stats(self):
+        return [self.contract_details.stats(), self.historical_data.stats()]
 
     def accountSummary(self, reqId, account, tag, value, currency):
         if tag == "TotalCashValue":
             self.account_summary["cash"] = float(value)
+            self.account_summary["currency"] = currency
         elif tag == "NetLiquidation":
             self.account_summary["net_liquidation"] = float(value)
 
     def position(self, account, contract, position, avgCost):
         self.positions[contract.symbol] = {
             "shares": position,
-            "avgCost": avgCost
+            "avgCost": avgCost,
+            "currency": contract.currency
         }
+        self.bus.publish('position', account, contract, position, avgCost, con_id=contract.conId)
+
+    def updatePortfolio(self, contract, position, marketPrice, marketValue, averageCost, unrealizedPNL, realizedPNL,
+                        accountName):
+        self.bus.publish('updatePortfolio', contract, position, marketPrice, marketValue, averageCost, unrealizedPNL,
+                         realizedPNL, accountName, con_id=contract.conId)
+
+    def pnlSingle(self, reqId, pos, dailyPnL, unrealizedPnL, realizedPnL, value):
+        self.bus.publish('pnlSingle', reqId, pos, dailyPnL, unrealizedPnL, realizedPnL, value, req_id=reqId)
 
     def contractDetails(self, reqId, contractDetails):
-        if reqId not in self.contract_details:
-            self.contract_details[reqId] = []
-        self.contract_details[reqId].append(contractDetails)
+        self.contract_details.add(reqId, contractDetails)
+        self.bus.publish('contractDetails', reqId, contractDetails, req_id=reqId)
 
     def contractDetailsEnd(self, reqId):
-        self.event.set()
+        self.contract_details.complete(reqId)
+        self.bus.publish('contractDetailsEnd', reqId, req_id=reqId)
 
     def historicalData(self, reqId: int, bar: BarData):
-        if reqId not in self.historical_data:
-            self.historical_data[reqId] = []
-        self.historical_data[reqId].append(bar)
+        self.historical_data.add(reqId, bar)
 
     def historicalDataEnd(self, reqId: int, start: str, end: str):
-        self.event.set()
+        self.historical_data.complete(reqId)
+        self.bus.publish('historicalDataEnd', reqId, start, end, req_id=reqId)
 
     def tickPrice(self, reqId, tickType, price, attrib):
-        logger.info(f"TickPrice. ReqId: {reqId}, TickType: {tickType}, Price: {price}")
-        if tickType == 4:  # Last price
-            self.last_price = price
-        self.event.set()
+        logger.debug("TickPrice. ReqId: %s, TickType: %s, Price: %s", reqId, tickType, price)
+        self.bus.publish('tickPrice', reqId, tickType, price, attrib, req_id=reqId)
+
+    def tickSize(self, reqId, tickType, size):
+        self.bus.publish('tickSize', reqId, tickType, size, req_id=reqId)
+
+    def tickByTickAllLast(self, reqId, tickType, time, price, size, tickAttribLast, exchange, specialConditions):
+        self.bus.publish('tickByTickAllLast', reqId, tickType, time, price, size, tickAttribLast, exchange,
+                         specialConditions, req_id=reqId)
+
+    def tickByTickBidAsk(self, reqId, time, bidPrice, askPrice, bidSize, askSize, tickAttribBidAsk):
+        self.bus.publish('tickByTickBidAsk', reqId, time, bidPrice, askPrice, bidSize, askSize, tickAttribBidAsk,
+                         req_id=reqId)
+
+    def tickByTickMidPoint(self, reqId, time, midPoint):
+        self.bus.publish('tickByTickMidPoint', reqId, time, midPoint, req_id=reqId)
+
+    def tickSnapshotEnd(self, reqId):
+        self.bus.publish('tickSnapshotEnd', reqId, req_id=reqId)
+
+    def marketDataType(self, reqId, marketDataType):
+        self.bus.publish('marketDataType', reqId, marketDataType, req_id=reqId)
+
+    def openOrder(self, orderId, contract, order, orderState):
+        if order.whatIf:
+            # Pre-trade check, not a working order
+            self.bus.publish('openOrder', orderId, contract, order, orderState, req_id=orderId)
+            return
+        self.open_orders[orderId] = {
+            "symbol": contract.symbol,
+            "action": order.action,
+            "quantity": float(order.totalQuantity),
+            "orderType": order.orderType,
+            "status": orderState.status
+        }
+
+    def openOrderEnd(self):
+        self.open_orders_event.set()
+
+    def orderStatus(self, orderId, status, filled, remaining, avgFillPrice, permId, parentId, lastFillPrice,
+                    clientId, whyHeld, mktCapPrice):
+        self.order_statuses[orderId] = {
+            "status": status,
+            "filled": float(filled),
+            "remaining": float(remaining),
+            "avgFillPrice": avgFillPrice
+        }
+        if self.order_status_handler:
+            self.order_status_handler(orderId, self.order_statuses[orderId])
+        self.bus.publish('orderStatus', orderId, self.order_statuses[orderId])
+
+    def execDetails(self, reqId, contract, execution):
+        self.bus.publish('execDetails', reqId, contract, execution, req_id=reqId)
+
+    def execDetailsEnd(self, reqId):
+        self.bus.publish('execDetailsEnd', reqId, req_id=reqId)
+
+    def commissionReport(self, commissionReport):
+        self.bus.publish('commissionReport', commissionReport)
 
     def symbolSamples(self, reqId: int, contractDescriptions: list):
         for contract in contractDescriptions:
@@ -102,13 +227,27 @@ class IBApi(EWrapper, EClient):
                 "exchange": contract.contract.exchange,
                 "currency": contract.contract.currency
             })
-            logger.info(
-                f"Symbol: {contract.contract.symbol}, Exchange: {contract.contract.exchange}, Currency: {contract.contract.currency}")
+            logger.info("Symbol: %s, Exchange: %s, Currency: %s",
+                        contract.contract.symbol, contract.contract.exchange, contract.contract.currency)
+        self.bus.publish('symbolSamples', reqId, contractDescriptions, req_id=reqId)
         self.event.set()
 
     def currentTime(self, time):
         self.server_time = time
+        self.bus.publish('currentTime', time)
+
+    def connectionClosed(self):
+        logger.warning("Connection to TWS closed")
+        self.wake_waiters()
+
+    def wake_waiters(self):
+        # Wake every pending request so it fails right away instead of waiting for its timeout
+        self.connection_lost.set()
+        self.contract_details.fail_all("Connection lost")
+        self.historical_data.fail_all("Connection lost")
         self.event.set()
+        self.open_orders_event.set()
+        self.bus.broadcast('connectionClosed')
 
 
 class IBBroker:
@@ -194,25 +333,184 @@ class IBBroker:
         "CC": ("PAXOS", "USD")
     }
 
-    def __init__(self, host, port, clientId, api_version):
+    # Market data errors after which ticks still arrive (partial subscription, delayed data)
+    MARKET_DATA_WARNINGS = (10090, 10167)
+    # Request ids start far above any order id TWS hands out, so an error for order N is never
+    # taken for a failure of request N
+    REQ_ID_BASE = 1_000_000_000
+    # Seconds a contract whose availability probe timed out goes straight to historical data
+    PROBE_TIMEOUT_TTL = 300
+
+    def __init__(self, host, port, clientId, api_version, bar_cache=None, journal=None, executions=None,
+                 price_table=None, price_table_max_age=60, entitlements=None, clock=SYSTEM_CLOCK, msg_queue=None):
         self.host = host
         self.port = port
         self.clientId = clientId
         self.api_version = api_version
-        self.ib = IBApi()
+        self.ib = IBApi(msg_queue, clock)
+        self.clock = clock
         self.ib_thread = None
-        self.next_req_id = 1
+        self.next_req_id = self.REQ_ID_BASE
+        self.req_id_lock = threading.Lock()  # Ids are also allocated from the dispatch thread
         self.market_calendars = {}
+        self.bar_cache = bar_cache
+        self.journal = journal
+        self.resolved_contracts = {}
+        self.supervisor = None
+        self.market_data_subscriptions = {}
+        self.positions_subscribed = False
+        self.latest_prices = {}
+        self.price_streams = {}
+        self.account_updates_account = None
+        self.pnl_subscriptions = {}
+        self.tick_by_tick_subscriptions = {}
+        if self.journal:
+            self.ib.order_status_handler = self.handle_order_status
+        self.executions = executions
+        # A writable table is fed from this broker's streams; a read-only one replaces them
+        self.price_table = price_table
+        self.price_table_max_age = price_table_max_age
+        self.shared_streams = set()
+        self.entitlements = entitlements
+        self.resolver = SymbolResolver(self)
+        self.market_data_requests = {}
+        self.probe_timeouts = {}
+        if self.entitlements:
+            self.ib.bus.subscribe('marketDataType', self.learn_market_data_type)
+            self.ib.bus.subscribe('error', self.learn_market_data_error)
+        if self.executions:
+            self.ib.bus.subscribe('orderStatus', self.executions.on_order_status)
+            self.ib.bus.subscribe('execDetails', self.executions.on_exec_details)
+            self.ib.bus.subscribe('commissionReport', self.executions.on_commission_report)
 
     def connect(self):
+        self.ib.connection_lost.clear()
+        self.ib.connected.clear()
         self.ib.connect(self.host, self.port, self.clientId)
+        if not self.ib.isConnected():
+            raise ConnectionError(f"Could not connect to Interactive Brokers at {self.host}:{self.port}")
         self.ib_thread = threading.Thread(target=self.run_loop, daemon=True)
         self.ib_thread.start()
         if not self.ib.connected.wait(timeout=15):
             raise TimeoutError("Failed to connect to Interactive Brokers")
+        # Live data where entitled, delayed data otherwise
+        self.ib.reqMarketDataType(4)
         logger.info("Successfully connected to Interactive Brokers")
 
+    def reconnect(self):
+        if self.ib.isConnected():
+            self.ib.disconnect()
+        if self.ib_thread:
+            self.ib_thread.join(timeout=5)
+        self.connect()
+
+    def fail_pending_requests(self):
+        self.ib.wake_waiters()
+
+    def resubscribe(self):
+        for req_id, contract in self.market_data_subscriptions.items():
+            logger.info(f"Re-subscribing market data for {contract.symbol} (reqId {req_id})")
+            self.request_market_data(req_id, contract)
+        if self.positions_subscribed:
+            self.ib.reqPositions()
+        if self.account_updates_account:
+            self.ib.reqAccountUpdates(True, self.account_updates_account)
+        for req_id, con_id in self.pnl_subscriptions.items():
+            self.ib.reqPnLSingle(req_id, self.account_updates_account or "", "", con_id)
+        for req_id, (contract, tick_type) in self.tick_by_tick_subscriptions.items():
+            self.ib.reqTickByTickData(req_id, contract, tick_type, 0, False)
+        if self.executions:
+            # Replay today's executions so fills missed while disconnected still get recorded
+            req_id = self.allocate_req_id()
+            self.ib.reqExecutions(req_id, ExecutionFilter())
+
+    def allocate_req_id(self):
+        with self.req_id_lock:
+            req_id = self.next_req_id
+            self.next_req_id += 1
+            return req_id
+
+    def subscribe_market_data(self, contract, on_tick_price=None):
+        req_id = self.allocate_req_id()
+        if on_tick_price:
+            self.ib.bus.subscribe('tickPrice', on_tick_price, req_id=req_id)
+        self.market_data_subscriptions[req_id] = contract
+        self.request_market_data(req_id, contract)
+        return req_id
+
+    def subscribe_account_updates(self, account):
+        self.account_updates_account = account
+        self.ib.reqAccountUpdates(True, account)
+
+    def unsubscribe_account_updates(self):
+        if self.account_updates_account:
+            self.ib.reqAccountUpdates(False, self.account_updates_account)
+            self.account_updates_account = None
+
+    def subscribe_pnl_single(self, account, con_id, on_pnl_single):
+        req_id = self.allocate_req_id()
+        self.ib.bus.subscribe('pnlSingle', on_pnl_single, req_id=req_id)
+        self.pnl_subscriptions[req_id] = con_id
+        self.ib.reqPnLSingle(req_id, account, "", con_id)
+        return req_id
+
+    def cancel_pnl_single(self, req_id):
+        if self.pnl_subscriptions.pop(req_id, None) is not None:
+            self.ib.cancelPnLSingle(req_id)
+        self.ib.bus.release(req_id)
+
+    def subscribe_tick_by_tick(self, contract, tick_type, handlers):
+        """
+        Stream tick-by-tick data ('Last', 'AllLast', 'BidAsk' or 'MidPoint') into the given bus
+        handlers; the subscription is restored after a reconnect.
+        """
+        req_id = self.allocate_req_id()
+        for msg_type, handler in handlers.items():
+            self.ib.bus.subscribe(msg_type, handler, req_id=req_id)
+        self.tick_by_tick_subscriptions[req_id] = (contract, tick_type)
+        self.ib.reqTickByTickData(req_id, contract, tick_type, 0, False)
+        return req_id
+
+    def cancel_tick_by_tick(self, req_id):
+        if self.tick_by_tick_subscriptions.pop(req_id, None) is not None:
+            self.ib.cancelTickByTickData(req_id)
+        self.ib.bus.release(req_id)
+
+    def cancel_market_data(self, req_id):
+        if self.market_data_subscriptions.pop(req_id, None) is not None:
+            self.ib.cancelMktData(req_id)
+        self.release_market_data(req_id)
+
+    def request_market_data(self, req_id, contract, snapshot=False):
+        self.market_data_requests[req_id] = contract
+        self.ib.reqMktData(req_id, contract, "", snapshot, False, [])
+
+    def release_market_data(self, req_id):
+        self.market_data_requests.pop(req_id, None)
+        self.ib.bus.release(req_id)
+
+    def learn_market_data_type(self, reqId, market_data_type):
+        contract = self.market_data_requests.get(reqId)
+        if contract is not None:
+            self.entitlements.on_market_data_type(contract, market_data_type)
+
+    def learn_market_data_error(self, reqId, errorCode, errorString):
+        contract = self.market_data_requests.get(reqId)
+        if contract is not None:
+            self.entitlements.on_error(contract, errorCode)
+
+    def wait_for_event(self, event, timeout):
+        """
+        Wait for a response event. Raises ConnectionError if the connection dropped while waiting.
+        """
+        received = event.wait(timeout=timeout)
+        if self.ib.connection_lost.is_set():
+            raise ConnectionError("Connection to Interactive Brokers lost while waiting for a response")
+        return received
+
     def disconnect(self):
+        if self.supervisor:
+            self.supervisor.stop()
         if self.ib.isConnected():
             self.ib.disconnect()
         if self.ib_thread:
@@ -227,20 +525,30 @@ class IBBroker:
         finally:
             self.ib.connected.clear()
 
+    def handle_order_status(self, order_id, status):
+        # Runs on the dispatch thread, so the fsync is left to the journal's sync thread
+        self.journal.record('order_status', dict(status, orderId=order_id), sync=False)
+
     def is_connected(self):
         return self.ib.isConnected()
 
-    def ensure_connection(self):
-        if not self.is_connected():
-            logger.warning("IB connection lost. Attempting to reconnect...")
-            self.connect()
+    def ensure_connection(self, timeout=60):
+        if self.is_connected():
+            return
+        if self.supervisor:
+            # The supervisor owns reconnecting; wait for it instead of racing it
+            if not self.supervisor.wait_until_connected(timeout=timeout):
+                raise ConnectionError("Interactive Brokers connection not restored in time")
+            return
+        logger.warning("IB connection lost. Attempting to reconnect...")
+        self.connect()
 
     def is_market_open(self, exchange):
         if exchange not in self.market_calendars:
             calendar_name = self.get_calendar_name(exchange)
             self.market_calendars[exchange] = xcals.get_calendar(calendar_name)
 
-        now = pd.Timestamp.now(tz='UTC')
+        now = pd.Timestamp(self.clock.now())
         return self.market_calendars[exchange].is_open_on_minute(now)
 
     def get_next_market_open(self, exchange):
@@ -248,7 +556,7 @@ class IBBroker:
             calendar_name = self.get_calendar_name(exchange)
             self.market_calendars[exchange] = xcals.get_calendar(calendar_name)
 
-        now = pd.Timestamp.now(tz='UTC')
+        now = pd.Timestamp(self.clock.now())
         next_open = self.market_calendars[exchange].next_open(now)
         return next_open.to_pydatetime()
 
@@ -275,40 +583,145 @@ class IBBroker:
             contract.isin = isin
         return contract
 
-    def get_market_price(self, isin, symbol, exchange, name):
-        self.ensure_connection()
+    def get_currency(self, exchange):
+        return self.EXCHANGE_MAPPING.get(exchange, ("SMART", "USD"))[1]
+
+    def resolve_contract(self, req_id, isin, symbol, exchange, name):
+        if symbol in self.resolved_contracts:
+            return self.resolved_contracts[symbol]
+
         contract = self.create_contract(symbol, "STK", exchange, isin=isin)
 
         logger.info(
             f"Requesting data for: ISIN={isin}, Symbol={symbol}, Exchange={contract.exchange}, Currency={contract.currency}, Name={name}")
 
-        req_id = self.next_req_id
-        self.next_req_id += 1
+        result = self.ib.contract_details.open(req_id)
+        self.ib.reqContractDetails(req_id, contract)
+
+        details = None
+        if self.wait_for_event(result.event, 10):
+            try:
+                details = self.ib.contract_details.take(req_id)
+            except ValueError as e:
+                logger.warning(f"Contract lookup failed for {symbol}: {e}")
+        else:
+            self.ib.contract_details.release(req_id)
+            logger.warning(f"Timeout waiting for contract details for ISIN: {isin}, Symbol: {symbol}, "
+                           f"Exchange: {exchange}, Name: {name}")
 
-        self.ib.contract_details.pop(req_id, None)
-        self.ib.historical_data.pop(req_id, None)
+        if details:
+            resolved = details[0].contract
+        else:
+            logger.info(f"Trying fallback lookups for {symbol} ({name})")
+            resolved = self.resolver.resolve(isin, symbol, exchange, name)
+        logger.info(f"Found contract: {resolved}")
+        self.resolved_contracts[symbol] = resolved
+        if self.journal:
+            self.journal.record('contract', self.contract_to_dict(resolved))
+        if self.price_table and self.price_table.writable:
+            self.price_table.publish_contract(symbol, resolved)
+        return resolved
+
+    @staticmethod
+    def contract_to_dict(contract):
+        return {
+            'conId': contract.conId,
+            'symbol': contract.symbol,
+            'secType': contract.secType,
+            'exchange': contract.exchange,
+            'primaryExchange': contract.primaryExchange,
+            'currency': contract.currency,
+            'localSymbol': contract.localSymbol
+        }
 
-        self.ib.event.clear()
-        self.ib.reqContractDetails(req_id, contract)
+    @staticmethod
+    def contract_from_dict(data):
+        contract = Contract()
+        for field, value in data.items():
+            setattr(contract, field, value)
+        return contract
+
+    def restore_contracts(self, contracts):
+        for symbol, data in contracts.items():
+            self.resolved_contracts[symbol] = self.contract_from_dict(data)
+        logger.info(f"Restored {len(contracts)} resolved contracts")
+
+    def get_contract(self, isin, symbol, exchange, name):
+        if self.price_table and not self.price_table.writable:
+            shared = self.price_table.get_contract(symbol=symbol)
+            if shared:
+                return self.contract_from_dict(shared)
+        self.ensure_connection()
+        req_id = self.allocate_req_id()
+        return self.resolve_contract(req_id, isin, symbol, exchange, name)
+
+    def stream_price(self, symbol, contract):
+        """
+        Keep a market data stream open for a contract; the latest price is kept in latest_prices.
+        """
+        if symbol in self.price_streams or symbol in self.shared_streams:
+            return
+        if self.price_table and not self.price_table.writable and self.price_table.get_contract(symbol=symbol):
+            # The feeder process already streams this symbol into the shared table
+            self.shared_streams.add(symbol)
+            return
+
+        def on_tick_price(reqId, tickType, price, attrib):
+            if price > 0 and tickType in (4, 68, 9, 75):  # Last, delayed last, close, delayed close
+                # A close price never overwrites a last price
+                if tickType in (4, 68) or symbol not in self.latest_prices:
+                    self.latest_prices[symbol] = price
+                    if self.price_table and self.price_table.writable:
+                        self.price_table.publish_price(symbol, price)
+
+        self.price_streams[symbol] = self.subscribe_market_data(contract, on_tick_price)
+
+    def request_shared_prices(self, stocks):
+        """
+        Ask the price feeder to stream these stocks into the shared table too, so a tracker
+        following another index than the feeder is served from it as well.
+        """
+        if self.price_table and not self.price_table.writable:
+            try:
+                self.price_table.request_symbols(f"client{self.clientId}", stocks)
+            except OSError as e:
+                logger.warning(f"Could not request shared prices: {e}")
+
+    def latest_price(self, symbol):
+        """
+        Return the latest streamed price for a symbol from this broker's streams or the shared table.
+        """
+        price = self.latest_prices.get(symbol)
+        if price is None and symbol in self.shared_streams:
+            price = self.price_table.get_price(symbol, max_age=self.price_table_max_age)
+        return price
+
+    def stop_price_stream(self, symbol):
+        self.shared_streams.discard(symbol)
+        req_id = self.price_streams.pop(symbol, None)
+        if req_id is not None:
+            self.cancel_market_data(req_id)
+            self.latest_prices.pop(symbol, None)
 
-        if not self.ib.event.wait(timeout=10):
-            raise TimeoutError(
-                f"Timeout waiting for contract details for ISIN: {isin}, Symbol: {symbol}, Exchange: {exchange}, Name: {name}")
+    def get_market_price(self, isin, symbol, exchange, name):
+        if self.price_table and not self.price_table.writable:
+            price = self.price_table.get_price(symbol, max_age=self.price_table_max_age)
+            if price is not None:
+                return price
+
+        self.ensure_connection()
 
-        if req_id not in self.ib.contract_details or not self.ib.contract_details[req_id]:
-            raise ValueError(
-                f"Failed to get contract details for ISIN: {isin}, Symbol: {symbol}, Exchange: {exchange}, Name: {name}")
+        req_id = self.allocate_req_id()
 
-        contract_details = self.ib.contract_details[req_id][0]
-        logger.info(f"Found contract: {contract_details.contract}")
+        contract = self.resolve_contract(req_id, isin, symbol, exchange, name)
 
         # Check for real-time data availability
-        real_time_available = self.check_real_time_data_availability(contract_details.contract)
+        real_time_available = self.check_real_time_data_availability(contract)
 
         if real_time_available:
             logger.info(f"Real-time data available for {symbol}")
             try:
-                return self.get_market_data_price(contract_details.contract)
+                return self.get_market_data_price(contract)
             except Exception as e:
                 logger.warning(f"Failed to get real-time data for {symbol}: {e}. Falling back to historical data.")
         else:
@@ -316,40 +729,156 @@ class IBBroker:
 
         # If real-time data is not available or failed, use historical data
         try:
-            self.ib.event.clear()
-            self.ib.reqHistoricalData(req_id, contract_details.contract, "", "1 D", "1 min", "TRADES", 1, 1, False, [])
-
-            if not self.ib.event.wait(timeout=10):
-                raise TimeoutError(f"Timeout waiting for historical data for {symbol}")
-
-            if req_id not in self.ib.historical_data or not self.ib.historical_data[req_id]:
-                raise ValueError(f"No historical data received for {symbol}")
-
-            latest_bar = self.ib.historical_data[req_id][-1]
-            return float(latest_bar.close)
+            return self.get_historical_price(req_id, contract)
         except Exception as e:
             logger.error(f"Failed to get historical data for {symbol}: {e}")
             raise
 
+    def get_historical_price(self, req_id, contract):
+        """
+        Get the last 1-minute close for a resolved contract. With a bar cache only the bars
+        missing since the last stored bar are requested, or none if the stored data is recent;
+        if none arrived, the stored close is used.
+        """
+        if self.bar_cache is None:
+            bars = self.request_historical_bars(req_id, contract, "1 D", 1)
+            return float(bars[-1].close)
+
+        duration = self.bar_cache.missing_duration(contract.conId)
+        if duration is not None:
+            try:
+                bars = self.request_historical_bars(req_id, contract, duration, 2)
+            except ValueError as e:
+                # An empty tail only means nothing traded since the last stored bar
+                if self.bar_cache.last_close(contract.conId) is None:
+                    raise
+                logger.info(f"No new bars for {contract.symbol} ({e}), using the cached close")
+            else:
+                self.bar_cache.append(contract.conId, bars)
+        else:
+            logger.info(f"Using cached bars for {contract.symbol}")
+
+        price = self.bar_cache.last_close(contract.conId)
+        if price is None:
+            raise ValueError(f"No historical data stored for {contract.symbol}")
+        return price
+
+    def request_historical_bars(self, req_id, contract, duration, format_date):
+        result = self.ib.historical_data.open(req_id)
+        self.ib.reqHistoricalData(req_id, contract, "", duration, "1 min", "TRADES", 1, format_date, False, [])
+
+        if not self.wait_for_event(result.event, 10):
+            self.ib.historical_data.release(req_id)
+            raise TimeoutError(f"Timeout waiting for historical data for {contract.symbol}")
+
+        bars = self.ib.historical_data.take(req_id)
+        if not bars:
+            raise ValueError(f"No historical data received for {contract.symbol}")
+        return bars
+
+    def request_callbacks(self, req_id, handlers):
+        """
+        Register per-request handlers on the callback bus. Returns an event that is set when
+        the connection drops, so waiters can fail fast; release the reqId when done.
+        """
+        done = threading.Event()
+        for msg_type, handler in handlers.items():
+            self.ib.bus.subscribe(msg_type, handler, req_id=req_id)
+        self.ib.bus.subscribe('connectionClosed', done.set, req_id=req_id)
+        return done
+
     def get_market_data_price(self, contract):
-        req_id = self.next_req_id
-        self.next_req_id += 1
+        req_id = self.allocate_req_id()
+        prices = {}
 
-        self.ib.event.clear()
-        self.ib.reqMktData(req_id, contract, "", False, False, [])
+        def on_tick_price(reqId, tickType, price, attrib):
+            if price > 0:
+                prices[tickType] = price
+            if tickType in (4, 68):  # Last price, delayed last price
+                done.set()
 
-        if not self.ib.event.wait(timeout=5):
-            raise TimeoutError(f"Timeout waiting for market data for {contract.symbol}")
+        def on_error(reqId, errorCode, errorString):
+            if errorCode not in self.MARKET_DATA_WARNINGS:
+                done.set()
 
-        self.ib.cancelMktData(req_id)
+        done = self.request_callbacks(req_id, {'tickPrice': on_tick_price, 'error': on_error})
+        try:
+            self.request_market_data(req_id, contract)
+            self.wait_for_event(done, 5)
+        finally:
+            self.ib.cancelMktData(req_id)
+            self.release_market_data(req_id)
+
+        for tick_type in (4, 68, 9, 75):  # Last, delayed last, close, delayed close
+            if tick_type in prices:
+                return prices[tick_type]
+        raise ValueError(f"Failed to get market data for {contract.symbol}")
+
+    def get_snapshot_prices(self, contracts, timeout=5):
+        """
+        Request snapshot quotes for all contracts at once and wait for them together.
+
+        :return: List with the mid (or last, or close) price per contract, None where no quote arrived.
+        """
+        if not contracts:
+            return []
+        self.ensure_connection()
+        quotes = [{} for _ in contracts]
+        pending = set()
+        all_done = threading.Event()
+        lock = threading.Lock()
+
+        def finish(req_id):
+            with lock:
+                pending.discard(req_id)
+                if not pending:
+                    all_done.set()
+
+        def on_error(reqId, errorCode, errorString):
+            if errorCode not in self.MARKET_DATA_WARNINGS:
+                finish(reqId)
+
+        req_ids = []
+        for quote in quotes:
+            req_id = self.allocate_req_id()
+            req_ids.append(req_id)
+            pending.add(req_id)
+
+            def on_tick_price(reqId, tickType, price, attrib, quote=quote):
+                if price > 0:
+                    quote[tickType] = price
+
+            self.ib.bus.subscribe('tickPrice', on_tick_price, req_id=req_id)
+            self.ib.bus.subscribe('tickSnapshotEnd', finish, req_id=req_id)
+            self.ib.bus.subscribe('error', on_error, req_id=req_id)
+            self.ib.bus.subscribe('connectionClosed', all_done.set, req_id=req_id)
+
+        for req_id, contract in zip(req_ids, contracts):
+            self.request_market_data(req_id, contract, snapshot=True)
 
-        if self.ib.last_price is not None:
-            return self.ib.last_price
-        else:
-            raise ValueError(f"Failed to get market data for {contract.symbol}")
+        try:
+            if not self.wait_for_event(all_done, timeout):
+                logger.warning(f"Timeout waiting for {len(pending)} of {len(contracts)} snapshot quotes")
+        finally:
+            for req_id in req_ids:
+                self.release_market_data(req_id)
+
+        prices = []
+        for quote in quotes:
+            bid = quote.get(1, quote.get(66))
+            ask = quote.get(2, quote.get(67))
+            if bid and ask:
+                prices.append((bid + ask) / 2)
+            else:
+                prices.append(quote.get(4, quote.get(68, quote.get(9, quote.get(75)))))
+        return prices
 
     def place_order(self, symbol, secType, exchange, action, quantity, order_type="MKT", limit_price=None,
-                    stop_price=None, tif="DAY"):
+                    stop_price=None, tif="DAY", intended_price=None, market=None):
+        """
+        Place an order routed to `exchange`. `market` is the Tradepost exchange of the symbol,
+        recorded with the execution instead of the routing destination.
+        """
         try:
             self.ensure_connection()
             contract = self.create_contract(symbol, secType, exchange)
@@ -368,50 +897,130 @@ class IBBroker:
                 order.lmtPrice = limit_price
                 order.auxPrice = stop_price
 
-            with self.ib.lock:
-                if self.ib.nextorderId is None:
-                    logger.error("nextorderId is None. Requesting new valid ID.")
-                    self.ib.reqIds(-1)
-                    if not self.ib.connected.wait(timeout=10):
-                        raise TimeoutError("Timeout waiting for nextorderId")
-                orderId = self.ib.nextorderId
-                self.ib.nextorderId += 1
-
-            logger.info(
-                f"Placing order: Symbol={symbol}, Action={action}, Quantity={quantity}, OrderType={order_type}, OrderId={orderId}")
+            orderId = self.reserve_order_id()
+
+            logger.info("Placing order: Symbol=%s, Action=%s, Quantity=%s, OrderType=%s, OrderId=%s",
+                        symbol, action, quantity, order_type, orderId)
+            if self.journal:
+                self.journal.record('order', {
+                    'orderId': orderId,
+                    'symbol': symbol,
+                    'action': action,
+                    'quantity': quantity,
+                    'orderType': order_type,
+                    'limitPrice': limit_price,
+                    'status': 'PendingSubmit'  # Until TWS reports the order, it may never have arrived
+                })
+            if self.executions:
+                self.executions.order_submitted(
+                    orderId, symbol, market or exchange, action, quantity, intended_price=intended_price,
+                    limit_price=limit_price if order_type in ("LMT", "STP LMT") else None)
             self.ib.placeOrder(orderId, contract, order)
-            logger.info(f"Order placed: {symbol} {action} {quantity}")
+            logger.info("Order placed: %s %s %s", symbol, action, quantity)
 
             return orderId
         except Exception as e:
-            logger.error(f"Error placing order: {e}", exc_info=True)
+            logger.error("Error placing order: %s", e, exc_info=True)
             return None
 
+    def reserve_order_id(self):
+        with self.ib.lock:
+            if self.ib.nextorderId is None:
+                logger.error("nextorderId is None. Requesting new valid ID.")
+                self.ib.reqIds(-1)
+                if not self.ib.connected.wait(timeout=10):
+                    raise TimeoutError("Timeout waiting for nextorderId")
+            order_id = self.ib.nextorderId
+            self.ib.nextorderId += 1
+            return order_id
+
     def get_account_summary(self):
         self.ensure_connection()
         self.ib.account_summary = {}
         self.ib.reqAccountSummary(1, "All", "TotalCashValue,NetLiquidation")
-        time.sleep(1)
+        self.clock.sleep(1)
         return self.ib.account_summary
 
     def get_positions(self):
         self.ensure_connection()
         self.ib.positions = {}
         self.ib.reqPositions()
-        time.sleep(1)
+        self.positions_subscribed = True
+        self.clock.sleep(1)
         return self.ib.positions
 
+    def get_open_orders(self):
+        self.ensure_connection()
+        self.ib.open_orders = {}
+        self.ib.open_orders_event.clear()
+        self.ib.reqOpenOrders()
+        if not self.wait_for_event(self.ib.open_orders_event, 10):
+            raise TimeoutError("Timeout waiting for open orders")
+        return self.ib.open_orders
+
+    def get_executed_shares(self, timeout=10):
+        """
+        Return {orderId: executed shares} of this client's executions that TWS still reports
+        (today's), e.g. to tell filled orders from cancelled ones after a restart.
+        """
+        self.ensure_connection()
+        req_id = self.allocate_req_id()
+        executions = {}
+
+        def on_exec_details(reqId, contract, execution):
+            executions[execution.execId] = (execution.orderId, float(execution.shares))
+
+        def on_exec_details_end(reqId):
+            done.set()
+
+        done = self.request_callbacks(req_id, {'execDetails': on_exec_details, 'execDetailsEnd': on_exec_details_end})
+        execution_filter = ExecutionFilter()
+        execution_filter.clientId = self.clientId
+        try:
+            self.ib.reqExecutions(req_id, execution_filter)
+            if not self.wait_for_event(done, timeout):
+                raise TimeoutError("Timeout waiting for executions")
+        finally:
+            self.ib.bus.release(req_id)
+
+        executed = {}
+        for order_id, shares in executions.values():
+            executed[order_id] = executed.get(order_id, 0.0) + shares
+        return executed
+
+    def cancel_order(self, order_id):
+        self.ib.cancelOrder(order_id, OrderCancel())
+
     def cancel_all_orders(self):
         self.ensure_connection()
         self.ib.reqGlobalCancel()
 
-    def get_server_time(self):
+    def get_server_time(self, timeout=10):
         self.ensure_connection()
-        self.ib.event.clear()
-        self.ib.reqCurrentTime()
-        if not self.ib.event.wait(timeout=10):
-            raise TimeoutError("Timeout waiting for server time")
-        return self.ib.server_time
+        return self.ping(timeout)
+
+    def ping(self, timeout=10):
+        """
+        Request the server time. Every call waits on its own event, so the supervisor's heartbeat
+        and get_server_time never consume or clear each other's response.
+        """
+        req_id = self.allocate_req_id()
+        received = []
+
+        def on_current_time(time):
+            received.append(time)
+            done.set()
+
+        done = self.request_callbacks(req_id, {})
+        subscription = self.ib.bus.subscribe('currentTime', on_current_time)
+        try:
+            self.ib.reqCurrentTime()
+            if not self.wait_for_event(done, timeout):
+                raise TimeoutError("Timeout waiting for server time")
+        finally:
+            self.ib.bus.unsubscribe(subscription)
+            self.ib.bus.release(req_id)
+        return received[0]
 
     def place_bracket_order(self, symbol, secType, exchange, action, quantity, entry_price, take_profit_price,
                             stop_loss_price):
@@ -496,7 +1105,7 @@ class IBBroker:
         try:
             self.ensure_connection()
             oca_orders = []
-            oca_group = f"OCA_{int(time.time())}"
+            oca_group = f"OCA_{int(self.clock.time())}"
 
             for order_info in orders:
                 contract = self.create_contract(order_info['symbol'], order_info['secType'], order_info['exchange'])
@@ -536,24 +1145,48 @@ class IBBroker:
 
 
     def check_real_time_data_availability(self, contract):
-        req_id = self.next_req_id
-        self.next_req_id += 1
-        self.ib.real_time_data_available = None
-        self.ib.event.clear()
-
-        def handle_market_data_type(req_id, market_data_type):
-            self.ib.real_time_data_available = (market_data_type == 1)  # 1 for real-time, 2 for frozen
-            self.ib.event.set()
-
-        self.ib.reqMarketDataType(4)  # Request delayed data
-        self.ib.reqMktData(req_id, contract, "", False, False, [])
-
-        # Set up the callback
-        self.ib.marketDataTypeHandler = handle_market_data_type
-
-        if not self.ib.event.wait(timeout=5):
-            logger.warning(f"Timeout checking real-time data availability for {contract.symbol}")
+        """
+        Return whether live data is available for a contract. A known entitlement is answered
+        from the registry; only unknown contracts are probed with a throwaway reqMktData. A probe
+        that timed out is not repeated for PROBE_TIMEOUT_TTL seconds; the contract is treated as
+        historical-only meanwhile.
+        """
+        if self.entitlements:
+            state = self.entitlements.lookup(contract)
+            if state is not None:
+                return state == self.entitlements.LIVE
+        timed_out = self.probe_timeouts.get(contract.conId)
+        if timed_out is not None:
+            if self.clock.monotonic() - timed_out < self.PROBE_TIMEOUT_TTL:
+                return False
+            del self.probe_timeouts[contract.conId]
+
+        req_id = self.allocate_req_id()
+        result = {}
+
+        def on_market_data_type(reqId, market_data_type):
+            result['type'] = market_data_type
+            done.set()
+
+        def on_error(reqId, errorCode, errorString):
+            result['error'] = errorString
+            done.set()
+
+        done = self.request_callbacks(req_id, {'marketDataType': on_market_data_type, 'error': on_error})
+        try:
+            self.request_market_data(req_id, contract)
+            received = self.wait_for_event(done, 5)
+        finally:
+            self.ib.cancelMktData(req_id)
+            self.release_market_data(req_id)
+
+        if not received:
+            # Says nothing about the entitlement, so only a short-lived marker is kept
+            logger.warning(f"Timeout checking real-time data availability for {contract.symbol}, "
+                           f"using historical data for {self.PROBE_TIMEOUT_TTL}s")
+            self.probe_timeouts[contract.conId] = self.clock.monotonic()
             return False
-
-        self.ib.cancelMktData(req_id)
-        return self.ib.real_time_data_available
\ No newline at end of file
+        if 'error' in result:
+            logger.info(f"Market data not available for {contract.symbol}: {result['error']}")
+            return False
+        return result['type'] == 1  # 1 for real-time, 2 for frozen, 3 for delayed
@@ -0,0 +1,98 @@
+# callback_bus.py
+
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Callbacks that close a request; handlers registered for that reqId are dropped after them
+END_MESSAGES = frozenset([
+    'contractDetailsEnd',
+    'historicalDataEnd',
+    'tickSnapshotEnd',
+    'symbolSamples',
+    'execDetailsEnd',
+])
+
+
+class CallbackBus:
+    """
+    Routes IBApi callbacks to handlers registered per reqId, per conId or per message type.
+
+    Every route is a single dict lookup, so any number of concurrent requests and streams can
+    share one connection without overwriting each other's results through shared attributes.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.routes = {}
+        self.req_keys = {}
+
+    def subscribe(self, msg_type, handler, req_id=None, con_id=None):
+        """
+        Register a handler for a callback name, optionally narrowed to a reqId or a conId.
+
+        :return: Subscription key to pass to unsubscribe.
+        """
+        key = (msg_type, req_id, con_id)
+        with self.lock:
+            self.routes.setdefault(key, []).append(handler)
+            if req_id is not None:
+                self.req_keys.setdefault(req_id, set()).add(key)
+        return key, handler
+
+    def unsubscribe(self, subscription):
+        key, handler = subscription
+        with self.lock:
+            handlers = self.routes.get(key)
+            if handlers and handler in handlers:
+                handlers.remove(handler)
+                if not handlers:
+                    del self.routes[key]
+                    req_id = key[1]
+                    if req_id is not None:
+                        keys = self.req_keys.get(req_id)
+                        if keys is not None:
+                            keys.discard(key)
+                            if not keys:
+                                del self.req_keys[req_id]
+
+    def release(self, req_id):
+        """
+        Drop every handler registered for a reqId.
+        """
+        with self.lock:
+            for key in self.req_keys.pop(req_id, ()):
+                self.routes.pop(key, None)
+
+    def publish(self, msg_type, *args, req_id=None, con_id=None):
+        # Copied under the lock, as subscribe and unsubscribe change the handler lists in place
+        handlers = []
+        with self.lock:
+            if req_id is not None:
+                handlers.extend(self.routes.get((msg_type, req_id, None), ()))
+            if con_id is not None:
+                handlers.extend(self.routes.get((msg_type, None, con_id), ()))
+            handlers.extend(self.routes.get((msg_type, None, None), ()))
+
+        for handler in handlers:
+            try:
+                handler(*args)
+            except Exception as e:
+                logger.error(f"Error in {msg_type} handler for reqId {req_id}: {e}", exc_info=True)
+
+        if req_id is not None and msg_type in END_MESSAGES:
+            self.release(req_id)
+
+    def broadcast(self, msg_type, *args):
+        """
+        Publish a callback to the handlers of every open request, e.g. to fail them all at once.
+        """
+        with self.lock:
+            req_ids = [req_id for req_id, keys in self.req_keys.items() if (msg_type, req_id, None) in keys]
+        for req_id in req_ids:
+            self.publish(msg_type, *args, req_id=req_id)
+
+    def stats(self):
+        with self.lock:
+            return {'routes': len(self.routes), 'requests': len(self.req_keys)}
@@ -0,0 +1,86 @@
+# clock.py
+
+import heapq
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytz
+
+
+class SystemClock:
+    """
+    Wall-clock time. The trading logic and everything it reads time-dependent state from
+    (caches, stores, the connection supervisor) take a clock, so a VirtualClock can be swapped
+    in for simulations. Transport-level timing stays on real time: message queue latency,
+    the cross-process price table, journal fsync batching and tick receive timestamps.
+    """
+
+    def now(self):
+        return datetime.now(pytz.utc)
+
+    def monotonic(self):
+        return time.monotonic()
+
+    def time(self):
+        return time.time()
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def wait(self, event, timeout):
+        return event.wait(timeout=timeout)
+
+
+class VirtualClock:
+    """
+    Clock whose time only moves when something sleeps on it: sleep() advances virtual time
+    instantly, so days of scheduling run in milliseconds. Callbacks scheduled with call_at
+    fire as soon as a sleep passes their time, in time order.
+    """
+
+    def __init__(self, start):
+        self.current = start if start.tzinfo else pytz.utc.localize(start)
+        self.start = self.current
+        self.lock = threading.Lock()
+        self.timers = []
+        self.sequence = 0
+        self.slept = 0.0
+
+    def now(self):
+        return self.current
+
+    def monotonic(self):
+        return (self.current - self.start).total_seconds()
+
+    def time(self):
+        return self.current.timestamp()
+
+    def call_at(self, when, callback):
+        with self.lock:
+            self.sequence += 1
+            heapq.heappush(self.timers, (when, self.sequence, callback))
+
+    def sleep(self, seconds):
+        target = self.current + timedelta(seconds=max(seconds, 0))
+        self.advance_to(target)
+        self.slept += max(seconds, 0)
+
+    def wait(self, event, timeout):
+        if not event.is_set():
+            self.sleep(timeout)
+        return event.is_set()
+
+    def advance_to(self, target):
+        while True:
+            with self.lock:
+                if not self.timers or self.timers[0][0] > target:
+                    break
+                when, _, callback = heapq.heappop(self.timers)
+            self.current = max(self.current, when)
+            callback()
+        self.current = max(self.current, target)
+
+
+SYSTEM_CLOCK = SystemClock()
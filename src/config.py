@@ -1,25 +1,50 @@
 # config.py
 
 import os
+import threading
 import yaml
 import logging
-from utils.import_helper import add_vendor_to_path
+from collections import namedtuple
 
-add_vendor_to_path()
+from trading_params import TradingParams
 
 logger = logging.getLogger(__name__)
 
+_MISSING = object()
+
+# One loaded configuration: the parsed file, its dotted-key lookup table and the trading
+# parameters. Being a tuple it cannot change, so a reload swaps all three at once.
+ConfigSnapshot = namedtuple('ConfigSnapshot', ['config', 'values', 'trading'])
+
 
 class Config:
-    def __init__(self):
-        self.config = self.load_config()
+    def __init__(self, config_path=None):
+        if config_path is None:
+            # config.yaml lives one level up from the directory of this script
+            current_dir = os.path.dirname(os.path.abspath(__file__))
+            config_path = os.path.join(os.path.dirname(current_dir), 'config.yaml')
+        self.config_path = config_path
+        self.warned_keys = set()
+        self.listeners = []
+        config = self.load_config()
+        # TradingParams reads through get(), so the values are in place before it is built
+        self.snapshot = ConfigSnapshot(config, self.flatten(config), None)
+        self.snapshot = self.snapshot._replace(trading=TradingParams.from_config(self))
+
+    @property
+    def config(self):
+        return self.snapshot.config
+
+    @property
+    def values(self):
+        return self.snapshot.values
+
+    @property
+    def trading(self):
+        return self.snapshot.trading
 
     def load_config(self):
-        # Get the directory of the current script
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-
-        # Construct the path to config.yaml (one level up from the current directory)
-        config_path = os.path.join(os.path.dirname(current_dir), 'config.yaml')
+        config_path = self.config_path
 
         if not os.path.exists(config_path):
             raise FileNotFoundError(
@@ -37,20 +62,58 @@ class Config:
             logger.error(f"Unexpected error loading configuration: {e}")
             raise
 
+    @staticmethod
+    def flatten(config, prefix=''):
+        """
+        Map every dotted key (sections as well as leaves) to its value, so lookups are a single dict access.
+        """
+        values = {}
+        if isinstance(config, dict):
+            for k, v in config.items():
+                key = f"{prefix}{k}"
+                values[key] = v
+                values.update(Config.flatten(v, f"{key}."))
+        return values
+
     def get(self, key, default=None):
         """
         Get a configuration value by key.
         """
-        keys = key.split('.')
-        value = self.config
-        for k in keys:
-            if isinstance(value, dict) and k in value:
-                value = value[k]
-            else:
+        value = self.snapshot.values.get(key, _MISSING)
+        if value is _MISSING:
+            if key not in self.warned_keys:
+                self.warned_keys.add(key)
                 logger.warning(f"Configuration key '{key}' not found. Using default value: {default}")
-                return default
+            return default
         return value
 
+    def add_listener(self, listener):
+        """
+        Register a callable that receives this Config after every successful reload.
+        """
+        self.listeners.append(listener)
+
+    def reload(self):
+        """
+        Re-read the configuration file and swap in the new values. An invalid file is
+        rejected as a whole and the current configuration stays in effect.
+        """
+        try:
+            staged = Config(self.config_path)
+            staged.validate()
+        except Exception as e:
+            logger.error(f"Configuration reload rejected, keeping the current configuration: {e}")
+            return False
+
+        self.snapshot = staged.snapshot
+        logger.info(f"Configuration reloaded: {staged.trading}")
+        for listener in self.listeners:
+            try:
+                listener(self)
+            except Exception as e:
+                logger.error(f"Error applying reloaded configuration: {e}", exc_info=True)
+        return True
+
     def validate(self):
         """
         Validate the configuration to ensure all required fields are present.
@@ -69,25 +132,52 @@ class Config:
         for field in required_fields:
             if self.get(field) is None:
                 raise ValueError(f"Missing required configuration field: {field}")
-
-        # Validate specific fields
-        max_position_size = self.get('trading.max_position_size')
-        if max_position_size is not None:
-            try:
-                max_position_size = float(max_position_size)
-                if not 0 < max_position_size <= 1:
-                    raise ValueError("trading.max_position_size must be between 0 and 1")
-            except ValueError:
-                raise ValueError("trading.max_position_size must be a float between 0 and 1")
+        # Trading parameters are range-checked by TradingParams.from_config
 
         logger.info("Configuration validation successful")
 
 
-# Create a global instance of the Config class
-CONFIG = Config()
+class ConfigWatcher:
+    """
+    Polls the configuration file's modification time and reloads the Config when it changes.
+    """
 
-# Validate the configuration on import
+    def __init__(self, config, interval=5):
+        self.config = config
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.mtime = self._mtime()
+
+    def _mtime(self):
+        try:
+            return os.stat(self.config.config_path).st_mtime_ns
+        except OSError:
+            return None
+
+    def start(self):
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, name="ConfigWatcher", daemon=True)
+        self.thread.start()
+        logger.info(f"Watching {self.config.config_path} for changes")
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join(timeout=self.interval)
+            self.thread = None
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            mtime = self._mtime()
+            if mtime is not None and mtime != self.mtime:
+                self.mtime = mtime
+                self.config.reload()
+
+
+# Create and validate a global instance of the Config class on import
 try:
+    CONFIG = Config()
     CONFIG.validate()
 except ValueError as e:
     logger.error(f"Configuration validation failed: {e}")
@@ -0,0 +1,91 @@
+# connection_supervisor.py
+
+import logging
+import threading
+from collections import deque
+
+from clock import SYSTEM_CLOCK
+
+logger = logging.getLogger(__name__)
+
+
+class ConnectionSupervisor:
+    """
+    Watches the broker connection with a reqCurrentTime heartbeat and reconnects with
+    exponential backoff when it drops. After a reconnect the broker re-subscribes its
+    market data and position streams. Requests that were waiting when the connection
+    dropped fail immediately with ConnectionError instead of running into their timeout.
+    """
+
+    def __init__(self, broker, heartbeat_interval=10, heartbeat_timeout=5, initial_backoff=1, max_backoff=60,
+                 max_recovery_samples=100, clock=SYSTEM_CLOCK):
+        self.broker = broker
+        self.clock = clock
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_timeout = heartbeat_timeout
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.stop_event = threading.Event()
+        self.connected_event = threading.Event()
+        self.thread = None
+        self.recovery_times = deque(maxlen=max_recovery_samples)
+
+    def start(self):
+        if self.broker.is_connected():
+            self.connected_event.set()
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, name="ConnectionSupervisor", daemon=True)
+        self.thread.start()
+        logger.info("Connection supervisor started")
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join(timeout=self.heartbeat_interval + self.heartbeat_timeout)
+            self.thread = None
+        logger.info("Connection supervisor stopped")
+
+    def wait_until_connected(self, timeout=None):
+        return self.connected_event.wait(timeout=timeout)
+
+    def heartbeat(self):
+        if not self.broker.is_connected():
+            return False
+        try:
+            self.broker.ping(timeout=self.heartbeat_timeout)
+            return True
+        except (TimeoutError, ConnectionError) as e:
+            logger.warning(f"Heartbeat failed: {e}")
+            return False
+
+    def run(self):
+        while not self.stop_event.is_set():
+            if self.heartbeat():
+                self.connected_event.set()
+                self.clock.wait(self.stop_event, self.heartbeat_interval)
+                continue
+
+            self.connected_event.clear()
+            self.recover()
+
+    def recover(self):
+        dropped_at = self.clock.monotonic()
+        backoff = self.initial_backoff
+        attempt = 0
+        logger.warning("Connection to Interactive Brokers lost. Reconnecting...")
+        self.broker.fail_pending_requests()
+
+        while not self.stop_event.is_set():
+            attempt += 1
+            try:
+                self.broker.reconnect()
+                self.broker.resubscribe()
+                recovery_time = self.clock.monotonic() - dropped_at
+                self.recovery_times.append(recovery_time)
+                logger.info(f"Reconnected to Interactive Brokers after {attempt} attempts in {recovery_time:.2f}s")
+                self.connected_event.set()
+                return
+            except Exception as e:
+                logger.warning(f"Reconnect attempt {attempt} failed: {e}. Retrying in {backoff}s")
+                self.clock.wait(self.stop_event, backoff)
+                backoff = min(backoff * 2, self.max_backoff)
@@ -0,0 +1,239 @@
+# constituents.py
+
+import codecs
+import json
+import logging
+import math
+import re
+import sys
+from array import array
+from collections.abc import Mapping
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+
+def iter_json_array(chunks, key, metadata=None):
+    """
+    Yield the items of the top-level array `key` of a JSON object that arrives in byte chunks,
+    one item at a time, so only the current item is ever held in memory. The other top-level
+    fields are parsed once the document ends and stored in `metadata`.
+    """
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder('utf-8')()
+    chunks = iter(chunks)
+    start = re.compile(r'"%s"\s*:\s*\[' % re.escape(key))
+    buffer = ''
+    pos = 0
+
+    def more():
+        nonlocal buffer, pos
+        chunk = next(chunks, None)
+        if chunk is None:
+            return False
+        buffer = buffer[pos:] + text.decode(chunk)
+        pos = 0
+        return True
+
+    # Everything before the array is kept to be parsed as metadata
+    while True:
+        match = start.search(buffer)
+        if match:
+            break
+        if not more():
+            if metadata is not None:
+                metadata.update(json.loads(buffer))
+            return
+    prefix = buffer[:match.end() - 1]
+    pos = match.end()
+
+    while True:
+        while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+            pos += 1
+        if pos == len(buffer):
+            if not more():
+                raise ValueError(f"JSON document ended inside the '{key}' array")
+            continue
+        if buffer[pos] == ']':
+            pos += 1
+            break
+        try:
+            item, pos = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if not more():
+                raise
+            continue
+        yield item
+
+    suffix = [buffer[pos:]]
+    buffer, pos = '', 0
+    while more():
+        suffix.append(buffer)
+        buffer = ''
+    suffix.append(text.decode(b'', final=True))
+    if metadata is not None:
+        metadata.update(json.loads(prefix + '[]' + ''.join(suffix)))
+        metadata.pop(key, None)
+
+
+class ConstituentSet(Mapping):
+    """
+    Validated, deduplicated index constituents stored column by column: one list or array per
+    field instead of a dict per stock, so thousands of constituents stay compact.
+
+    Reads like the {ticker: {'isin', 'exchange', 'name', 'rank', 'weight'}} dict the trading
+    loop has always used; 'weight' is normalized over the whole set. Without weights in the
+    source every constituent gets an equal 1/N weight.
+    """
+
+    def __init__(self, date=None):
+        self.date = date
+        self.rows = {}
+        self.tickers = []
+        self.isins = []
+        self.exchanges = []
+        self.names = []
+        self.ranks = array('l')
+        self.weights = array('d')
+        self.isin_rows = {}
+        self.weighted = 0
+        self.total_weight = 0.0
+        self.rejected = 0
+        self.duplicates = 0
+
+    @classmethod
+    def from_records(cls, constituents, date=None):
+        constituent_set = cls(date)
+        for constituent in constituents:
+            constituent_set.add(constituent)
+        return constituent_set
+
+    @classmethod
+    def from_stream(cls, chunks, key='constituents'):
+        """
+        Build the set while the JSON document is still arriving.
+        """
+        metadata = {}
+        constituent_set = cls()
+        for constituent in iter_json_array(chunks, key, metadata):
+            constituent_set.add(constituent)
+        constituent_set.date = metadata.get('date')
+        return constituent_set
+
+    def add(self, constituent):
+        """
+        Validate a raw constituent and append it.
+
+        :return: True if it was added, False if it was invalid or a duplicate.
+        """
+        if not isinstance(constituent, dict):
+            self.rejected += 1
+            logger.warning(f"Ignoring malformed constituent: {constituent!r}")
+            return False
+        ticker = constituent.get('ticker')
+        isin = constituent.get('isin')
+        exchange = constituent.get('exchange')
+        if not ticker or not isin or not exchange:
+            self.rejected += 1
+            logger.warning(f"Missing essential data for constituent: {constituent}")
+            return False
+
+        weight = constituent.get('weight')
+        if weight is not None:
+            try:
+                weight = float(weight)
+            except (TypeError, ValueError):
+                weight = math.nan
+            if not math.isfinite(weight) or weight <= 0:
+                self.rejected += 1
+                logger.warning(f"Invalid weight for constituent {ticker}: {constituent.get('weight')!r}")
+                return False
+
+        if ticker in self.rows or isin in self.isin_rows:
+            self.duplicates += 1
+            logger.debug(f"Skipping duplicate constituent {ticker} ({isin})")
+            return False
+
+        try:
+            rank = int(constituent.get('rank') or 0)
+        except (TypeError, ValueError):
+            rank = 0
+
+        row = len(self.tickers)
+        self.rows[ticker] = row
+        self.isin_rows[isin] = row
+        self.tickers.append(ticker)
+        self.isins.append(isin)
+        self.exchanges.append(sys.intern(exchange))
+        self.names.append(constituent.get('name'))
+        self.ranks.append(rank)
+        if weight is None:
+            self.weights.append(math.nan)
+        else:
+            self.weights.append(weight)
+            self.weighted += 1
+            self.total_weight += weight
+        return True
+
+    def weight(self, ticker):
+        """
+        Return the constituent's share of the whole set.
+        """
+        row = self.rows[ticker]
+        if self.weighted == len(self.tickers):
+            return self.weights[row] / self.total_weight
+        return 1.0 / len(self.tickers)
+
+    def __getitem__(self, ticker):
+        row = self.rows[ticker]
+        return {
+            'isin': self.isins[row],
+            'exchange': self.exchanges[row],
+            'name': self.names[row],
+            'rank': self.ranks[row] or None,
+            'weight': self.weight(ticker)
+        }
+
+    def __iter__(self):
+        return iter(self.tickers)
+
+    def __len__(self):
+        return len(self.tickers)
+
+    def __contains__(self, ticker):
+        return ticker in self.rows
+
+    def to_records(self):
+        """
+        Return the constituents as plain dicts, e.g. for the state journal.
+        """
+        return [dict(self[ticker], ticker=ticker) for ticker in self.tickers]
+
+    def summary(self):
+        weighting = 'weighted' if self.weighted == len(self.tickers) else 'equal-weighted'
+        if 0 < self.weighted < len(self.tickers):
+            weighting += f" ({len(self.tickers) - self.weighted} constituents lack a weight)"
+        return (f"{len(self.tickers)} constituents for {self.date or 'unknown date'}, {weighting}, "
+                f"{self.rejected} rejected, {self.duplicates} duplicates, "
+                f"{len(set(self.exchanges))} exchanges")
+
+
+class ConstituentFile:
+    """
+    Custom constituent list read from a local JSON file in the Tradepost format
+    ({'date': ..., 'constituents': [{'ticker', 'isin', 'exchange', 'name', 'rank', 'weight'}]}).
+    Stands in for TradepostAPI, so the loop can track any list of any size.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def get_top20(self, date=None):
+        with open(self.path, 'rb') as file:
+            constituents = ConstituentSet.from_stream(iter(lambda: file.read(CHUNK_SIZE), b''))
+        logger.info(f"Loaded {constituents.summary()} from {self.path}")
+        return {'date': constituents.date or date, 'constituents': constituents}
+
+    def __str__(self):
+        return f"ConstituentFile(path={self.path})"
@@ -0,0 +1,141 @@
+# entitlements.py
+
+import json
+import logging
+import os
+import threading
+
+from clock import SYSTEM_CLOCK
+
+logger = logging.getLogger(__name__)
+
+
+class EntitlementRegistry:
+    """
+    Market data entitlements learned from marketDataType and error callbacks, kept per conId
+    and per exchange on disk with an expiry.
+
+    A symbol whose entitlement is known goes straight to the right price source; only a
+    contract on an exchange that was never seen needs a probe. An exchange entry records the
+    latest observation for any contract listed there and stands in for contracts without
+    one of their own. Only an explicit entitlement error or a delayed marketDataType says
+    something about the whole exchange; a live or frozen answer is kept for its contract only.
+
+    Changes are written to disk by a background thread, so the dispatch thread that reports
+    them never waits for the disk.
+    """
+
+    LIVE = 'live'
+    FROZEN = 'frozen'
+    DELAYED = 'delayed'
+    DELAYED_FROZEN = 'delayed_frozen'
+    NONE = 'none'
+
+    MARKET_DATA_TYPES = {1: LIVE, 2: FROZEN, 3: DELAYED, 4: DELAYED_FROZEN}
+    ERROR_STATES = {
+        354: NONE,  # Requested market data is not subscribed
+        10089: DELAYED,  # Requested market data requires additional subscription, delayed data is available
+        10090: DELAYED,  # Part of requested market data is not subscribed
+        10167: DELAYED,  # Displaying delayed market data
+        10168: NONE,  # Requested market data is not subscribed, delayed market data is not enabled
+        10186: NONE,  # Requested market data is not subscribed, delayed market data is not available
+    }
+
+    def __init__(self, path, max_age=86400, clock=SYSTEM_CLOCK):
+        self.clock = clock
+        self.path = path
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.entries = self._load()
+        self.save_lock = threading.Lock()
+        self.dirty = threading.Event()
+        self.writer = None
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return {'conId': {}, 'exchange': {}}
+        try:
+            with open(self.path, 'r') as file:
+                return json.load(file)
+        except (OSError, ValueError) as e:
+            logger.error(f"Error loading market data entitlements from {self.path}: {e}. Starting empty.")
+            return {'conId': {}, 'exchange': {}}
+
+    def _save(self):
+        with self.save_lock:
+            with self.lock:
+                data = json.dumps(self.entries)
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w') as file:
+                file.write(data)
+            os.replace(tmp_path, self.path)
+
+    def _write_loop(self):
+        while True:
+            self.dirty.wait()
+            self.dirty.clear()
+            try:
+                self._save()
+            except OSError as e:
+                logger.error(f"Error saving market data entitlements to {self.path}: {e}")
+
+    def _schedule_save(self):
+        # Called with the lock held
+        if self.writer is None:
+            self.writer = threading.Thread(target=self._write_loop, name="EntitlementWriter", daemon=True)
+            self.writer.start()
+        self.dirty.set()
+
+    def flush(self):
+        """
+        Write the entries now, e.g. on shutdown, after any save in progress.
+        """
+        self.dirty.clear()
+        self._save()
+
+    @staticmethod
+    def exchange_of(contract):
+        return contract.primaryExchange or contract.exchange
+
+    def record(self, contract, state, exchange_wide=False):
+        """
+        Remember the entitlement observed for a contract and, if `exchange_wide`, for its exchange.
+        """
+        now = self.clock.time()
+        entry = {'state': state, 'time': now}
+        exchange = self.exchange_of(contract)
+        with self.lock:
+            previous = self.entries['conId'].get(str(contract.conId), {})
+            if previous.get('state') == state and now - previous['time'] < self.max_age / 2 and \
+                    (not exchange_wide or self.entries['exchange'].get(exchange, {}).get('state') == state):
+                return  # Still fresh, spare the disk write
+            previous = previous.get('state')
+            self.entries['conId'][str(contract.conId)] = entry
+            if exchange_wide:
+                self.entries['exchange'][exchange] = entry
+            self._schedule_save()
+        if previous != state:
+            logger.info(f"Market data for {contract.symbol} ({self.exchange_of(contract)}) is {state}")
+
+    def on_market_data_type(self, contract, market_data_type):
+        state = self.MARKET_DATA_TYPES.get(market_data_type)
+        if state:
+            self.record(contract, state, exchange_wide=state in (self.DELAYED, self.DELAYED_FROZEN))
+
+    def on_error(self, contract, error_code):
+        state = self.ERROR_STATES.get(error_code)
+        if state:
+            self.record(contract, state, exchange_wide=True)
+
+    def lookup(self, contract):
+        """
+        Return the known entitlement for a contract, or None if it has to be probed.
+        """
+        now = self.clock.time()
+        with self.lock:
+            for kind, key in (('conId', str(contract.conId)), ('exchange', self.exchange_of(contract))):
+                entry = self.entries[kind].get(key)
+                if entry and now - entry['time'] <= self.max_age:
+                    return entry['state']
+        return None
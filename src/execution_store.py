@@ -0,0 +1,354 @@
+# execution_store.py
+
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timezone
+
+import numpy as np
+
+from clock import SYSTEM_CLOCK
+
+logger = logging.getLogger(__name__)
+
+
+class ExecutionStore:
+    """
+    Columnar on-disk store of order outcomes and fills, partitioned by month.
+
+    Every column of a partition is a flat binary file that rows are appended to, and symbols
+    and exchanges are dictionary-encoded to integer codes, so a query only reads the columns it
+    needs with np.fromfile and aggregates with vectorized NumPy over months of data.
+
+    Orders are tracked from place_order (submit) through the first orderStatus (ack), the
+    execDetails callbacks (fills) and the matching commissionReports, and written once they
+    are done, their fills add up to the filled quantity of the final status (TWS may report
+    the status before the execDetails) and every fill has its commission. Orders still open after `max_pending_age`
+    seconds are written as they stand by prune().
+
+    A crash can leave a row written to only some columns; the first append to a partition and
+    every load cut all columns to the shortest one, so the rows stay aligned.
+    """
+
+    ORDER_COLUMNS = {
+        'order_id': '<i8',
+        'day': '<i4',
+        'symbol': '<i4',
+        'exchange': '<i4',
+        'side': '<i1',
+        'quantity': '<f8',
+        'filled': '<f8',
+        'intended_price': '<f8',
+        'limit_price': '<f8',
+        'avg_fill_price': '<f8',
+        'commission': '<f8',
+        'submit_time': '<f8',
+        'ack_time': '<f8',
+        'first_fill_time': '<f8',
+        'last_fill_time': '<f8',
+    }
+    FILL_COLUMNS = {
+        'order_id': '<i8',
+        'day': '<i4',
+        'symbol': '<i4',
+        'exchange': '<i4',
+        'side': '<i1',
+        'time': '<f8',
+        'shares': '<f8',
+        'price': '<f8',
+        'commission': '<f8',
+    }
+    GROUP_KEYS = ('exchange', 'symbol', 'day')
+    ACK_STATUSES = frozenset(['PreSubmitted', 'Submitted', 'Filled'])
+    DONE_STATUSES = frozenset(['Filled', 'Cancelled', 'ApiCancelled', 'Inactive'])
+    DICTIONARY_FILE = 'dictionary.json'
+
+    def __init__(self, directory, max_pending_age=86400, clock=SYSTEM_CLOCK):
+        self.clock = clock
+        self.directory = directory
+        self.max_pending_age = max_pending_age
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.fills = {}
+        self.repaired = set()
+        os.makedirs(self.directory, exist_ok=True)
+        self.dictionary = self._load_dictionary()
+        self.codes = {name: {value: code for code, value in enumerate(values)}
+                      for name, values in self.dictionary.items()}
+
+    def _dictionary_path(self):
+        return os.path.join(self.directory, self.DICTIONARY_FILE)
+
+    def _load_dictionary(self):
+        path = self._dictionary_path()
+        if os.path.exists(path):
+            try:
+                with open(path, 'r') as file:
+                    return json.load(file)
+            except (OSError, ValueError) as e:
+                logger.error(f"Error loading execution store dictionary from {path}: {e}")
+        return {'symbol': [], 'exchange': []}
+
+    def _save_dictionary(self):
+        path = self._dictionary_path()
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as file:
+            json.dump(self.dictionary, file)
+        os.replace(tmp_path, path)
+
+    def _code(self, name, value):
+        codes = self.codes[name]
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(self.dictionary[name])
+            self.dictionary[name].append(value)
+            self._save_dictionary()
+        return code
+
+    @staticmethod
+    def _day(timestamp):
+        return int(datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y%m%d'))
+
+    @staticmethod
+    def _rows(partition, columns):
+        """
+        Return the number of complete rows in a partition: the length of its shortest column.
+        """
+        rows = []
+        for name, dtype in columns.items():
+            path = os.path.join(partition, f"{name}.bin")
+            rows.append(os.path.getsize(path) // np.dtype(dtype).itemsize if os.path.exists(path) else 0)
+        return min(rows)
+
+    def _repair(self, partition, columns):
+        rows = self._rows(partition, columns)
+        for name, dtype in columns.items():
+            path = os.path.join(partition, f"{name}.bin")
+            size = rows * np.dtype(dtype).itemsize
+            if os.path.exists(path) and os.path.getsize(path) != size:
+                logger.warning(f"Truncating {path} to {rows} rows after an incomplete write")
+                os.truncate(path, size)
+
+    def _append(self, table, columns, row):
+        partition = os.path.join(self.directory, table, str(row['day'] // 100))
+        os.makedirs(partition, exist_ok=True)
+        if partition not in self.repaired:
+            self._repair(partition, columns)
+            self.repaired.add(partition)
+        for name, dtype in columns.items():
+            with open(os.path.join(partition, f"{name}.bin"), 'ab') as file:
+                file.write(np.array([row[name]], dtype=dtype).tobytes())
+
+    # Recording
+
+    def order_submitted(self, order_id, symbol, exchange, action, quantity, intended_price=None, limit_price=None):
+        with self.lock:
+            self.pending[order_id] = {
+                'order_id': order_id,
+                'symbol': symbol,
+                'exchange': exchange,
+                'side': 1 if action == 'BUY' else -1,
+                'quantity': float(quantity),
+                'intended_price': float(intended_price) if intended_price is not None else np.nan,
+                'limit_price': float(limit_price) if limit_price is not None else np.nan,
+                'submit_time': self.clock.time(),
+                'ack_time': np.nan,
+                'first_fill_time': np.nan,
+                'last_fill_time': np.nan,
+                'status': None,
+                'status_filled': 0.0,
+                'exec_ids': set(),
+            }
+
+    def on_order_status(self, order_id, status):
+        with self.lock:
+            order = self.pending.get(order_id)
+            if order is None:
+                return
+            if np.isnan(order['ack_time']) and status['status'] in self.ACK_STATUSES:
+                order['ack_time'] = self.clock.time()
+            order['status'] = status['status']
+            order['status_filled'] = float(status.get('filled') or 0.0)
+            self._finish_if_done(order_id)
+
+    def on_exec_details(self, reqId, contract, execution):
+        now = self.clock.time()
+        with self.lock:
+            order = self.pending.get(execution.orderId)
+            if order is None or execution.execId in self.fills:
+                return
+            if np.isnan(order['first_fill_time']):
+                order['first_fill_time'] = now
+            order['last_fill_time'] = now
+            order['exec_ids'].add(execution.execId)
+            self.fills[execution.execId] = {
+                'order_id': execution.orderId,
+                'time': now,
+                'shares': float(execution.shares),
+                'price': execution.price,
+                'commission': None,
+            }
+
+    def on_commission_report(self, commission_report):
+        with self.lock:
+            fill = self.fills.get(commission_report.execId)
+            if fill is None:
+                return
+            fill['commission'] = commission_report.commission
+            self._finish_if_done(fill['order_id'])
+
+    def _finish_if_done(self, order_id, force=False):
+        order = self.pending[order_id]
+        if order['status'] not in self.DONE_STATUSES and not force:
+            return
+        fills = [self.fills[exec_id] for exec_id in order['exec_ids']]
+        if not force and (sum(fill['shares'] for fill in fills) < order['status_filled'] or
+                          any(fill['commission'] is None for fill in fills)):
+            return
+
+        del self.pending[order_id]
+        for exec_id in order['exec_ids']:
+            del self.fills[exec_id]
+
+        day = self._day(order['submit_time'])
+        symbol = self._code('symbol', order['symbol'])
+        exchange = self._code('exchange', order['exchange'])
+        filled = sum(fill['shares'] for fill in fills)
+        notional = sum(fill['shares'] * fill['price'] for fill in fills)
+        commission = sum(fill['commission'] or 0.0 for fill in fills)
+
+        for fill in fills:
+            self._append('fills', self.FILL_COLUMNS, dict(
+                fill, day=day, symbol=symbol, exchange=exchange, side=order['side'],
+                commission=fill['commission'] if fill['commission'] is not None else np.nan))
+        self._append('orders', self.ORDER_COLUMNS, dict(
+            order, day=day, symbol=symbol, exchange=exchange, filled=filled, commission=commission,
+            avg_fill_price=notional / filled if filled else np.nan))
+
+        logger.debug(f"Recorded execution of order {order_id}: {filled} of {order['quantity']} {order['symbol']}")
+
+    def flush(self):
+        """
+        Write every finished order, including ones still waiting for a commission report.
+        """
+        with self.lock:
+            for order_id in [order_id for order_id, order in self.pending.items()
+                             if order['status'] in self.DONE_STATUSES]:
+                self._finish_if_done(order_id, force=True)
+
+    def prune(self):
+        """
+        Write the orders submitted more than `max_pending_age` seconds ago that are still open,
+        e.g. left working past their day or whose final status never arrived, so they do not
+        stay in memory forever.
+        """
+        cutoff = self.clock.time() - self.max_pending_age
+        with self.lock:
+            stale = [order_id for order_id, order in self.pending.items() if order['submit_time'] < cutoff]
+            for order_id in stale:
+                logger.info(f"Recording order {order_id} ({self.pending[order_id]['status']}) "
+                            f"after {self.max_pending_age}s without a final status")
+                self._finish_if_done(order_id, force=True)
+
+    # Queries
+
+    def _partitions(self, table, start_day=None, end_day=None):
+        root = os.path.join(self.directory, table)
+        if not os.path.isdir(root):
+            return []
+        months = sorted(int(name) for name in os.listdir(root) if name.isdigit())
+        return [os.path.join(root, str(month)) for month in months
+                if (start_day is None or month >= start_day // 100) and (end_day is None or month <= end_day // 100)]
+
+    def load(self, table, columns, start_day=None, end_day=None):
+        """
+        Return {column: array} for the given columns of 'orders' or 'fills' within a day range.
+        """
+        dtypes = self.ORDER_COLUMNS if table == 'orders' else self.FILL_COLUMNS
+        needed = set(columns) | {'day'}
+        parts = {name: [] for name in needed}
+        for partition in self._partitions(table, start_day, end_day):
+            rows = self._rows(partition, dtypes)
+            if not rows:
+                continue
+            for name in needed:
+                parts[name].append(np.fromfile(os.path.join(partition, f"{name}.bin"), dtype=dtypes[name],
+                                               count=rows))
+        data = {name: np.concatenate(arrays) if arrays else np.empty(0, dtype=dtypes[name])
+                for name, arrays in parts.items()}
+
+        mask = np.ones(len(data['day']), dtype=bool)
+        if start_day is not None:
+            mask &= data['day'] >= start_day
+        if end_day is not None:
+            mask &= data['day'] <= end_day
+        return {name: data[name][mask] for name in columns}
+
+    def summary(self, by=('exchange',), start_day=None, end_day=None):
+        """
+        Aggregate execution quality per group of `by` (any of exchange, symbol and day).
+
+        Returns one dict per group with the order count, fill ratio (filled / ordered shares),
+        filled-quantity weighted slippage in basis points against the intended price (positive
+        is worse), mean submit-to-ack and submit-to-first-fill latency in milliseconds, and the
+        total commission.
+        """
+        by = tuple(by)
+        unknown = set(by) - set(self.GROUP_KEYS)
+        if unknown:
+            raise ValueError(f"Cannot group executions by {sorted(unknown)}")
+
+        data = self.load('orders', by + ('side', 'quantity', 'filled', 'intended_price', 'avg_fill_price',
+                                         'commission', 'submit_time', 'ack_time', 'first_fill_time'),
+                         start_day, end_day)
+        if len(data['quantity']) == 0:
+            return []
+
+        if by:
+            keys, groups = np.unique(np.stack([data[key].astype(np.int64) for key in by], axis=1),
+                                     axis=0, return_inverse=True)
+            groups = groups.ravel()
+        else:
+            keys, groups = np.empty((1, 0), dtype=np.int64), np.zeros(len(data['quantity']), dtype=np.int64)
+        size = len(keys)
+
+        def total(values, mask=None):
+            if mask is not None:
+                values = np.where(mask, values, 0.0)
+            return np.bincount(groups, weights=values, minlength=size)
+
+        def mean(values):
+            valid = ~np.isnan(values)
+            counts = total(valid.astype(np.float64))
+            with np.errstate(invalid='ignore', divide='ignore'):
+                return np.where(counts > 0, total(np.nan_to_num(values), valid) / np.maximum(counts, 1), np.nan)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            slippage = data['side'] * (data['avg_fill_price'] / data['intended_price'] - 1) * 1e4
+        slippage_valid = ~np.isnan(slippage) & (data['filled'] > 0)
+        slippage_weight = total(data['filled'], slippage_valid)
+
+        orders = np.bincount(groups, minlength=size)
+        quantity = total(data['quantity'])
+        filled = total(data['filled'])
+        slippage_sum = total(np.nan_to_num(slippage) * data['filled'], slippage_valid)
+        ack_latency = mean((data['ack_time'] - data['submit_time']) * 1000)
+        fill_latency = mean((data['first_fill_time'] - data['submit_time']) * 1000)
+        commission = total(np.nan_to_num(data['commission']))
+
+        results = []
+        for i, key in enumerate(keys):
+            row = {}
+            for name, code in zip(by, key):
+                row[name] = int(code) if name == 'day' else self.dictionary[name][code]
+            row.update({
+                'orders': int(orders[i]),
+                'fill_ratio': float(filled[i] / quantity[i]) if quantity[i] else None,
+                'slippage_bps': float(slippage_sum[i] / slippage_weight[i]) if slippage_weight[i] else None,
+                'ack_latency_ms': None if np.isnan(ack_latency[i]) else float(ack_latency[i]),
+                'fill_latency_ms': None if np.isnan(fill_latency[i]) else float(fill_latency[i]),
+                'commission': float(commission[i]),
+            })
+            results.append(row)
+        return results
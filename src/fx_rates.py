@@ -0,0 +1,108 @@
+# fx_rates.py
+
+import logging
+import threading
+from decimal import Decimal
+
+import numpy as np
+
+from clock import SYSTEM_CLOCK
+from utils.import_helper import add_vendor_to_path
+
+add_vendor_to_path()
+from ibapi.contract import Contract
+
+logger = logging.getLogger(__name__)
+
+
+class FxRates:
+    """
+    Cached conversion rates from any currency to the account's base currency.
+
+    All currencies that are missing or stale are fetched from IDEALPRO in one concurrent batch
+    of snapshot requests, so valuing a multi-currency portfolio costs at most one round trip
+    per refresh instead of one per position.
+    """
+
+    # IDEALPRO quotes a pair with the higher-ranked currency first, e.g. EUR.USD and USD.JPY
+    PAIR_PRIORITY = ['EUR', 'GBP', 'AUD', 'NZD', 'USD', 'CAD', 'CHF']
+
+    def __init__(self, broker, base_currency='USD', max_age=900, clock=SYSTEM_CLOCK):
+        self.broker = broker
+        self.clock = clock
+        self.base_currency = base_currency
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.rates = {base_currency: (Decimal('1'), float('inf'))}
+
+    def set_base_currency(self, base_currency):
+        with self.lock:
+            if base_currency and base_currency != self.base_currency:
+                logger.info(f"Base currency set to {base_currency}")
+                self.base_currency = base_currency
+                self.rates = {base_currency: (Decimal('1'), float('inf'))}
+
+    def pair_contract(self, currency):
+        """
+        Return the IDEALPRO contract for a currency against the base currency and whether its
+        quote must be inverted to get base units per unit of the currency.
+        """
+        def rank(ccy):
+            return self.PAIR_PRIORITY.index(ccy) if ccy in self.PAIR_PRIORITY else len(self.PAIR_PRIORITY)
+
+        contract = Contract()
+        contract.secType = 'CASH'
+        contract.exchange = 'IDEALPRO'
+        if rank(currency) <= rank(self.base_currency):
+            contract.symbol, contract.currency = currency, self.base_currency
+            return contract, False
+        contract.symbol, contract.currency = self.base_currency, currency
+        return contract, True
+
+    def refresh(self, currencies):
+        """
+        Fetch every currency in `currencies` that has no rate or a stale one, in one batch.
+        """
+        now = self.clock.monotonic()
+        with self.lock:
+            stale = sorted(ccy for ccy in set(currencies)
+                           if ccy and (ccy not in self.rates or now - self.rates[ccy][1] > self.max_age))
+        if not stale:
+            return
+
+        pairs = [self.pair_contract(ccy) for ccy in stale]
+        quotes = self.broker.get_snapshot_prices([contract for contract, _ in pairs])
+
+        with self.lock:
+            for ccy, (contract, inverted), quote in zip(stale, pairs, quotes):
+                if not quote:
+                    logger.warning(f"No FX quote for {contract.symbol}.{contract.currency}")
+                    continue
+                rate = Decimal(str(quote))
+                self.rates[ccy] = (Decimal('1') / rate if inverted else rate, now)
+        logger.info(f"Refreshed FX rates for {stale} in one batch")
+
+    def to_base(self, currency):
+        """
+        Return the base currency value of one unit of `currency`.
+
+        :raises ValueError: If no rate is known for the currency.
+        """
+        if not currency or currency == self.base_currency:
+            return Decimal('1')
+        with self.lock:
+            entry = self.rates.get(currency)
+        if entry is None:
+            raise ValueError(f"No FX rate available for {currency} to {self.base_currency}")
+        if self.clock.monotonic() - entry[1] > self.max_age:
+            logger.warning(f"Using stale FX rate for {currency}")
+        return entry[0]
+
+    def cross_rate_matrix(self):
+        """
+        Return (currencies, matrix) where matrix[i, j] is the price of currencies[i] in currencies[j].
+        """
+        with self.lock:
+            currencies = sorted(self.rates)
+            to_base = np.array([float(self.rates[ccy][0]) for ccy in currencies])
+        return currencies, to_base[:, None] / to_base[None, :]
@@ -1,199 +1,172 @@
 # main.py
 
 import logging
-import time
-from datetime import datetime
-
-import pytz
 
 from utils.import_helper import add_vendor_to_path
+from utils.logging_setup import setup_logging
 
 add_vendor_to_path()
 
-from config import CONFIG
+from config import CONFIG, ConfigWatcher
 from tradepost_api import TradepostAPI
+from constituents import ConstituentFile
 from broker import IBBroker
+from bar_cache import BarCache
+from state_journal import StateJournal
+from execution_store import ExecutionStore
+from price_table import SharedPriceTable
+from entitlements import EntitlementRegistry
+from connection_supervisor import ConnectionSupervisor
+from message_lanes import LaneQueue
+from warm_up import MarketWarmUp
+from fx_rates import FxRates
+from valuation import ValuationCache
 from portfolio_manager import PortfolioManager
+from pretrade import PreTradeValidator
+from clock import SYSTEM_CLOCK
+from trading_loop import run_iteration
 
-# Set root logger to INFO
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-
-# Set IBAPI logger to WARNING to reduce its output
-logging.getLogger('ibapi').setLevel(logging.WARNING)
-
-# Keep DEBUG level for your custom logger if needed
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG)
-
-def process_top20_data(data):
-    logger.debug(f"Raw Top20 data: {data}")
-    processed_data = {}
-    for constituent in data['constituents']:
-        ticker = constituent.get('ticker')
-        isin = constituent.get('isin')
-        exchange = constituent.get('exchange')
-
-        if not ticker or not isin or not exchange:
-            logger.warning(f"Missing essential data for constituent: {constituent}")
-            continue
-
-        processed_data[ticker] = {
-            'isin': isin,
-            'exchange': exchange,
-            'name': constituent.get('name'),
-            'rank': constituent.get('rank')
-        }
-
-    logger.debug(f"Processed Top20 data: {processed_data}")
-    return processed_data
-
-def get_current_prices(broker, processed_top20):
-    prices = {}
-    for ticker, data in processed_top20.items():
-        retries = 3
-        while retries > 0:
-            try:
-                price = broker.get_market_price(data['isin'], ticker, data['exchange'], data['name'])
-                if price is not None:
-                    prices[ticker] = price
-                    logger.info(f"Got price for {ticker} ({data['name']}): {price}")
-                    break
-                else:
-                    logger.warning(f"Failed to get price for {ticker} ({data['name']}). Retries left: {retries - 1}")
-                    retries -= 1
-            except Exception as e:
-                logger.error(f"Failed to get price for {ticker} ({data['name']}): {e}")
-                retries -= 1
-            time.sleep(60)  # Wait for 1 minute before retrying
-
-        if ticker not in prices:
-            logger.error(f"Unable to get price for {ticker} ({data['name']}) after all retries. Skipping this stock.")
-
-    return prices
 
-def process_open_markets(broker, processed_top20):
-    open_market_stocks = {}
-    closed_market_stocks = {}
-
-    for ticker, data in processed_top20.items():
-        if broker.is_market_open(data['exchange']):
-            open_market_stocks[ticker] = data
+def warm_restart(broker, journal, state):
+    """
+    Resume from the persisted state instead of cancelling everything: restore resolved contracts
+    and reconcile journaled orders and positions against what TWS reports now.
+    """
+    broker.restore_contracts(state['contracts'])
+
+    open_orders = broker.get_open_orders()
+    working = journal.working_orders()
+    executed = {}
+    if any(int(order_id) not in open_orders for order_id in working):
+        executed = broker.get_executed_shares()
+    for order_id, order in working.items():
+        if int(order_id) in open_orders:
+            logger.info(f"Resuming working order {order_id}: {order['symbol']} {order['action']} {order['quantity']}")
+            continue
+        filled = executed.get(int(order_id), 0.0)
+        if filled >= float(order['quantity']):
+            status = 'Filled'
+        else:
+            status = 'Cancelled' if filled else 'Inactive'
+        if order.get('status') == 'PendingSubmit' and not filled:
+            logger.warning(f"Order {order_id} for {order['symbol']} was never confirmed by TWS and is not open")
         else:
-            closed_market_stocks[ticker] = data
+            logger.info(f"Order {order_id} for {order['symbol']} is no longer open: {status} with {filled} shares")
+        journal.record('order_status', {'orderId': int(order_id), 'status': status, 'filled': filled})
 
-    current_prices = get_current_prices(broker, open_market_stocks)
+    # Orders TWS works that the journal missed, e.g. placed just before a crash, are adopted so
+    # the next rebalance does not order those symbols again
+    for order_id, order in open_orders.items():
+        if str(order_id) not in working:
+            logger.warning(f"Adopting open order {order_id} missing from the journal: {order['symbol']} "
+                           f"{order['action']} {order['quantity']}")
+            journal.record('order', dict(order, orderId=order_id, limitPrice=None))
 
-    return current_prices, closed_market_stocks
+    positions = broker.get_positions()
+    previous_positions = state['positions'] or {}
+    for symbol in set(positions) | set(previous_positions):
+        before = float(previous_positions.get(symbol, {}).get('shares', 0))
+        after = float(positions.get(symbol, {}).get('shares', 0))
+        if before != after:
+            logger.info(f"Position change since last run for {symbol}: {before} -> {after}")
+
+    logger.info(f"Warm restart complete with {len(journal.working_orders())} working orders")
 
-def get_unique_markets_and_times(processed_top20, broker):
-    unique_markets = set(data['exchange'] for data in processed_top20.values())
-    market_times = {}
-    for market in unique_markets:
-        next_open = broker.get_next_market_open(market)
-        market_times[market] = next_open
-    return market_times
 
 def main():
+    log_listener = setup_logging(CONFIG)
     logger.info("Starting the TradepostTop20Tracker")
+    clock = SYSTEM_CLOCK
 
     tradepost_api_key = CONFIG.get('tradepost.api_key')
-    if not tradepost_api_key:
+    if CONFIG.get('tradepost.constituents_file'):
+        tradepost = ConstituentFile(CONFIG.get('tradepost.constituents_file'))
+    elif not tradepost_api_key:
         logger.error("Tradepost API key not found in configuration")
+        log_listener.stop()
         return
-
-    tradepost = TradepostAPI(tradepost_api_key)
-    logger.info(f"TradepostAPI initialized: {tradepost}")
+    else:
+        tradepost = TradepostAPI(tradepost_api_key, endpoint=CONFIG.get('tradepost.endpoint', 'top20'))
+    logger.info(f"Constituent source initialized: {tradepost}")
 
     ib_config = CONFIG.get('interactive_brokers')
     if not ib_config:
         logger.error("Interactive Brokers configuration not found")
+        log_listener.stop()
         return
 
-    broker = IBBroker(ib_config['host'], ib_config['port'], ib_config['client_id'], ib_config['api_version'])
-    pm = PortfolioManager(broker, CONFIG)
+    journal = StateJournal(CONFIG.get('state.directory', 'data/state'))
+    state = journal.load()
+    bar_cache = BarCache(CONFIG.get('bar_cache.directory', 'data/bars'), clock=clock)
+    executions = ExecutionStore(CONFIG.get('executions.directory', 'data/executions'), clock=clock)
+    price_table = None
+    if CONFIG.get('price_table.enabled', False):
+        try:
+            price_table = SharedPriceTable(CONFIG.get('price_table.path', 'data/prices.table'))
+        except (OSError, ValueError) as e:
+            logger.warning(f"Shared price table not available, streaming prices directly: {e}")
+    entitlements = EntitlementRegistry(CONFIG.get('entitlements.path', 'data/entitlements.json'),
+                                       max_age=CONFIG.get('entitlements.max_age_hours', 24) * 3600, clock=clock)
+    broker = IBBroker(ib_config['host'], ib_config['port'], ib_config['client_id'], ib_config['api_version'],
+                      bar_cache=bar_cache, journal=journal, executions=executions, price_table=price_table,
+                      price_table_max_age=CONFIG.get('price_table.max_age', 60), entitlements=entitlements,
+                      clock=clock, msg_queue=LaneQueue(max_pending=CONFIG.get('message_queue.max_pending', 100000),
+                                                       overflow=CONFIG.get('message_queue.overflow', 'drop_oldest'),
+                                                       conflate=CONFIG.get('message_queue.conflate_ticks', True),
+                                                       max_lane_wait=CONFIG.get('message_queue.max_lane_wait', 0.5)))
+    fx_rates = FxRates(broker, base_currency=CONFIG.get('trading.base_currency', 'USD'),
+                       max_age=CONFIG.trading.fx_max_age, clock=clock)
+    valuation = ValuationCache(broker, CONFIG.get('interactive_brokers.account'), clock=clock)
+    pretrade = None
+    if CONFIG.get('pretrade.enabled', True):
+        pretrade = PreTradeValidator(broker, timeout=CONFIG.get('pretrade.timeout', 5))
+    pm = PortfolioManager(broker, CONFIG, journal=journal, fx_rates=fx_rates, valuation=valuation,
+                          pretrade=pretrade, clock=clock)
+    warm_up = MarketWarmUp(broker, pm, lead_minutes=CONFIG.get('warm_up.lead_minutes', 10), clock=clock)
+
+    def apply_reloaded_config(config):
+        pm.apply_trading_params(config.trading)
+        fx_rates.max_age = config.trading.fx_max_age
+
+    CONFIG.add_listener(apply_reloaded_config)
+    config_watcher = ConfigWatcher(CONFIG, interval=CONFIG.get('hot_reload.interval', 5))
+    if config_watcher.interval > 0:
+        config_watcher.start()
 
     try:
         logger.info("Attempting to connect to Interactive Brokers")
         broker.connect()
 
-        # Cancel all open orders
-        broker.cancel_all_orders()
-        logger.info("Cancelled all open orders")
-
-        while True:
-            try:
-                if not broker.is_connected():
-                    logger.error("Lost connection to Interactive Brokers. Attempting to reconnect...")
-                    broker.connect()
-
-                logger.info("Fetching Top20 data from Tradepost")
-                top20_data = tradepost.get_top20()
-                logger.info(f"Fetched Top20 data for date: {top20_data['date']}")
+        supervisor = ConnectionSupervisor(
+            broker,
+            heartbeat_interval=CONFIG.get('connection.heartbeat_interval', 10),
+            heartbeat_timeout=CONFIG.get('connection.heartbeat_timeout', 5),
+            max_backoff=CONFIG.get('connection.max_backoff', 60),
+            clock=clock
+        )
+        broker.supervisor = supervisor
+        supervisor.start()
 
-                processed_top20 = process_top20_data(top20_data)
-                logger.debug(f"Processed Top20 data: {processed_top20}")
+        valuation.start()
 
-                if not processed_top20:
-                    logger.warning("No valid stocks in Top20 data. Waiting before retry.")
-                    time.sleep(300)  # Wait for 5 minutes before retrying
-                    continue
-
-                # Get unique markets and their opening times
-                market_times = get_unique_markets_and_times(processed_top20, broker)
-
-                # Display current UTC time
-                logger.info(f"Current UTC time: {datetime.now(pytz.utc).strftime('%Y-%m-%d %H:%M:%S %Z')}")
-
-                # Display markets and their opening times
-                logger.info("Markets to check and their next opening times:")
-                for market, open_time in market_times.items():
-                    logger.info(f"{market}: {open_time.strftime('%Y-%m-%d %H:%M:%S %Z')}")
-
-                all_prices = {}
-                remaining_stocks = processed_top20
-
-                for exchange in market_times.keys():
-                    current_prices, remaining_stocks = process_open_markets(broker, remaining_stocks)
-                    all_prices.update(current_prices)
-
-                    if not remaining_stocks:
-                        break
-
-                    if current_prices:
-                        # Calculate quantities and place orders for the current market
-                        pm.calculate_and_execute_orders(current_prices)
-
-                    if remaining_stocks:
-                        next_market_open = min(broker.get_next_market_open(data['exchange'])
-                                               for data in remaining_stocks.values())
-                        wait_time = (next_market_open - datetime.now(pytz.utc)).total_seconds()
-                        next_market = min(remaining_stocks.values(), key=lambda x: broker.get_next_market_open(x['exchange']))['exchange']
-                        logger.info(f"Current UTC time: {datetime.now(pytz.utc).strftime('%Y-%m-%d %H:%M:%S %Z')}")
-                        logger.info(f"Waiting for {next_market} market to open. Sleep time: {wait_time / 60:.2f} minutes")
-                        time.sleep(min(wait_time, 3600))  # Wait for the calculated time or max 1 hour
-
-                if not all_prices:
-                    logger.warning("No valid prices available. Waiting before retry.")
-                    time.sleep(300)  # Wait for 5 minutes
-                    continue
-
-                logger.debug(f"All prices: {all_prices}")
-
-                valid_top20 = {ticker: data for ticker, data in processed_top20.items() if ticker in all_prices}
-                for ticker, data in valid_top20.items():
-                    data['price'] = all_prices[ticker]
-
-                logger.debug(f"Valid Top20 data with prices: {valid_top20}")
-
-                # After processing all markets, update the portfolio
-                pm.rebalance_portfolio(valid_top20)
-
-                # Wait before the next iteration
-                time.sleep(3600)  # Wait for 1 hour before the next check
+        if CONFIG.get('state.warm_restart', True) and (state['contracts'] or state['orders']):
+            warm_restart(broker, journal, state)
+        else:
+            # Cancel all open orders
+            broker.cancel_all_orders()
+            logger.info("Cancelled all open orders")
 
+        while True:
+            try:
+                clock.sleep(run_iteration(broker, tradepost, pm, warm_up, clock, journal=journal,
+                                          executions=executions))
+            except ConnectionError as e:
+                logger.error(f"Connection error: {e}. Waiting for the connection to be restored.")
+                supervisor.wait_until_connected(timeout=300)
             except Exception as e:
                 logger.error(f"An error occurred: {e}", exc_info=True)
-                time.sleep(300)  # Wait for 5 minutes before retrying
+                clock.sleep(300)  # Wait for 5 minutes before retrying
 
     except KeyboardInterrupt:
         logger.info("Received keyboard interrupt. Shutting down...")
@@ -201,7 +174,12 @@ def main():
         logger.critical(f"Critical error occurred: {e}", exc_info=True)
     finally:
         logger.info("Disconnecting from Interactive Brokers")
+        config_watcher.stop()
         broker.disconnect()
+        executions.flush()
+        entitlements.flush()
+        journal.close()
+        log_listener.stop()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,259 @@
+# message_lanes.py
+
+import logging
+import threading
+import time
+from collections import deque
+
+from utils.import_helper import add_vendor_to_path
+
+add_vendor_to_path()
+from ibapi.message import IN
+
+logger = logging.getLogger(__name__)
+
+ORDER_LANE = 0
+MARKET_DATA_LANE = 1
+BULK_LANE = 2
+LANE_NAMES = ('order', 'market_data', 'bulk')
+
+# Order and error traffic is serviced before anything else
+ORDER_MESSAGE_IDS = frozenset([
+    IN.ORDER_STATUS,
+    IN.ERR_MSG,
+    IN.OPEN_ORDER,
+    IN.OPEN_ORDER_END,
+    IN.NEXT_VALID_ID,
+    IN.EXECUTION_DATA,
+    IN.EXECUTION_DATA_END,
+    IN.COMMISSION_REPORT,
+    IN.CURRENT_TIME,
+    IN.ORDER_BOUND,
+])
+
+MARKET_DATA_MESSAGE_IDS = frozenset([
+    IN.TICK_PRICE,
+    IN.TICK_SIZE,
+    IN.TICK_GENERIC,
+    IN.TICK_STRING,
+    IN.TICK_EFP,
+    IN.TICK_SNAPSHOT_END,
+    IN.TICK_REQ_PARAMS,
+    IN.TICK_BY_TICK,
+    IN.MARKET_DATA_TYPE,
+    IN.PNL,
+    IN.PNL_SINGLE,
+])
+
+# Only the latest of these matters per (reqId, tickType); tick-by-tick data is never conflated
+CONFLATED_MESSAGE_IDS = frozenset([
+    IN.TICK_PRICE,
+    IN.TICK_SIZE,
+])
+
+# Streaming ticks a full queue may discard; a newer one for the same stream follows soon.
+# End markers, market data types and other control messages are never dropped.
+DROPPABLE_MESSAGE_IDS = frozenset([
+    IN.TICK_PRICE,
+    IN.TICK_SIZE,
+    IN.TICK_GENERIC,
+])
+
+OVERFLOW_POLICIES = ('block', 'drop_oldest', 'drop_newest')
+
+
+def message_id(msg):
+    end = msg.find(b"\0")
+    try:
+        return int(msg[:end])
+    except ValueError:
+        return None
+
+
+def classify(msg, msg_id=None):
+    """
+    Return the lane for a raw message by looking only at its leading message id field.
+    """
+    if msg_id is None:
+        msg_id = message_id(msg)
+    if msg_id in ORDER_MESSAGE_IDS:
+        return ORDER_LANE
+    if msg_id in MARKET_DATA_MESSAGE_IDS:
+        return MARKET_DATA_LANE
+    return BULK_LANE
+
+
+def conflation_key(msg):
+    """
+    Return (message id, reqId, tickType) of a tickPrice or tickSize message, whose fields
+    start with the message id, version, reqId and tickType.
+    """
+    fields = msg.split(b"\0", 4)
+    return fields[0], fields[2], fields[3]
+
+
+class LaneQueue:
+    """
+    Drop-in replacement for the EClient message queue that sorts incoming messages into
+    priority lanes. Consumers take batches from the highest-priority non-empty lane, so order
+    acknowledgements never wait behind a historical data or contract details burst. A lane whose
+    oldest message has waited longer than `max_lane_wait` seconds is served ahead of that order
+    (the longest-waiting first), so a steady stream of ticks cannot starve the bulk lane.
+
+    With `conflate`, a tickPrice or tickSize that arrives while an older one for the same
+    (reqId, tickType) is still queued replaces it in place, so a backlog of streams holds at
+    most one pending tick per stream. With `max_pending`, a full queue either blocks the reader
+    thread ('block', pushing back on the socket) or discards the oldest queued or the incoming
+    streaming tick ('drop_oldest', 'drop_newest'). Only tickPrice, tickSize and tickGeneric
+    are ever dropped; for any other message, e.g. a snapshot end or an order status, the
+    reader waits for room instead.
+    """
+
+    def __init__(self, batch_sizes=(16, 64, 32), max_pending=None, overflow='drop_oldest', conflate=True,
+                 max_lane_wait=0.5):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy {overflow!r}, expected one of {OVERFLOW_POLICIES}")
+        self.lanes = [deque() for _ in LANE_NAMES]
+        self.batch_sizes = batch_sizes
+        self.max_pending = max_pending
+        self.overflow = overflow
+        self.conflate = conflate
+        self.max_lane_wait = max_lane_wait
+        self.lock = threading.Lock()
+        self.condition = threading.Condition(self.lock)
+        self.room = threading.Condition(self.lock)
+        self.pending = 0
+        self.queued_ticks = {}
+        self.latency_sum = [0.0] * len(LANE_NAMES)
+        self.latency_max = [0.0] * len(LANE_NAMES)
+        self.delivered = [0] * len(LANE_NAMES)
+        self.conflated = 0
+        self.dropped = 0
+        self.blocked = 0
+        self.aged = 0
+
+    def _full(self):
+        return self.max_pending is not None and self.pending >= self.max_pending
+
+    def _discard(self, entry):
+        if entry[2] is not None and self.queued_ticks.get(entry[2]) is entry:
+            del self.queued_ticks[entry[2]]
+
+    def _drop_oldest(self):
+        """
+        Discard the oldest queued streaming tick. Returns False if none is queued.
+        """
+        market_data = self.lanes[MARKET_DATA_LANE]
+        for index, entry in enumerate(market_data):
+            if message_id(entry[1]) in DROPPABLE_MESSAGE_IDS:
+                del market_data[index]
+                self._discard(entry)
+                self.pending -= 1
+                self.dropped += 1
+                return True
+        return False
+
+    def put(self, msg):
+        msg_id = message_id(msg)
+        lane = classify(msg, msg_id)
+        key = conflation_key(msg) if self.conflate and msg_id in CONFLATED_MESSAGE_IDS else None
+        with self.condition:
+            if key is not None:
+                queued = self.queued_ticks.get(key)
+                if queued is not None:
+                    queued[1] = msg
+                    self.conflated += 1
+                    return
+
+            if self._full():
+                if self.overflow == 'drop_newest' and msg_id in DROPPABLE_MESSAGE_IDS:
+                    self.dropped += 1
+                    return
+                if not (self.overflow == 'drop_oldest' and self._drop_oldest()):
+                    self.blocked += 1
+                    while self._full():
+                        self.room.wait()
+
+            entry = [time.monotonic(), msg, key]
+            if key is not None:
+                self.queued_ticks[key] = entry
+            self.lanes[lane].append(entry)
+            self.pending += 1
+            self.condition.notify()
+
+    def _next_lane(self, now):
+        """
+        Return the lane to serve: the one whose overdue head has waited longest, else the
+        highest-priority non-empty lane, or None if all are empty.
+        """
+        first = next((lane for lane, messages in enumerate(self.lanes) if messages), None)
+        overdue = [(messages[0][0], lane) for lane, messages in enumerate(self.lanes)
+                   if messages and now - messages[0][0] > self.max_lane_wait]
+        if not overdue:
+            return first
+        lane = min(overdue)[1]
+        if lane != first:
+            self.aged += 1
+        return lane
+
+    def get_batch(self, timeout=0.2):
+        """
+        Return up to the lane's batch size of messages from the lane chosen by `_next_lane`,
+        or an empty list if nothing arrived within `timeout` seconds.
+        """
+        with self.condition:
+            if not self.pending:
+                self.condition.wait(timeout)
+            lane = self._next_lane(time.monotonic())
+            if lane is None:
+                return []
+            messages = self.lanes[lane]
+            count = min(len(messages), self.batch_sizes[lane])
+            batch = [messages.popleft() for _ in range(count)]
+            for entry in batch:
+                self._discard(entry)
+            self.pending -= len(batch)
+            self.room.notify_all()
+
+        now = time.monotonic()
+        for enqueued, _, _ in batch:
+            latency = now - enqueued
+            self.latency_sum[lane] += latency
+            if latency > self.latency_max[lane]:
+                self.latency_max[lane] = latency
+        self.delivered[lane] += len(batch)
+        return [msg for _, msg, _ in batch]
+
+    def empty(self):
+        return not self.pending
+
+    def qsize(self):
+        return self.pending
+
+    def stats(self):
+        """
+        Return the conflation and overflow counters.
+        """
+        return {
+            'pending': self.pending,
+            'max_pending': self.max_pending,
+            'conflated': self.conflated,
+            'dropped': self.dropped,
+            'blocked': self.blocked,
+            'aged': self.aged,
+        }
+
+    def latency_stats(self):
+        """
+        Return the number of delivered messages and the mean/max queueing latency per lane.
+        """
+        stats = {}
+        for lane, name in enumerate(LANE_NAMES):
+            delivered = self.delivered[lane]
+            stats[name] = {
+                'delivered': delivered,
+                'pending': len(self.lanes[lane]),
+                'mean_latency_ms': self.latency_sum[lane] / delivered * 1000 if delivered else 0.0,
+                'max_latency_ms': self.latency_max[lane] * 1000,
+            }
+        return stats
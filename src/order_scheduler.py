@@ -0,0 +1,187 @@
+# order_scheduler.py
+
+import logging
+import threading
+from decimal import Decimal, ROUND_DOWN, ROUND_UP
+
+from clock import SYSTEM_CLOCK
+
+logger = logging.getLogger(__name__)
+
+
+class OrderScheduler:
+    """
+    Works a batch of parent orders as child orders interleaved across all symbols.
+
+    Every symbol keeps at most `max_live_per_symbol` children of at most `max_child_size`
+    shares working at a time, and a new child goes out as soon as one completes, so a large
+    order no longer holds up the other symbols. Limit children are priced from the latest
+    streamed quote with the parent's offset, and a limit child that has not filled within
+    `child_timeout` seconds is cancelled and its remainder re-sent at a fresh price, if a
+    newer quote gives a different limit.
+
+    Orders whose market is closed (or whose exchange is unknown) are submitted in full and left
+    working until the open instead of being waited for. Children still live after `timeout`
+    are left working as well; the journal keeps tracking them.
+    """
+
+    DONE_STATUSES = frozenset(['Filled', 'Cancelled', 'ApiCancelled', 'Inactive'])
+
+    def __init__(self, broker, max_child_size=50000, max_live_per_symbol=2, child_timeout=60, timeout=3600,
+                 poll_interval=0.5, clock=SYSTEM_CLOCK):
+        self.broker = broker
+        self.clock = clock
+        self.max_child_size = Decimal(str(max_child_size))
+        self.max_live_per_symbol = max_live_per_symbol
+        self.child_timeout = child_timeout
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.status_changed = threading.Event()
+
+    def configure(self, trading):
+        """
+        Apply trading parameters; a running execute picks them up with its next child order.
+        """
+        self.max_child_size = Decimal(str(trading.max_order_size))
+        self.max_live_per_symbol = trading.max_live_children
+        self.child_timeout = trading.child_timeout
+
+    def on_order_status(self, order_id, status):
+        self.status_changed.set()
+
+    def market_open(self, parent):
+        exchange = parent.get('exchange')
+        if not exchange:
+            return False
+        try:
+            return self.broker.is_market_open(exchange)
+        except Exception as e:
+            logger.warning(f"Could not check whether {exchange} is open for {parent['symbol']}: {e}")
+            return False
+
+    def limit_price(self, parent):
+        """
+        Return the limit for the next child: the parent's offset from its reference price
+        applied to the latest streamed quote, or the parent's own limit without a quote.
+        """
+        if parent['orderType'] != 'LMT':
+            return None
+        latest = self.broker.latest_price(parent['symbol'])
+        if latest is None or not parent.get('price'):
+            return parent.get('limit_price')
+        offset = Decimal(str(parent['limit_price'])) / Decimal(str(parent['price']))
+        rounding = ROUND_DOWN if parent['action'] == 'BUY' else ROUND_UP
+        return (Decimal(str(latest)) * offset).quantize(Decimal('0.01'), rounding=rounding)
+
+    def submit_child(self, parent):
+        quantity = min(parent['remaining'], self.max_child_size)
+        limit_price = self.limit_price(parent)
+        order_id = self.broker.place_order(
+            symbol=parent['symbol'],
+            secType='STK',
+            exchange='SMART',
+            action=parent['action'],
+            quantity=int(quantity),
+            order_type=parent['orderType'],
+            limit_price=float(limit_price) if limit_price is not None else None,
+            intended_price=parent.get('price'),
+            market=parent.get('exchange')
+        )
+        parent['remaining'] -= quantity
+        if order_id is None:
+            logger.error(f"Failed to execute order chunk: {parent['symbol']} {parent['action']} {quantity}. "
+                         f"Order ID is None.")
+            return
+        parent['live'][order_id] = {'quantity': quantity, 'submitted': self.clock.monotonic(), 'repricing': False,
+                                    'limit_price': limit_price}
+        logger.info(f"Executed order chunk: {parent['symbol']} {parent['action']} {quantity} "
+                    f"at {limit_price or parent['orderType']}, Order ID: {order_id}")
+
+    def update_child(self, parent, order_id, child, now):
+        """
+        Fold the child's latest status into its parent. Returns True once the child is done.
+        """
+        status = self.broker.ib.order_statuses.get(order_id)
+        if status is None or status['status'] not in self.DONE_STATUSES:
+            if (parent['orderType'] == 'LMT' and not child['repricing']
+                    and now - child['submitted'] > self.child_timeout):
+                if self.broker.latest_price(parent['symbol']) is None or \
+                        self.limit_price(parent) == child['limit_price']:
+                    # Without a newer quote a re-priced child would go out at the same limit
+                    child['submitted'] = now
+                    return False
+                logger.info(f"Re-pricing order {order_id} for {parent['symbol']} after {self.child_timeout}s")
+                child['repricing'] = True
+                self.broker.cancel_order(order_id)
+            return False
+
+        filled = Decimal(str(status['filled']))
+        parent['filled'] += filled
+        unfilled = child['quantity'] - filled
+        if unfilled > 0:
+            if child['repricing']:
+                parent['remaining'] += unfilled
+            else:
+                logger.warning(f"Order {order_id} for {parent['symbol']} ended {status['status']} "
+                               f"with {unfilled} shares unfilled")
+        return True
+
+    def leave_working(self, parent):
+        """
+        Submit the whole order without waiting for it, e.g. while its market is closed.
+        """
+        while parent['remaining'] > 0:
+            self.submit_child(parent)
+        logger.info(f"Left {parent['action']} {parent['shares']} {parent['symbol']} working: market "
+                    f"{parent.get('exchange') or 'unknown'} is not open")
+
+    def execute(self, orders):
+        """
+        Work the given orders to completion concurrently. Returns {symbol: filled shares}.
+        """
+        parents = []
+        for order in orders:
+            if order['shares'] <= 0:
+                continue
+            parent = dict(order, remaining=Decimal(str(order['shares'])), filled=Decimal('0'), live={})
+            if self.market_open(parent):
+                parents.append(parent)
+            else:
+                self.leave_working(parent)
+        if not parents:
+            return {}
+
+        start = self.clock.monotonic()
+        subscription = self.broker.ib.bus.subscribe('orderStatus', self.on_order_status)
+        try:
+            while True:
+                # Cleared before reading statuses, so an update arriving meanwhile is never missed
+                self.status_changed.clear()
+                now = self.clock.monotonic()
+                for parent in parents:
+                    for order_id, child in list(parent['live'].items()):
+                        if self.update_child(parent, order_id, child, now):
+                            del parent['live'][order_id]
+
+                active = [parent for parent in parents if parent['remaining'] > 0 or parent['live']]
+                if not active:
+                    break
+                if now - start > self.timeout:
+                    live = sum(len(parent['live']) for parent in active)
+                    logger.warning(f"Order scheduler timed out after {self.timeout}s, leaving {live} "
+                                   f"children working")
+                    break
+
+                # Round-robin over symbols, topping each up to its live child limit
+                while any(parent['remaining'] > 0 and len(parent['live']) < self.max_live_per_symbol
+                          for parent in active):
+                    for parent in active:
+                        if parent['remaining'] > 0 and len(parent['live']) < self.max_live_per_symbol:
+                            self.submit_child(parent)
+
+                self.clock.wait(self.status_changed, self.poll_interval)
+        finally:
+            self.broker.ib.bus.unsubscribe(subscription)
+
+        logger.info(f"Worked {len(parents)} orders in {self.clock.monotonic() - start:.2f}s")
+        return {parent['symbol']: parent['filled'] for parent in parents}
@@ -1,95 +1,198 @@
 # portfolio_manager.py
 
 import logging
+import time
 from decimal import Decimal, ROUND_DOWN, InvalidOperation
 
+from order_scheduler import OrderScheduler
+from rebalance_solver import RebalanceSolver
+
 logger = logging.getLogger(__name__)
 
 
 class PortfolioManager:
-    def __init__(self, broker, config):
+    def __init__(self, broker, config, journal=None, fx_rates=None, valuation=None, pretrade=None, clock=None):
         self.broker = broker
-        self.CASH_BUFFER = Decimal(str(config.get('trading.cash_buffer', '50')))
+        self.journal = journal
+        self.fx_rates = fx_rates
+        self.valuation = valuation
+        self.pretrade = pretrade
+        self.exchanges = {}  # Tradepost exchange of every constituent seen, for orders of former constituents
+        self.trading = config.trading
         self.ACCOUNT = config.get('interactive_brokers.account')
-        self.MAX_POSITION_SIZE = Decimal(str(config.get('trading.max_position_size', '0.3')))
-        self.MAX_ORDER_SIZE = config.get('trading.max_order_size', 50000)
         self.SELL_ORDER_CHECK_INTERVAL = 60
         self.SELL_ORDER_TIMEOUT = 3600
+        self.scheduler = OrderScheduler(broker, timeout=self.SELL_ORDER_TIMEOUT, clock=clock or broker.clock)
+        self.scheduler.configure(self.trading)
+
+    def apply_trading_params(self, trading):
+        """
+        Swap in reloaded trading parameters. Calculations already running keep the
+        parameters they started with.
+        """
+        self.trading = trading
+        self.scheduler.configure(trading)
+        logger.info(f"Applied trading parameters: {trading}")
 
     def get_current_portfolio(self):
         try:
             positions = self.broker.get_positions()
             account_summary = self.broker.get_account_summary()
+            if self.fx_rates:
+                self.fx_rates.set_base_currency(account_summary.get('currency'))
 
             portfolio = {
                 'CASH': Decimal(str(account_summary.get('cash', 0)))
             }
 
             for symbol, details in positions.items():
+                # Prefer the live mark over the cost basis
+                mark = self.valuation.get_mark(symbol) if self.valuation else None
                 portfolio[symbol] = {
                     'shares': Decimal(str(details['shares'])),
-                    'price': Decimal(str(details['avgCost']))
+                    'price': Decimal(str(mark if mark is not None else details['avgCost'])),
+                    'currency': details.get('currency')
                 }
 
-            logger.info(f"Current portfolio: {portfolio}")
+            logger.debug("Current portfolio: %s", portfolio)
             return portfolio
         except Exception as e:
             logger.error(f"Error getting current portfolio: {e}")
             raise
 
+    def remember_exchanges(self, stocks):
+        for symbol, details in stocks.items():
+            if details.get('exchange'):
+                self.exchanges[symbol] = details['exchange']
+
+    def fx(self, currency):
+        """
+        Return the base currency value of one unit of `currency` (1 without an FX service).
+        """
+        if self.fx_rates is None:
+            return Decimal('1')
+        return self.fx_rates.to_base(currency)
+
+    def has_fx_rate(self, currency):
+        try:
+            self.fx(currency)
+            return True
+        except ValueError:
+            return False
+
+    def skip_missing_fx(self, current_portfolio, stocks):
+        """
+        Return the portfolio and stocks without the symbols whose currency has no FX rate, so one
+        unquoted currency does not abort the whole plan. Those symbols are neither valued nor traded.
+        """
+        skipped = {symbol for symbol, details in current_portfolio.items()
+                   if symbol != 'CASH' and not self.has_fx_rate(details.get('currency'))}
+        skipped.update(symbol for symbol, details in stocks.items()
+                       if not self.has_fx_rate(self.broker.get_currency(details.get('exchange'))))
+        if not skipped:
+            return current_portfolio, stocks
+        logger.warning(f"Skipping {len(skipped)} symbols without an FX rate: {sorted(skipped)}")
+        return ({symbol: details for symbol, details in current_portfolio.items() if symbol not in skipped},
+                {symbol: details for symbol, details in stocks.items() if symbol not in skipped})
+
+    def refresh_fx_rates(self, current_portfolio, stocks):
+        """
+        Fetch the FX rates for every currency held or targeted in one batch.
+        """
+        if self.fx_rates is None:
+            return
+        currencies = {details.get('currency') for symbol, details in current_portfolio.items() if symbol != 'CASH'}
+        currencies.update(self.broker.get_currency(details['exchange']) for details in stocks.values()
+                          if 'exchange' in details)
+        self.fx_rates.refresh(currencies)
+
     def get_total_portfolio_value(self, portfolio):
         try:
-            return sum(stock['shares'] * stock['price']
+            return sum(stock['shares'] * stock['price'] * self.fx(stock.get('currency'))
                        for symbol, stock in portfolio.items() if symbol != 'CASH') + portfolio['CASH']
         except InvalidOperation as e:
             logger.error(f"Error calculating total portfolio value: {e}")
-            logger.debug(f"Portfolio data: {portfolio}")
+            logger.debug("Portfolio data: %s", portfolio)
             raise
 
+    @staticmethod
+    def target_weights(stocks, symbols):
+        """
+        Return {symbol: weight} for `symbols`, normalized over them. Stocks carry the weight
+        they have in their whole constituent set; stocks without one are weighted equally.
+        """
+        weights = {symbol: Decimal(str(stocks.get(symbol, {}).get('weight') or 1)) for symbol in symbols}
+        total = sum(weights.values())
+        return {symbol: weight / total for symbol, weight in weights.items()}
+
+    @staticmethod
+    def calculate_targets(total_value, new_top20, trading):
+        """
+        Return {symbol: target value in the base currency}. Weights are shares of the whole
+        constituent set, so the targets of constituents without a price stay in cash.
+        """
+        investable = total_value - trading.cash_buffer
+        max_position_value = total_value * trading.max_position_size
+        equal_weight = Decimal('1') / Decimal(len(new_top20) or 1)
+        target_values = {}
+        for symbol, details in new_top20.items():
+            weight = Decimal(str(details['weight'])) if details.get('weight') else equal_weight
+            target_values[symbol] = min(investable * weight, max_position_value)
+        return target_values
+
     def calculate_rebalance_orders(self, current_portfolio, new_top20):
+        trading = self.trading
+        self.remember_exchanges(new_top20)
+        current_portfolio, new_top20 = self.skip_missing_fx(current_portfolio, new_top20)
         try:
             total_value = self.get_total_portfolio_value(current_portfolio)
             cash = current_portfolio['CASH']
-            target_position_value = min((total_value - self.CASH_BUFFER) / Decimal('20'),
-                                        total_value * self.MAX_POSITION_SIZE)
+            target_values = self.calculate_targets(total_value, new_top20, trading)
+            target_position_value = max(target_values.values(), default=Decimal('0'))
 
             sell_orders = []
             buy_orders = []
 
-            logger.debug(f"Current portfolio: {current_portfolio}")
-            logger.debug(f"New top 20: {new_top20}")
-            logger.info(f"Total portfolio value: {total_value}")
-            logger.info(f"Current cash: {cash}")
-            logger.info(f"Target position value: {target_position_value}")
+            logger.debug("Current portfolio: %s", current_portfolio)
+            logger.info("Total portfolio value: %s", total_value)
+            logger.info("Current cash: %s", cash)
+            logger.info("Largest target position value: %s across %d constituents", target_position_value,
+                        len(new_top20))
 
             # Identify stocks to sell (not in new top 20 or exceeding max position size)
             for symbol, details in current_portfolio.items():
                 if symbol != 'CASH':
-                    current_value = details['shares'] * details['price']
+                    base_price = details['price'] * self.fx(details.get('currency'))
+                    current_value = details['shares'] * base_price
                     if symbol not in new_top20:
                         logger.info(f"Selling {symbol} (not in new top 20): {details['shares']} shares")
                         sell_orders.append({
                             'symbol': symbol,
+                            'exchange': self.exchanges.get(symbol),
                             'action': 'SELL',
                             'shares': details['shares'],
-                            'orderType': 'MKT'
+                            'orderType': 'MKT',
+                            'price': details['price']
                         })
-                    elif current_value > target_position_value * self.MAX_POSITION_SIZE:
-                        shares_to_sell = ((current_value - target_position_value * self.MAX_POSITION_SIZE) / details[
-                            'price']).quantize(Decimal('1'), rounding=ROUND_DOWN)
+                    elif current_value > target_values[symbol] * trading.max_position_size:
+                        shares_to_sell = ((current_value - target_values[symbol] * trading.max_position_size) /
+                                          base_price).quantize(Decimal('1'), rounding=ROUND_DOWN)
                         if shares_to_sell > 0:
                             logger.info(
-                                f"Selling excess shares of {symbol}: {shares_to_sell} shares (current value: {current_value}, max allowed: {target_position_value * self.MAX_POSITION_SIZE})")
+                                f"Selling excess shares of {symbol}: {shares_to_sell} shares (current value: {current_value}, max allowed: {target_values[symbol] * trading.max_position_size})")
                             sell_orders.append({
                                 'symbol': symbol,
+                                'exchange': self.exchanges.get(symbol),
                                 'action': 'SELL',
                                 'shares': shares_to_sell,
-                                'orderType': 'MKT'
+                                'orderType': 'MKT',
+                                'price': details['price']
                             })
 
             # Calculate available cash after selling
             cash_after_selling = cash + sum(
-                current_portfolio[order['symbol']]['price'] * order['shares']
+                current_portfolio[order['symbol']]['price'] * order['shares'] *
+                self.fx(current_portfolio[order['symbol']].get('currency'))
                 for order in sell_orders
             )
 
@@ -97,27 +200,31 @@ class PortfolioManager:
 
             for symbol, details in new_top20.items():
                 price = Decimal(str(details['price']))
+                base_price = price * self.fx(self.broker.get_currency(details.get('exchange')))
                 current_shares = current_portfolio.get(symbol, {}).get('shares', Decimal('0'))
-                current_value = current_shares * price
+                current_value = current_shares * base_price
+                target_position_value = target_values[symbol]
 
                 if current_value < target_position_value * Decimal('0.98'):
-                    shares_to_buy = ((target_position_value - current_value) / price).quantize(Decimal('1'),
-                                                                                               rounding=ROUND_DOWN)
+                    shares_to_buy = ((target_position_value - current_value) / base_price).quantize(
+                        Decimal('1'), rounding=ROUND_DOWN)
                     if shares_to_buy > 0:
-                        if cash_after_selling >= price:
-                            actual_shares_to_buy = min(shares_to_buy, cash_after_selling // price)
+                        if cash_after_selling >= base_price:
+                            actual_shares_to_buy = min(shares_to_buy, cash_after_selling // base_price)
                             limit_price = (price * Decimal('1.02')).quantize(Decimal('0.01'),
                                                                              rounding=ROUND_DOWN)  # 2% above current price
                             logger.info(
                                 f"Buying {symbol}: {actual_shares_to_buy} shares at limit price {limit_price} (current price: {price})")
                             buy_orders.append({
                                 'symbol': symbol,
+                                'exchange': self.exchanges.get(symbol),
                                 'action': 'BUY',
                                 'shares': actual_shares_to_buy,
                                 'orderType': 'LMT',
-                                'limit_price': limit_price
+                                'limit_price': limit_price,
+                                'price': price
                             })
-                            cash_after_selling -= actual_shares_to_buy * price
+                            cash_after_selling -= actual_shares_to_buy * base_price
                         else:
                             logger.warning(
                                 f"Not enough cash to buy even one share of {symbol}. Share price: {price}, Available cash: {cash_after_selling}")
@@ -126,109 +233,194 @@ class PortfolioManager:
                         f"Skipping {symbol}. Current value ({current_value}) exceeds 98% of target ({target_position_value * Decimal('0.98')}).")
 
             logger.info(f"Remaining cash after order calculations: {cash_after_selling}")
-            logger.info(f"Sell orders: {sell_orders}")
-            logger.info(f"Buy orders: {buy_orders}")
+            logger.info("Planned %d sell orders and %d buy orders", len(sell_orders), len(buy_orders))
+            logger.debug("Sell orders: %s", sell_orders)
+            logger.debug("Buy orders: %s", buy_orders)
 
             return sell_orders, buy_orders
 
         except InvalidOperation as e:
             logger.error(f"Error in calculate_rebalance_orders: {e}")
-            logger.debug(f"Current portfolio: {current_portfolio}")
-            logger.debug(f"New top 20: {new_top20}")
+            logger.debug("Current portfolio: %s", current_portfolio)
             raise
         except Exception as e:
             logger.error(f"Unexpected error in calculate_rebalance_orders: {e}")
             raise
 
-    def execute_order(self, order):
+    def calculate_solved_orders(self, current_portfolio, new_top20):
+        """
+        Plan the rebalance with the RebalanceSolver: only positions outside their tolerance band
+        are traded, in whole shares, within the cash and the maximum position size.
+        """
+        trading = self.trading
+        self.remember_exchanges(new_top20)
+        current_portfolio, new_top20 = self.skip_missing_fx(current_portfolio, new_top20)
+        total_value = self.get_total_portfolio_value(current_portfolio)
+        target_values = self.calculate_targets(total_value, new_top20, trading)
+
+        holdings = {}
+        prices = {}
+        for symbol, details in current_portfolio.items():
+            if symbol != 'CASH':
+                prices[symbol] = (details['price'], details.get('currency'))
+                holdings[symbol] = {'shares': details['shares']}
+        for symbol, details in new_top20.items():
+            prices[symbol] = (Decimal(str(details['price'])), self.broker.get_currency(details.get('exchange')))
+            holdings.setdefault(symbol, {'shares': Decimal('0')})
+        for symbol, (price, currency) in prices.items():
+            holdings[symbol]['price'] = price * self.fx(currency)
+
+        solver = RebalanceSolver(band=trading.rebalance_band)
+        trades, _ = solver.solve(holdings, target_values, current_portfolio['CASH'] - trading.cash_buffer,
+                                 total_value * trading.max_position_size)
+
+        sell_orders = []
+        buy_orders = []
+        for symbol, shares in trades.items():
+            price = prices[symbol][0]
+            if shares < 0:
+                sell_orders.append({
+                    'symbol': symbol,
+                    'exchange': self.exchanges.get(symbol),
+                    'action': 'SELL',
+                    'shares': -shares,
+                    'orderType': 'MKT',
+                    'price': price
+                })
+            elif shares > 0:
+                buy_orders.append({
+                    'symbol': symbol,
+                    'exchange': self.exchanges.get(symbol),
+                    'action': 'BUY',
+                    'shares': shares,
+                    'orderType': 'LMT',
+                    'limit_price': (price * Decimal('1.02')).quantize(Decimal('0.01'), rounding=ROUND_DOWN),
+                    'price': price
+                })
+        return sell_orders, buy_orders
+
+    def plan_rebalance(self, current_portfolio, new_top20):
+        """
+        Return the (sell_orders, buy_orders) of a rebalance. With the solver enabled, its plan is
+        used and its order count is reported against the per-symbol rules.
+        """
+        rule_orders = self.calculate_rebalance_orders(current_portfolio, new_top20)
+        if not self.trading.rebalance_solver:
+            return rule_orders
+
+        start = time.perf_counter()
+        solved_orders = self.calculate_solved_orders(current_portfolio, new_top20)
+        elapsed = (time.perf_counter() - start) * 1000
+        rule_count = sum(len(orders) for orders in rule_orders)
+        solved_count = sum(len(orders) for orders in solved_orders)
+        logger.info(f"Rebalance solver planned {solved_count} orders instead of {rule_count} "
+                    f"({rule_count - solved_count} fewer) for {len(new_top20)} constituents in {elapsed:.1f}ms")
+        return solved_orders
+
+    def execute_orders(self, orders):
         try:
-            exchange = self.broker.EXCHANGE_MAPPING.get(order['symbol'], ('SMART', 'USD'))[0]
-            next_market_open = self.broker.get_next_market_open(exchange)
-
-            remaining_shares = order['shares']
-            while remaining_shares > 0:
-                chunk_size = min(remaining_shares, self.MAX_ORDER_SIZE)
-
-                order_id = self.broker.place_order(
-                    symbol=order['symbol'],
-                    secType='STK',
-                    exchange='SMART',
-                    action=order['action'],
-                    quantity=int(chunk_size),
-                    order_type=order['orderType']
-                )
-
-                if order_id is not None:
-                    logger.info(
-                        f"Executed order chunk: {order['symbol']} {order['action']} {chunk_size}, Order ID: {order_id}")
-                else:
-                    logger.error(
-                        f"Failed to execute order chunk: {order['symbol']} {order['action']} {chunk_size}. Order ID is None.")
-
-                remaining_shares -= chunk_size
-
-            logger.info(f"Completed execution of order: {order}")
+            filled = self.scheduler.execute(orders)
+            logger.info(f"Completed execution of {len(orders)} orders, filled: {filled}")
         except Exception as e:
-            logger.error(f"Error executing order {order}: {e}", exc_info=True)
+            logger.error(f"Error executing orders {orders}: {e}", exc_info=True)
 
     def rebalance_portfolio(self, new_top20):
         try:
             current_portfolio = self.get_current_portfolio()
-            sell_orders, buy_orders = self.calculate_rebalance_orders(current_portfolio, new_top20)
+            self.refresh_fx_rates(current_portfolio, new_top20)
+            sell_orders, buy_orders = self.plan_rebalance(current_portfolio, new_top20)
+
+            working_symbols = set()
+            if self.journal:
+                working_symbols = {order['symbol'] for order in self.journal.working_orders().values()}
+
+            executable = {}
+            for side, orders in (('sell', sell_orders), ('buy', buy_orders)):
+                executable[side] = []
+                for order in orders:
+                    if order['symbol'] in working_symbols:
+                        logger.info(f"Skipping {side} order for {order['symbol']}: an order is still working")
+                    elif order['shares'] > 0:
+                        executable[side].append(order)
+                    else:
+                        logger.warning(f"Skipping {side} order with zero shares: {order}")
 
-            # Execute sell orders first
-            for order in sell_orders:
-                if order['shares'] > 0:
-                    self.execute_order(order)
-                else:
-                    logger.warning(f"Skipping sell order with zero shares: {order}")
+            if self.pretrade:
+                try:
+                    executable['sell'], executable['buy'] = self.pretrade.adjust(executable['sell'],
+                                                                                 executable['buy'])
+                except Exception as e:
+                    logger.warning(f"Pre-trade check failed, executing the unchecked plan: {e}")
 
-            # Then execute buy orders
-            for order in buy_orders:
-                if order['shares'] > 0:
-                    self.execute_order(order)
-                else:
-                    logger.warning(f"Skipping buy order with zero shares: {order}")
+            if self.journal:
+                self.journal.record('positions', {symbol: {'shares': details['shares'], 'price': details['price']}
+                                                  for symbol, details in current_portfolio.items()
+                                                  if symbol != 'CASH'})
+                self.journal.record('plan', {'sell': executable['sell'], 'buy': executable['buy']})
+
+            # Execute sell orders first, so their proceeds are available for the buys
+            self.execute_orders(executable['sell'])
+            self.execute_orders(executable['buy'])
 
             logger.info("Portfolio rebalancing completed")
         except Exception as e:
             logger.error(f"Error rebalancing portfolio: {e}", exc_info=True)
             raise
 
-    def calculate_and_execute_orders(self, current_prices):
-        try:
-            current_portfolio = self.get_current_portfolio()
-            total_value = self.get_total_portfolio_value(current_portfolio)
-            cash_available = current_portfolio['CASH'] - self.CASH_BUFFER
-
-            target_value_per_stock = min(cash_available / len(current_prices),
-                                         total_value * self.MAX_POSITION_SIZE)
-
-            for symbol, price in current_prices.items():
-                current_shares = current_portfolio.get(symbol, {}).get('shares', Decimal('0'))
-                current_value = current_shares * Decimal(str(price))
-
-                if current_value < target_value_per_stock * Decimal('0.98'):
-                    shares_to_buy = ((target_value_per_stock - current_value) / Decimal(str(price))).quantize(
-                        Decimal('1'),
-                        rounding=ROUND_DOWN)
-                    if shares_to_buy > 0:
-                        order = {
-                            'symbol': symbol,
-                            'action': 'BUY',
-                            'shares': shares_to_buy,
-                            'orderType': 'MKT'
-                        }
-                        self.execute_order(order)
-                        cash_available -= shares_to_buy * Decimal(str(price))
-                    else:
-                        logger.info(
-                            f"No need to buy {symbol}. Current value ({current_value}) is close to target ({target_value_per_stock}).")
+    def calculate_buy_orders(self, current_prices, current_portfolio, stocks=None):
+        stocks = stocks or {}
+        trading = self.trading
+        self.remember_exchanges(stocks)
+        priced = {symbol: stocks.get(symbol, {}) for symbol in current_prices}
+        current_portfolio, priced = self.skip_missing_fx(current_portfolio, priced)
+        current_prices = {symbol: price for symbol, price in current_prices.items() if symbol in priced}
+        total_value = self.get_total_portfolio_value(current_portfolio)
+        cash_available = current_portfolio['CASH'] - trading.cash_buffer
+
+        targets = {symbol: min(cash_available * weight, total_value * trading.max_position_size)
+                   for symbol, weight in self.target_weights(stocks, current_prices).items()}
+
+        orders = []
+        for symbol, price in current_prices.items():
+            target_value_per_stock = targets[symbol]
+            base_price = Decimal(str(price)) * self.fx(self.broker.get_currency(stocks.get(symbol, {}).get('exchange')))
+            current_shares = current_portfolio.get(symbol, {}).get('shares', Decimal('0'))
+            current_value = current_shares * base_price
+
+            if current_value < target_value_per_stock * Decimal('0.98'):
+                shares_to_buy = ((target_value_per_stock - current_value) / base_price).quantize(
+                    Decimal('1'),
+                    rounding=ROUND_DOWN)
+                if shares_to_buy > 0:
+                    orders.append({
+                        'symbol': symbol,
+                        'exchange': self.exchanges.get(symbol),
+                        'action': 'BUY',
+                        'shares': shares_to_buy,
+                        'orderType': 'MKT',
+                        'price': Decimal(str(price))
+                    })
+                    cash_available -= shares_to_buy * base_price
                 else:
                     logger.info(
-                        f"Skipping {symbol}. Current value ({current_value}) exceeds 98% of target ({target_value_per_stock * Decimal('0.98')}).")
-
-            logger.info(f"Remaining cash after order calculations: {cash_available}")
+                        f"No need to buy {symbol}. Current value ({current_value}) is close to target ({target_value_per_stock}).")
+            else:
+                logger.info(
+                    f"Skipping {symbol}. Current value ({current_value}) exceeds 98% of target ({target_value_per_stock * Decimal('0.98')}).")
+
+        logger.info(f"Remaining cash after order calculations: {cash_available}")
+        return orders
+
+    def calculate_and_execute_orders(self, current_prices, current_portfolio=None, stocks=None):
+        """
+        Buy the given stocks up to their target value. A portfolio snapshot taken during the
+        pre-open warm-up can be passed in to skip fetching positions at the open.
+        """
+        try:
+            if current_portfolio is None:
+                current_portfolio = self.get_current_portfolio()
+            self.refresh_fx_rates(current_portfolio, stocks or {})
+            self.execute_orders(self.calculate_buy_orders(current_prices, current_portfolio, stocks))
         except Exception as e:
             logger.error(f"Error calculating and executing orders: {e}", exc_info=True)
             raise
\ No newline at end of file
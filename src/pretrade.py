@@ -0,0 +1,164 @@
+# pretrade.py
+
+import logging
+import threading
+from decimal import Decimal, ROUND_DOWN
+
+from utils.import_helper import add_vendor_to_path
+
+add_vendor_to_path()
+from ibapi.const import UNSET_DOUBLE
+from ibapi.order import Order
+
+logger = logging.getLogger(__name__)
+
+
+class PreTradeValidator:
+    """
+    Checks a whole rebalance plan with concurrent whatIf orders before anything is submitted.
+
+    TWS answers every whatIf order with an OrderState holding its margin and equity impact and
+    its commission, or rejects it with an error (lot size, permissions, buying power). The plan
+    is adjusted in one pass: rejected orders are dropped and the buys are scaled down to fit the
+    available funds including commissions, so they are not rejected one by one after submission.
+    """
+
+    # Errors that reject an order; anything else, e.g. a data farm notice (2174, 10090, 10167),
+    # leaves the whatIf order waiting for its answer
+    REJECT_CODES = frozenset([103, 104, 105, 106, 107, 109, 110, 111, 113, 116, 117, 118, 119, 120, 121,
+                              200, 201, 202, 203, 355, 383, 387, 434, 461])
+
+    def __init__(self, broker, timeout=5):
+        self.broker = broker
+        self.timeout = timeout
+
+    @staticmethod
+    def parse_amount(value):
+        try:
+            amount = float(value)
+        except (TypeError, ValueError):
+            return None
+        if amount == UNSET_DOUBLE or abs(amount) >= 1e300:
+            return None
+        return amount
+
+    def what_if(self, orders):
+        """
+        Send a whatIf order for every planned order at once.
+
+        :return: One dict per order with 'ok', 'error', 'init_margin_change', 'commission',
+                 'equity_with_loan_before', 'init_margin_before' and 'warning'.
+        """
+        self.broker.ensure_connection()
+        results = [{'ok': False, 'error': None} for _ in orders]
+        pending = set()
+        lock = threading.Lock()
+        all_done = threading.Event()
+
+        def finish(order_id):
+            with lock:
+                pending.discard(order_id)
+                if not pending:
+                    all_done.set()
+
+        order_ids = []
+        for index, planned in enumerate(orders):
+            order_id = self.broker.reserve_order_id()
+            order_ids.append(order_id)
+            pending.add(order_id)
+
+            def on_open_order(orderId, contract, order, orderState, result=results[index]):
+                result.update({
+                    'ok': True,
+                    'error': None,
+                    'init_margin_change': self.parse_amount(orderState.initMarginChange),
+                    'init_margin_before': self.parse_amount(orderState.initMarginBefore),
+                    'equity_with_loan_before': self.parse_amount(orderState.equityWithLoanBefore),
+                    'commission': self.parse_amount(orderState.commission) or
+                                  self.parse_amount(orderState.maxCommission) or 0.0,
+                    'warning': orderState.warningText,
+                })
+                finish(orderId)
+
+            def on_error(reqId, errorCode, errorString, result=results[index]):
+                if errorCode in self.REJECT_CODES:
+                    result.update({'ok': False, 'error': f"{errorCode}: {errorString}"})
+                    finish(reqId)
+                else:
+                    logger.info(f"Pre-trade check of order {reqId}: {errorCode} {errorString}")
+
+            self.broker.ib.bus.subscribe('openOrder', on_open_order, req_id=order_id)
+            self.broker.ib.bus.subscribe('error', on_error, req_id=order_id)
+            self.broker.ib.bus.subscribe('connectionClosed', all_done.set, req_id=order_id)
+
+        for order_id, planned in zip(order_ids, orders):
+            contract = self.broker.create_contract(planned['symbol'], 'STK', 'SMART')
+            order = Order()
+            order.action = planned['action']
+            order.totalQuantity = Decimal(int(planned['shares']))
+            order.orderType = planned['orderType']
+            if planned['orderType'] == 'LMT':
+                order.lmtPrice = float(planned['limit_price'])
+            order.whatIf = True
+            self.broker.ib.placeOrder(order_id, contract, order)
+
+        try:
+            if not self.broker.wait_for_event(all_done, self.timeout):
+                logger.warning(f"No whatIf response for {len(pending)} of {len(orders)} orders")
+        finally:
+            for order_id in order_ids:
+                self.broker.ib.bus.release(order_id)
+        return results
+
+    def adjust(self, sell_orders, buy_orders):
+        """
+        Validate the plan and return (sell_orders, buy_orders) adjusted to what TWS accepts.
+        Orders without a whatIf answer are kept as planned.
+        """
+        orders = sell_orders + buy_orders
+        if not orders:
+            return sell_orders, buy_orders
+        results = self.what_if(orders)
+        answered = [result for result in results if result['ok']]
+        checked = dict(zip(map(id, orders), results))
+
+        def accepted(order):
+            result = checked[id(order)]
+            if result['error']:
+                logger.warning(f"Dropping {order['action']} {order['shares']} {order['symbol']}: "
+                               f"rejected by pre-trade check ({result['error']})")
+                return False
+            if result.get('warning'):
+                logger.info(f"Pre-trade warning for {order['symbol']}: {result['warning']}")
+            return True
+
+        sells = [order for order in sell_orders if accepted(order)]
+        buys = [order for order in buy_orders if accepted(order)]
+
+        # Funds that the accepted orders may use: current excess over initial margin plus
+        # the margin the sells release
+        room = None
+        for result in answered:
+            if result['equity_with_loan_before'] is not None and result['init_margin_before'] is not None:
+                room = result['equity_with_loan_before'] - result['init_margin_before']
+                break
+        if room is None or not buys:
+            return sells, buys
+
+        room -= sum((checked[id(order)].get('init_margin_change') or 0.0) for order in sells)
+        room -= sum((checked[id(order)].get('commission') or 0.0) for order in sells + buys)
+        needed = sum((checked[id(order)].get('init_margin_change') or 0.0) for order in buys)
+        if needed <= 0 or needed <= room:
+            logger.info(f"Pre-trade check passed: {len(sells)} sells, {len(buys)} buys within available funds")
+            return sells, buys
+
+        factor = Decimal(str(max(room, 0) / needed))
+        logger.warning(f"Buys need {needed:.2f} but only {room:.2f} is available; scaling them to {factor:.2%}")
+        scaled = []
+        for order in buys:
+            shares = (order['shares'] * factor).quantize(Decimal('1'), rounding=ROUND_DOWN)
+            if shares > 0:
+                scaled.append(dict(order, shares=shares))
+            else:
+                logger.info(f"Dropping buy of {order['symbol']}: nothing left after scaling")
+        return sells, scaled
@@ -0,0 +1,97 @@
+# price_feeder.py
+
+import logging
+import time
+
+from utils.import_helper import add_vendor_to_path
+from utils.logging_setup import setup_logging
+
+add_vendor_to_path()
+
+from config import CONFIG
+from tradepost_api import TradepostAPI
+from constituents import ConstituentFile
+from broker import IBBroker
+from connection_supervisor import ConnectionSupervisor
+from price_table import SharedPriceTable
+from trading_loop import process_top20_data
+
+logger = logging.getLogger(__name__)
+
+
+def update_streams(broker, stocks):
+    """
+    Stream every stock into the shared price table and stop streams for stocks no longer wanted.
+    """
+    for ticker in set(broker.price_streams) - set(stocks):
+        logger.info(f"Stopping price stream for {ticker}")
+        broker.stop_price_stream(ticker)
+
+    for ticker, data in stocks.items():
+        try:
+            contract = broker.get_contract(data['isin'], ticker, data['exchange'], data['name'])
+            broker.stream_price(ticker, contract)
+        except Exception as e:
+            logger.warning(f"Could not stream {ticker} ({data['name']}): {e}")
+
+
+def main():
+    """
+    Feeder process that owns the market data streams for every tracker process on this host:
+    its own Top20 plus every symbol the trackers requested.
+    """
+    log_listener = setup_logging(CONFIG)
+    logger.info("Starting the shared price feeder")
+
+    ib_config = CONFIG.get('interactive_brokers')
+    table = SharedPriceTable(CONFIG.get('price_table.path', 'data/prices.table'),
+                             capacity=CONFIG.get('price_table.capacity', 256), writable=True)
+    broker = IBBroker(ib_config['host'], ib_config['port'], CONFIG.get('price_table.feeder_client_id', 90),
+                      ib_config['api_version'], price_table=table)
+    if CONFIG.get('tradepost.constituents_file'):
+        tradepost = ConstituentFile(CONFIG.get('tradepost.constituents_file'))
+    else:
+        tradepost = TradepostAPI(CONFIG.get('tradepost.api_key'), endpoint=CONFIG.get('tradepost.endpoint', 'top20'))
+
+    try:
+        broker.connect()
+        supervisor = ConnectionSupervisor(
+            broker,
+            heartbeat_interval=CONFIG.get('connection.heartbeat_interval', 10),
+            heartbeat_timeout=CONFIG.get('connection.heartbeat_timeout', 5),
+            max_backoff=CONFIG.get('connection.max_backoff', 60)
+        )
+        broker.supervisor = supervisor
+        supervisor.start()
+
+        request_interval = CONFIG.get('price_table.request_interval', 60)
+        stocks = {}
+        fetched = None
+        while True:
+            try:
+                broker.ensure_connection()
+                if fetched is None or time.monotonic() - fetched > 3600:  # The Top20 changes at most daily
+                    stocks = process_top20_data(tradepost.get_top20())
+                    fetched = time.monotonic()
+                # Trackers following other indices request their symbols through the table
+                requested = table.requested_symbols(max_age=3 * 3600)
+                update_streams(broker, dict(requested, **stocks))
+                logger.info(f"Feeding {len(broker.price_streams)} price streams into {table.path}")
+                time.sleep(request_interval)
+            except ConnectionError as e:
+                logger.error(f"Connection error: {e}. Waiting for the connection to be restored.")
+                supervisor.wait_until_connected(timeout=300)
+            except Exception as e:
+                logger.error(f"An error occurred: {e}", exc_info=True)
+                time.sleep(300)
+
+    except KeyboardInterrupt:
+        logger.info("Received keyboard interrupt. Shutting down...")
+    finally:
+        broker.disconnect()
+        table.close()
+        log_listener.stop()
+
+
+if __name__ == "__main__":
+    main()
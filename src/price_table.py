@@ -0,0 +1,246 @@
+# price_table.py
+
+import json
+import logging
+import os
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class SharedPriceTable:
+    """
+    Memory-mapped table of contracts and latest prices shared by several processes on one host.
+
+    A single feeder process owns the market data streams and writes the table; tracker
+    processes map the same file read-only and read quotes with plain memory loads, without
+    syscalls or TWS subscriptions of their own. Every slot is protected by a seqlock: the
+    writer makes the sequence number odd while it updates the slot and even again when done,
+    and a reader retries until it copied the slot between two equal, even sequence numbers,
+    yielding to a writer that was preempted mid-update; a slot that stays busy longer than
+    READ_TIMEOUT reads as unknown instead of failing the caller. Slots are assigned
+    append-only and the slot count is published after the slot is written, so readers can
+    index symbols and conIds without any locking.
+
+    Trackers following different indices ask the feeder for their symbols with
+    request_symbols; the feeder streams the union of its own list and every request.
+    """
+
+    MAGIC = 0x5450505443453031  # "TPPTCE01"
+    HEADER_DTYPE = np.dtype([
+        ('magic', '<u8'),
+        ('capacity', '<u4'),
+        ('count', '<u4'),
+    ])
+    SLOT_DTYPE = np.dtype([
+        ('seq', '<u8'),
+        ('con_id', '<i8'),
+        ('symbol', 'S16'),
+        ('sec_type', 'S8'),
+        ('exchange', 'S16'),
+        ('primary_exchange', 'S16'),
+        ('currency', 'S8'),
+        ('local_symbol', 'S24'),
+        ('price', '<f8'),
+        ('updated', '<f8'),
+    ])
+    CONTRACT_FIELDS = {
+        'conId': 'con_id',
+        'symbol': 'symbol',
+        'secType': 'sec_type',
+        'exchange': 'exchange',
+        'primaryExchange': 'primary_exchange',
+        'currency': 'currency',
+        'localSymbol': 'local_symbol',
+    }
+    READ_SPINS = 100  # Busy retries before yielding to the writer
+    READ_TIMEOUT = 0.1
+
+    def __init__(self, path, capacity=256, writable=False):
+        self.path = path
+        self.writable = writable
+        if writable and not os.path.exists(path):
+            self._create(path, capacity)
+
+        mode = 'r+' if writable else 'r'
+        self.header = np.memmap(path, dtype=self.HEADER_DTYPE, mode=mode, shape=(1,))
+        if int(self.header['magic'][0]) != self.MAGIC:
+            raise ValueError(f"{path} is not a shared price table")
+        self.capacity = int(self.header['capacity'][0])
+        self.slots = np.memmap(path, dtype=self.SLOT_DTYPE, mode=mode, offset=self.HEADER_DTYPE.itemsize,
+                               shape=(self.capacity,))
+        self.symbols = {}
+        self.con_ids = {}
+        self.indexed = 0
+        self._index()
+        logger.info(f"Attached {'writable' if writable else 'read-only'} price table {path} "
+                    f"with {self.indexed}/{self.capacity} slots")
+
+    def _create(self, path, capacity):
+        # Build the file aside and rename it, so readers never map a half-initialized table
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        header = np.zeros(1, dtype=self.HEADER_DTYPE)
+        header['magic'] = self.MAGIC
+        header['capacity'] = capacity
+        with open(tmp_path, 'wb') as file:
+            file.write(header.tobytes())
+            file.write(np.zeros(capacity, dtype=self.SLOT_DTYPE).tobytes())
+        os.replace(tmp_path, path)
+
+    def _index(self):
+        count = int(self.header['count'][0])
+        for slot in range(self.indexed, count):
+            row = self._read(slot)
+            if row is None:
+                return  # Indexed on a later lookup
+            self.symbols[row['symbol'].decode()] = slot
+            if row['con_id']:
+                self.con_ids[int(row['con_id'])] = slot
+            self.indexed = slot + 1
+
+    def _slot(self, symbol=None, con_id=None):
+        index = self.symbols if symbol is not None else self.con_ids
+        key = symbol if symbol is not None else con_id
+        slot = index.get(key)
+        if slot is None and int(self.header['count'][0]) > self.indexed:
+            self._index()
+            slot = index.get(key)
+        return slot
+
+    def _read(self, slot):
+        """
+        Return a consistent copy of a slot, or None if the writer kept it busy for READ_TIMEOUT.
+        """
+        seq = self.slots['seq']
+        spins = 0
+        deadline = None
+        while True:
+            before = int(seq[slot])
+            if not before & 1:
+                row = self.slots[slot:slot + 1].copy()[0]
+                if int(seq[slot]) == before:
+                    return row
+            spins += 1
+            if spins >= self.READ_SPINS:
+                now = time.monotonic()
+                if deadline is None:
+                    deadline = now + self.READ_TIMEOUT
+                elif now > deadline:
+                    logger.warning(f"Price table slot {slot} stayed busy for {self.READ_TIMEOUT}s, skipping it")
+                    return None
+                time.sleep(0)  # Let a preempted writer finish
+
+    def _write(self, slot, **fields):
+        seq = int(self.slots['seq'][slot])
+        self.slots['seq'][slot] = seq + 1
+        for name, value in fields.items():
+            self.slots[name][slot] = value
+        self.slots['seq'][slot] = seq + 2
+
+    # Writer
+
+    def publish_contract(self, symbol, contract):
+        """
+        Store a resolved contract, assigning the symbol a slot on first use.
+        """
+        fields = {column: str(getattr(contract, field) or '').encode()
+                  for field, column in self.CONTRACT_FIELDS.items() if field != 'conId'}
+        fields['con_id'] = contract.conId
+        fields['symbol'] = symbol.encode()
+
+        slot = self.symbols.get(symbol)
+        if slot is None:
+            slot = int(self.header['count'][0])
+            if slot >= self.capacity:
+                raise ValueError(f"Price table {self.path} is full ({self.capacity} slots)")
+            self._write(slot, price=np.nan, updated=0.0, **fields)
+            self.header['count'][0] = slot + 1
+            self.symbols[symbol] = slot
+            self.indexed = slot + 1
+        else:
+            self._write(slot, **fields)
+        self.con_ids[contract.conId] = slot
+
+    def publish_price(self, symbol, price):
+        slot = self.symbols.get(symbol)
+        if slot is None:
+            return
+        self._write(slot, price=price, updated=time.time())
+
+    # Reader
+
+    def get_price(self, symbol, max_age=None):
+        """
+        Return the latest price for a symbol, or None if it is unknown or older than max_age seconds.
+        """
+        slot = self._slot(symbol=symbol)
+        if slot is None:
+            return None
+        row = self._read(slot)
+        if row is None or np.isnan(row['price']) or (max_age is not None and time.time() - row['updated'] > max_age):
+            return None
+        return float(row['price'])
+
+    def get_contract(self, symbol=None, con_id=None):
+        """
+        Return the contract fields (as in IBBroker.contract_to_dict) stored for a symbol or conId.
+        """
+        slot = self._slot(symbol=symbol, con_id=con_id)
+        if slot is None:
+            return None
+        row = self._read(slot)
+        if row is None:
+            return None
+        data = {field: row[column].decode() for field, column in self.CONTRACT_FIELDS.items() if field != 'conId'}
+        data['conId'] = int(row['con_id'])
+        return data
+
+    # Symbol requests
+
+    def _requests_dir(self):
+        return f"{self.path}.requests"
+
+    def request_symbols(self, name, stocks):
+        """
+        Ask the feeder to stream `stocks` ({ticker: {'isin', 'exchange', 'name'}}) on behalf
+        of the tracker `name`, replacing its previous request.
+        """
+        directory = self._requests_dir()
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{name}.json")
+        requested = {ticker: {key: data.get(key) for key in ('isin', 'exchange', 'name')}
+                     for ticker, data in stocks.items()}
+        with open(f"{path}.tmp", 'w') as file:
+            json.dump(requested, file)
+        os.replace(f"{path}.tmp", path)
+
+    def requested_symbols(self, max_age=None):
+        """
+        Return the union of the trackers' requests; requests not renewed within max_age
+        seconds belong to trackers that stopped and are ignored.
+        """
+        directory = self._requests_dir()
+        if not os.path.isdir(directory):
+            return {}
+        stocks = {}
+        now = time.time()
+        for file_name in sorted(os.listdir(directory)):
+            if not file_name.endswith('.json'):
+                continue
+            path = os.path.join(directory, file_name)
+            try:
+                if max_age is not None and now - os.path.getmtime(path) > max_age:
+                    continue
+                with open(path, 'r') as file:
+                    stocks.update(json.load(file))
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring price table request {path}: {e}")
+        return stocks
+
+    def close(self):
+        if self.writable:
+            self.slots.flush()
+            self.header.flush()
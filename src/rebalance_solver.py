@@ -0,0 +1,115 @@
+# rebalance_solver.py
+
+import logging
+from decimal import Decimal, ROUND_CEILING, ROUND_FLOOR
+
+logger = logging.getLogger(__name__)
+
+
+def whole_shares(value, price, rounding):
+    return (value / price).quantize(Decimal('1'), rounding=rounding)
+
+
+class RebalanceSolver:
+    """
+    Finds few orders that bring every position within a tolerance band around its target.
+
+    A position is only traded when it leaves its band (target * (1 +/- band)), when it exceeds
+    the maximum position value or when it left the index; a traded position goes back to its
+    target, so it does not leave the band again after the next small move. Buys are funded by
+    the cash and the sells; if that is not enough for every position below its band, positions
+    above their target are trimmed to it, largest excess first, and the most underweight
+    positions are bought first. All quantities are whole shares.
+    """
+
+    def __init__(self, band=Decimal('0.1')):
+        self.band = band
+
+    def solve(self, holdings, targets, cash, max_position_value):
+        """
+        :param holdings: {symbol: {'shares': Decimal, 'price': Decimal}} with prices in the base currency,
+                         for every held and every targeted symbol.
+        :param targets: {symbol: target value in the base currency}; held symbols without one are sold.
+        :param cash: Cash available for buys, after any buffer.
+        :return: ({symbol: signed number of shares to trade}, [symbols left outside their band]).
+        """
+        trades = {}
+        unresolved = []
+
+        for symbol, holding in holdings.items():
+            shares, price = holding['shares'], holding['price']
+            if shares <= 0 or price <= 0:
+                continue
+            value = shares * price
+            target = targets.get(symbol)
+            if target is None:
+                trades[symbol] = -shares
+                cash += value
+                continue
+            upper = min(target * (1 + self.band), max_position_value)
+            if value > upper:
+                sell = min(whole_shares(value - min(target, upper), price, ROUND_CEILING), shares)
+                trades[symbol] = -sell
+                cash += sell * price
+
+        needs = []
+        for symbol, target in targets.items():
+            holding = holdings.get(symbol)
+            if symbol in trades or not holding or holding['price'] <= 0:
+                continue
+            price = holding['price']
+            value = max(holding['shares'], Decimal('0')) * price
+            lower = target * (1 - self.band)
+            if value >= lower:
+                continue
+            desired = whole_shares(min(target, max_position_value) - value, price, ROUND_FLOOR)
+            if desired <= 0:
+                unresolved.append(symbol)  # One share would overshoot the target
+                continue
+            minimum = min(whole_shares(lower - value, price, ROUND_CEILING), desired)
+            needs.append(((target - value) / target, symbol, price, minimum, desired))
+
+        if sum(desired * price for _, _, price, _, desired in needs) <= cash:
+            trades.update((symbol, desired) for _, symbol, _, _, desired in needs)
+        else:
+            self._allocate(holdings, targets, cash, needs, trades, unresolved)
+
+        if unresolved:
+            logger.info(f"{len(unresolved)} positions stay outside their band: {unresolved}")
+        return trades, unresolved
+
+    @staticmethod
+    def _allocate(holdings, targets, cash, needs, trades, unresolved):
+        """
+        Fit the buys into the available cash, trimming positions above their target if needed.
+        """
+        shortfall = sum(minimum * price for _, _, price, minimum, _ in needs) - cash
+        if shortfall > 0:
+            excess = sorted(((holding['shares'] * holding['price'] - targets[symbol], symbol)
+                             for symbol, holding in holdings.items()
+                             if symbol in targets and symbol not in trades and holding['price'] > 0 and
+                             holding['shares'] * holding['price'] > targets[symbol]), reverse=True)
+            for excess_value, symbol in excess:
+                if shortfall <= 0:
+                    break
+                price = holdings[symbol]['price']
+                sell = whole_shares(excess_value, price, ROUND_FLOOR)
+                if sell > 0:
+                    trades[symbol] = -sell
+                    cash += sell * price
+                    shortfall -= sell * price
+
+        needs.sort(reverse=True)
+        bought = []
+        for _, symbol, price, minimum, desired in needs:
+            if minimum * price <= cash:
+                trades[symbol] = minimum
+                cash -= minimum * price
+                bought.append((symbol, price, desired))
+            else:
+                unresolved.append(symbol)
+        for symbol, price, desired in bought:
+            extra = min(desired - trades[symbol], whole_shares(cash, price, ROUND_FLOOR))
+            if extra > 0:
+                trades[symbol] += extra
+                cash -= extra * price
@@ -0,0 +1,132 @@
+# request_store.py
+
+import logging
+import threading
+from collections import OrderedDict
+
+from clock import SYSTEM_CLOCK
+
+logger = logging.getLogger(__name__)
+
+
+class RequestResult:
+    def __init__(self, created):
+        self.items = []
+        self.event = threading.Event()
+        self.created = created
+        self.completed = False
+        self.error = None
+
+
+class RequestStore:
+    """
+    Request-scoped storage for callback results keyed by reqId.
+
+    A consumer opens an entry before sending the request, the callbacks add items and mark it
+    complete (or failed), and the consumer takes the items, which releases the entry. An entry
+    still in the store may have a waiter, so it is only evicted once it is older than `max_age`
+    seconds, far beyond any request timeout, and memory stays flat however many requests are
+    made. More than `max_entries` live entries point at a leak and are logged, not evicted.
+    """
+
+    def __init__(self, name, max_entries=100, max_age=600, clock=SYSTEM_CLOCK):
+        self.name = name
+        self.clock = clock
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.opened = 0
+        self.released = 0
+        self.evicted = 0
+        self.dropped_items = 0
+
+    def open(self, req_id):
+        with self.lock:
+            self._evict()
+            entry = RequestResult(self.clock.monotonic())
+            self.entries[req_id] = entry
+            self.opened += 1
+            return entry
+
+    def _evict(self):
+        now = self.clock.monotonic()
+        while self.entries:
+            req_id, entry = next(iter(self.entries.items()))
+            if now - entry.created < self.max_age:
+                break
+            del self.entries[req_id]
+            entry.error = entry.error or "Evicted from request store"
+            entry.event.set()
+            self.evicted += 1
+            logger.debug("Evicted %s result for reqId %s", self.name, req_id)
+        if len(self.entries) >= self.max_entries:
+            logger.warning("%d %s requests are still open", len(self.entries), self.name)
+
+    def add(self, req_id, item):
+        with self.lock:
+            entry = self.entries.get(req_id)
+            if entry is None:
+                self.dropped_items += 1
+                return
+            entry.items.append(item)
+
+    def complete(self, req_id):
+        with self.lock:
+            entry = self.entries.get(req_id)
+        if entry is not None:
+            entry.completed = True
+            entry.event.set()
+
+    def fail(self, req_id, error):
+        with self.lock:
+            entry = self.entries.get(req_id)
+        if entry is not None:
+            entry.error = error
+            entry.event.set()
+            return True
+        return False
+
+    def fail_all(self, error):
+        with self.lock:
+            entries = list(self.entries.values())
+        for entry in entries:
+            entry.error = error
+            entry.event.set()
+
+    def __contains__(self, req_id):
+        with self.lock:
+            return req_id in self.entries
+
+    def take(self, req_id):
+        """
+        Release the entry for a reqId and return its items.
+
+        :raises ValueError: If the request failed or was never opened.
+        """
+        with self.lock:
+            entry = self.entries.pop(req_id, None)
+            if entry is not None:
+                self.released += 1
+        if entry is None:
+            raise ValueError(f"No {self.name} result for reqId {req_id}")
+        if entry.error:
+            raise ValueError(f"{self.name} request {req_id} failed: {entry.error}")
+        return entry.items
+
+    def release(self, req_id):
+        with self.lock:
+            if self.entries.pop(req_id, None) is not None:
+                self.released += 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                'name': self.name,
+                'entries': len(self.entries),
+                'items': sum(len(entry.items) for entry in self.entries.values()),
+                'opened': self.opened,
+                'released': self.released,
+                'evicted': self.evicted,
+                'dropped_items': self.dropped_items,
+            }
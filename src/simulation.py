@@ -0,0 +1,271 @@
+# simulation.py
+
+import argparse
+import json
+import logging
+import math
+import random
+import time
+import zlib
+from datetime import datetime, timedelta
+
+from utils.import_helper import add_vendor_to_path
+
+add_vendor_to_path()
+
+from broker import IBBroker
+from clock import VirtualClock
+from portfolio_manager import PortfolioManager
+from trading_loop import run_iteration
+from trading_params import TradingParams
+from warm_up import MarketWarmUp
+
+logger = logging.getLogger(__name__)
+
+# Constituents spread over several time zones, used when no Top20 file is given
+SAMPLE_CONSTITUENTS = [
+    {'ticker': 'AAPL', 'isin': 'US0378331005', 'exchange': 'US', 'name': 'Apple Inc', 'rank': 1},
+    {'ticker': 'MSFT', 'isin': 'US5949181045', 'exchange': 'US', 'name': 'Microsoft Corp', 'rank': 2},
+    {'ticker': 'SHEL', 'isin': 'GB00BP6MXD84', 'exchange': 'LSE', 'name': 'Shell plc', 'rank': 3},
+    {'ticker': 'SAP', 'isin': 'DE0007164600', 'exchange': 'F', 'name': 'SAP SE', 'rank': 4},
+    {'ticker': '005930', 'isin': 'KR7005930003', 'exchange': 'KO', 'name': 'Samsung Electronics', 'rank': 5},
+]
+
+
+class SimulationConfig:
+    """
+    Minimal stand-in for Config, so a simulation does not need a config.yaml.
+    """
+
+    def __init__(self, values=None):
+        self.values = {
+            'trading.cash_buffer': 50,
+            'trading.max_position_size': 0.5,
+            'interactive_brokers.account': 'SIMULATED',
+        }
+        self.values.update(values or {})
+        self.trading = TradingParams.from_config(self)
+
+    def get(self, key, default=None):
+        return self.values.get(key, default)
+
+
+class SimulatedTradepost:
+    """
+    Serves Top20 snapshots by virtual date: the latest snapshot dated on or before today.
+    """
+
+    def __init__(self, clock, snapshots):
+        self.clock = clock
+        self.snapshots = sorted(snapshots.items())
+
+    def get_top20(self, date=None):
+        today = date or self.clock.now().strftime('%Y-%m-%d')
+        current = [constituents for day, constituents in self.snapshots if day <= today]
+        return {'date': today, 'constituents': current[-1] if current else self.snapshots[0][1]}
+
+
+class SimulatedBroker(IBBroker):
+    """
+    IBBroker without a TWS connection. Market calendars are the real ones evaluated at the
+    virtual time, prices follow a seeded daily random walk, and orders fill at once against
+    a simulated account (limit orders only while the price is within the limit). All
+    currencies are converted at parity.
+    """
+
+    def __init__(self, clock, prices=None, cash=100000.0, currency='USD', seed=0, volatility=0.01,
+                 slippage=0.0005):
+        super().__init__('simulated', 0, 0, 0, clock=clock)
+        self.base_prices = dict(prices or {})
+        self.cash = cash
+        self.currency = currency
+        self.rng = random.Random(seed)
+        self.volatility = volatility
+        self.slippage = slippage
+        self.price_paths = {}
+        self.holdings = {}
+        self.working_orders = {}
+        self.orders = []
+        self.next_order_id = 1
+
+    def price(self, symbol):
+        today = self.clock.now().date()
+        day, price = self.price_paths.get(symbol) or (today, self.base_prices.get(symbol, 10 + zlib.crc32(
+            symbol.encode()) % 490))
+        while day < today:
+            price *= math.exp(self.rng.gauss(0, self.volatility))
+            day += timedelta(days=1)
+        self.price_paths[symbol] = (day, price)
+        return round(price, 2)
+
+    # Connection
+
+    def connect(self):
+        self.ib.connected.set()
+
+    def disconnect(self):
+        pass
+
+    def is_connected(self):
+        return True
+
+    def ensure_connection(self, timeout=60):
+        pass
+
+    def ping(self, timeout=10):
+        return int(self.clock.time())
+
+    # Contracts and prices
+
+    def resolve_contract(self, req_id, isin, symbol, exchange, name):
+        if symbol not in self.resolved_contracts:
+            contract = self.create_contract(symbol, "STK", exchange)
+            contract.conId = zlib.crc32(symbol.encode())
+            self.resolved_contracts[symbol] = contract
+        return self.resolved_contracts[symbol]
+
+    def get_contract(self, isin, symbol, exchange, name):
+        return self.resolve_contract(None, isin, symbol, exchange, name)
+
+    def get_market_price(self, isin, symbol, exchange, name):
+        return self.price(symbol)
+
+    def stream_price(self, symbol, contract):
+        self.price_streams[symbol] = None
+        self.latest_prices[symbol] = self.price(symbol)
+
+    def stop_price_stream(self, symbol):
+        self.price_streams.pop(symbol, None)
+        self.latest_prices.pop(symbol, None)
+
+    def latest_price(self, symbol):
+        if symbol in self.latest_prices:
+            self.latest_prices[symbol] = self.price(symbol)
+        return self.latest_prices.get(symbol)
+
+    def get_snapshot_prices(self, contracts, timeout=5):
+        return [1.0 for _ in contracts]
+
+    # Account and orders
+
+    def get_account_summary(self):
+        value = sum(holding['shares'] * self.price(symbol) for symbol, holding in self.holdings.items())
+        return {'cash': self.cash, 'currency': self.currency, 'net_liquidation': self.cash + value}
+
+    def get_positions(self):
+        return {symbol: dict(holding) for symbol, holding in self.holdings.items() if holding['shares']}
+
+    def get_open_orders(self):
+        return {order_id: order for order_id, order in self.working_orders.items()}
+
+    def report_status(self, order_id, status, filled, remaining, avg_fill_price):
+        self.ib.order_statuses[order_id] = {
+            "status": status,
+            "filled": float(filled),
+            "remaining": float(remaining),
+            "avgFillPrice": avg_fill_price
+        }
+        self.ib.bus.publish('orderStatus', order_id, self.ib.order_statuses[order_id])
+
+    def place_order(self, symbol, secType, exchange, action, quantity, order_type="MKT", limit_price=None,
+                    stop_price=None, tif="DAY", intended_price=None, market=None):
+        order_id = self.next_order_id
+        self.next_order_id += 1
+        side = 1 if action == 'BUY' else -1
+        price = round(self.price(symbol) * (1 + side * self.slippage), 2)
+        order = {'symbol': symbol, 'action': action, 'quantity': float(quantity), 'orderType': order_type,
+                 'limitPrice': limit_price, 'time': self.clock.now()}
+        self.orders.append(order)
+
+        if order_type == "LMT" and limit_price is not None and side * (price - limit_price) > 0:
+            self.working_orders[order_id] = order
+            self.report_status(order_id, "Submitted", 0, quantity, 0.0)
+            return order_id
+
+        holding = self.holdings.setdefault(symbol, {'shares': 0.0, 'avgCost': 0.0,
+                                                    'currency': self.get_currency(exchange)})
+        shares = holding['shares'] + side * float(quantity)
+        if side > 0 and shares:
+            holding['avgCost'] = (holding['shares'] * holding['avgCost'] + float(quantity) * price) / shares
+        holding['shares'] = shares
+        self.cash -= side * float(quantity) * price
+        order['fillPrice'] = price
+        self.report_status(order_id, "Filled", quantity, 0, price)
+        return order_id
+
+    def cancel_order(self, order_id):
+        order = self.working_orders.pop(order_id, None)
+        if order is not None:
+            self.report_status(order_id, "Cancelled", 0, order['quantity'], 0.0)
+
+    def cancel_all_orders(self):
+        for order_id in list(self.working_orders):
+            self.cancel_order(order_id)
+
+
+class Simulation:
+    """
+    Runs the main loop against a SimulatedBroker on a VirtualClock. Every wait in the loop
+    (market opens, warm-ups, the hourly pause) advances virtual time instantly, so a
+    multi-day, multi-exchange scenario finishes in a fraction of a second and, for a given
+    seed, always produces the same orders.
+    """
+
+    def __init__(self, snapshots, start, cash=100000.0, seed=0, prices=None, config=None, lead_minutes=10):
+        self.clock = VirtualClock(start)
+        self.broker = SimulatedBroker(self.clock, prices=prices, cash=cash, seed=seed)
+        self.tradepost = SimulatedTradepost(self.clock, snapshots)
+        self.pm = PortfolioManager(self.broker, config or SimulationConfig(), clock=self.clock)
+        self.warm_up = MarketWarmUp(self.broker, self.pm, lead_minutes=lead_minutes, price_wait=0, clock=self.clock)
+
+    def run(self, days):
+        end = self.clock.now() + timedelta(days=days)
+        iterations = 0
+        started = time.perf_counter()
+        while self.clock.now() < end:
+            try:
+                wait = run_iteration(self.broker, self.tradepost, self.pm, self.warm_up, self.clock)
+            except Exception as e:
+                logger.error(f"Simulated iteration failed: {e}", exc_info=True)
+                wait = 300
+            self.clock.sleep(wait)
+            iterations += 1
+
+        summary = self.broker.get_account_summary()
+        return {
+            'virtual_days': days,
+            'wall_seconds': round(time.perf_counter() - started, 3),
+            'iterations': iterations,
+            'orders': len(self.broker.orders),
+            'filled_orders': sum(1 for order in self.broker.orders if 'fillPrice' in order),
+            'cash': round(summary['cash'], 2),
+            'net_liquidation': round(summary['net_liquidation'], 2),
+            'positions': {symbol: holding['shares'] for symbol, holding in self.broker.get_positions().items()},
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the trading loop against a simulated broker in virtual time")
+    parser.add_argument('--start', default='2024-01-08', help="Virtual start date (UTC, YYYY-MM-DD)")
+    parser.add_argument('--days', type=float, default=7, help="Virtual days to simulate")
+    parser.add_argument('--cash', type=float, default=100000.0, help="Starting cash")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the simulated price paths")
+    parser.add_argument('--top20', metavar='PATH',
+                        help="JSON file mapping YYYY-MM-DD to a list of Top20 constituents")
+    parser.add_argument('--log-level', default='WARNING')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log_level, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    if args.top20:
+        with open(args.top20, 'r') as file:
+            snapshots = json.load(file)
+    else:
+        snapshots = {args.start: SAMPLE_CONSTITUENTS}
+
+    simulation = Simulation(snapshots, datetime.strptime(args.start, '%Y-%m-%d'), cash=args.cash, seed=args.seed)
+    print(json.dumps(simulation.run(args.days), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+# state_journal.py
+
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class StateJournal:
+    """
+    Crash-safe record of the bot's trading state: the last Top20 snapshot, resolved contracts,
+    the current rebalance plan and submitted orders.
+
+    Every change is appended to the journal as one JSON line with a single write on an
+    O_APPEND file descriptor, followed by fsync. Order status updates from the dispatch thread
+    skip the fsync; a background thread syncs them in batches within `sync_interval` seconds.
+    A torn last line (crash mid-write) is ignored on replay. The journal is periodically
+    compacted into an atomically replaced snapshot.
+    """
+
+    SNAPSHOT_FILE = 'snapshot.json'
+    JOURNAL_FILE = 'journal.jsonl'
+    FINAL_ORDER_STATUSES = ('Filled', 'Cancelled', 'ApiCancelled', 'Inactive')
+
+    def __init__(self, directory, compact_every=1000, sync_interval=0.5):
+        self.directory = directory
+        self.compact_every = compact_every
+        self.sync_interval = sync_interval
+        self.unsynced = threading.Event()
+        self.syncer = None
+        self.lock = threading.Lock()
+        self.state = self.empty_state()
+        self.records_since_compact = 0
+        self.fd = None
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def empty_state():
+        return {
+            'top20': None,
+            'contracts': {},
+            'plan': None,
+            'positions': None,
+            'orders': {},
+        }
+
+    def _snapshot_path(self):
+        return os.path.join(self.directory, self.SNAPSHOT_FILE)
+
+    def _journal_path(self):
+        return os.path.join(self.directory, self.JOURNAL_FILE)
+
+    def _open_journal(self):
+        if self.fd is None:
+            self.fd = os.open(self._journal_path(), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+
+    def load(self):
+        """
+        Restore the state from the snapshot and replay the journal on top of it.
+
+        :return: The restored state dictionary.
+        """
+        with self.lock:
+            state = self.empty_state()
+            snapshot_path = self._snapshot_path()
+            if os.path.exists(snapshot_path):
+                try:
+                    with open(snapshot_path, 'r') as file:
+                        state.update(json.load(file))
+                except (OSError, ValueError) as e:
+                    logger.error(f"Error loading state snapshot from {snapshot_path}: {e}")
+
+            replayed = 0
+            journal_path = self._journal_path()
+            if os.path.exists(journal_path):
+                with open(journal_path, 'r') as file:
+                    for line in file:
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            logger.warning("Ignoring torn record at the end of the state journal")
+                            break
+                        self._apply(state, record)
+                        replayed += 1
+
+            self.state = state
+            logger.info(f"Restored state from snapshot and {replayed} journal records")
+            self._compact()
+            return self.state
+
+    @staticmethod
+    def _apply(state, record):
+        kind = record['type']
+        data = record['data']
+        if kind == 'top20':
+            state['top20'] = data
+        elif kind == 'contract':
+            state['contracts'][data['symbol']] = data
+        elif kind == 'plan':
+            state['plan'] = data
+        elif kind == 'positions':
+            state['positions'] = data
+        elif kind == 'order':
+            state['orders'][str(data['orderId'])] = data
+        elif kind == 'order_status':
+            order = state['orders'].get(str(data['orderId']))
+            if order is not None:
+                order.update(data)
+        else:
+            logger.warning(f"Unknown state journal record type: {kind}")
+
+    def record(self, kind, data, sync=True):
+        """
+        Apply a change to the in-memory state and append it to the journal. With `sync` the
+        record is on disk when this returns; otherwise it is synced in the background.
+        """
+        line = json.dumps({'type': kind, 'ts': time.time(), 'data': data}, default=str) + '\n'
+        with self.lock:
+            self._apply(self.state, json.loads(line))
+            self._open_journal()
+            os.write(self.fd, line.encode())
+            self.records_since_compact += 1
+            if sync:
+                os.fsync(self.fd)
+                if self.records_since_compact >= self.compact_every:
+                    self._compact()
+            else:
+                # Compaction is left to the sync thread, off the caller's (dispatch) thread
+                self._schedule_sync()
+
+    def _schedule_sync(self):
+        # Called with the lock held
+        if self.syncer is None:
+            self.syncer = threading.Thread(target=self._sync_loop, name="StateJournalSync", daemon=True)
+            self.syncer.start()
+        self.unsynced.set()
+
+    def _sync_loop(self):
+        while True:
+            self.unsynced.wait()
+            time.sleep(self.sync_interval)  # Collect a burst of records into one fsync
+            self.unsynced.clear()
+            with self.lock:
+                if self.records_since_compact >= self.compact_every:
+                    self._compact()  # Syncs the snapshot and truncates the journal
+                    continue
+                if self.fd is None:
+                    continue
+                fd = os.dup(self.fd)
+            try:
+                os.fsync(fd)
+            except OSError as e:
+                logger.error(f"Error syncing the state journal: {e}")
+            finally:
+                os.close(fd)
+
+    def _compact(self):
+        # Drop orders that can no longer change; they are not needed for a warm restart
+        self.state['orders'] = {order_id: order for order_id, order in self.state['orders'].items()
+                                if order.get('status') not in self.FINAL_ORDER_STATUSES}
+
+        snapshot_path = self._snapshot_path()
+        tmp_path = f"{snapshot_path}.tmp"
+        with open(tmp_path, 'w') as file:
+            json.dump(self.state, file, default=str)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, snapshot_path)
+
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+        with open(self._journal_path(), 'w'):
+            pass
+        self.records_since_compact = 0
+
+    def working_orders(self):
+        """
+        Return the journaled orders that have not reached a final status.
+        """
+        with self.lock:
+            return {order_id: dict(order) for order_id, order in self.state['orders'].items()
+                    if order.get('status') not in self.FINAL_ORDER_STATUSES}
+
+    def close(self):
+        with self.lock:
+            if self.fd is not None:
+                os.fsync(self.fd)
+                os.close(self.fd)
+                self.fd = None
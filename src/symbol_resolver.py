@@ -0,0 +1,174 @@
+# symbol_resolver.py
+
+import logging
+import threading
+
+from utils.import_helper import add_vendor_to_path
+
+add_vendor_to_path()
+from ibapi.contract import Contract
+
+logger = logging.getLogger(__name__)
+
+
+class UnresolvableSymbolError(ValueError):
+    """
+    Raised when neither the primary lookup nor any fallback candidate resolved a symbol.
+    """
+
+
+class SymbolResolver:
+    """
+    Fallback for Top20 constituents whose primary contract lookup failed.
+
+    All candidate lookups are sent at once: by ISIN, by ticker on SMART, by ticker on every
+    alternative venue trading in the expected currency, and a reqMatchingSymbols search on the
+    ticker. The answers that arrive within `timeout` are scored and the best candidate wins,
+    so an unresolvable constituent costs one concurrent pass instead of sequential retries.
+    """
+
+    # A bare reqMatchingSymbols hit with another symbol, currency and venue scores 5; accepted
+    # candidates score at least 50 (an ISIN match or an exact symbol in the expected currency)
+    MIN_SCORE = 50
+
+    def __init__(self, broker, timeout=1.5, max_venues=6):
+        self.broker = broker
+        self.timeout = timeout
+        self.max_venues = max_venues
+
+    def candidate_contracts(self, isin, symbol, exchange):
+        """
+        Return (source, contract) pairs to request contract details for.
+        """
+        venue, currency = self.broker.EXCHANGE_MAPPING.get(exchange, ("SMART", "USD"))
+        candidates = []
+
+        if isin:
+            by_isin = Contract()
+            by_isin.secIdType = 'ISIN'
+            by_isin.secId = isin
+            by_isin.secType = 'STK'
+            by_isin.exchange = 'SMART'
+            by_isin.currency = currency
+            candidates.append(('isin', by_isin))
+
+        by_ticker = Contract()
+        by_ticker.symbol = symbol
+        by_ticker.secType = 'STK'
+        by_ticker.exchange = 'SMART'
+        by_ticker.currency = currency
+        candidates.append(('ticker', by_ticker))
+
+        venues = []
+        for code, (alternative, alternative_currency) in self.broker.EXCHANGE_MAPPING.items():
+            if alternative_currency == currency and alternative not in (venue, 'SMART') and alternative not in venues:
+                venues.append(alternative)
+        for alternative in venues[:self.max_venues]:
+            by_venue = Contract()
+            by_venue.symbol = symbol
+            by_venue.secType = 'STK'
+            by_venue.exchange = alternative
+            by_venue.currency = currency
+            candidates.append(('venue', by_venue))
+
+        return candidates
+
+    @staticmethod
+    def score(source, contract, isin, symbol, venue, currency):
+        score = {'isin': 50, 'ticker': 20, 'venue': 10, 'search': 5}[source]
+        if isin and getattr(contract, 'secId', None) == isin:
+            score += 50
+        if contract.symbol == symbol:
+            score += 30
+        elif contract.symbol.replace('.', ' ') == symbol.replace('.', ' '):
+            score += 20
+        if contract.currency == currency:
+            score += 20
+        if contract.primaryExchange == venue:
+            score += 10
+        if contract.secType != 'STK':
+            score -= 100
+        return score
+
+    @staticmethod
+    def matches(contract, isin, symbol, currency):
+        """
+        A candidate must be the ISIN that was asked for, or the exact symbol in the expected currency.
+        """
+        if isin and getattr(contract, 'secId', None) == isin:
+            return True
+        return contract.symbol == symbol and contract.currency == currency
+
+    @classmethod
+    def select(cls, candidates, isin, symbol, venue, currency):
+        """
+        Return (score, contract) of the best acceptable (source, contract) candidate, or None.
+        """
+        scored = [(cls.score(source, contract, isin, symbol, venue, currency), contract)
+                  for source, contract in candidates if cls.matches(contract, isin, symbol, currency)]
+        scored = [candidate for candidate in scored if candidate[0] >= cls.MIN_SCORE]
+        if not scored:
+            return None
+        return max(scored, key=lambda candidate: candidate[0])
+
+    def resolve(self, isin, symbol, exchange, name):
+        """
+        Run every candidate lookup concurrently and return the best scoring contract.
+
+        :raises UnresolvableSymbolError: If no acceptable candidate resolved within the timeout.
+        """
+        self.broker.ensure_connection()
+        start = self.broker.clock.monotonic()
+        venue, currency = self.broker.EXCHANGE_MAPPING.get(exchange, ("SMART", "USD"))
+        store = self.broker.ib.contract_details
+
+        requests = []
+        for source, contract in self.candidate_contracts(isin, symbol, exchange):
+            req_id = self.broker.allocate_req_id()
+            requests.append((source, req_id, store.open(req_id)))
+            self.broker.ib.reqContractDetails(req_id, contract)
+
+        search_req_id = self.broker.allocate_req_id()
+        search_done = threading.Event()
+        search_results = []
+
+        def on_symbol_samples(reqId, descriptions):
+            search_results.extend(description.contract for description in descriptions)
+            search_done.set()
+
+        self.broker.request_callbacks(search_req_id, {'symbolSamples': on_symbol_samples})
+        self.broker.ib.reqMatchingSymbols(search_req_id, symbol)
+
+        deadline = start + self.timeout
+        try:
+            for _, _, result in requests:
+                self.broker.wait_for_event(result.event, max(deadline - self.broker.clock.monotonic(), 0))
+            self.broker.wait_for_event(search_done, max(deadline - self.broker.clock.monotonic(), 0))
+        finally:
+            self.broker.ib.bus.release(search_req_id)
+
+        candidates = []
+        for source, req_id, result in requests:
+            if not result.completed or result.error:
+                store.release(req_id)
+                continue
+            for details in store.take(req_id):
+                if source == 'isin':
+                    details.contract.secId = isin
+                candidates.append((source, details.contract))
+        candidates.extend(('search', contract) for contract in search_results)
+
+        elapsed = self.broker.clock.monotonic() - start
+        selected = self.select(candidates, isin, symbol, venue, currency)
+        if selected is None:
+            raise UnresolvableSymbolError(f"Could not resolve {symbol} ({name}, ISIN {isin}) after trying "
+                                          f"{len(requests) + 1} lookups in {elapsed:.2f}s: none of "
+                                          f"{len(candidates)} candidates matched the ISIN or the symbol "
+                                          f"in {currency}")
+
+        best_score, best = selected
+        if not best.exchange:
+            best.exchange = 'SMART'  # Matching-symbol results only carry the primary exchange
+        logger.info(f"Resolved {symbol} ({name}) to {best.symbol} on {best.primaryExchange or best.exchange} "
+                    f"(conId {best.conId}, score {best_score}) from {len(candidates)} candidates in {elapsed:.2f}s")
+        return best
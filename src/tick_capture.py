@@ -0,0 +1,320 @@
+# tick_capture.py
+
+import json
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import deque
+from datetime import datetime, timezone
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+TICK_DTYPE = np.dtype([
+    ('con_id', '<i8'),
+    ('time', '<i8'),  # Exchange time, epoch seconds
+    ('received', '<f8'),  # Local receive time, epoch seconds
+    ('kind', '<i1'),
+    ('flags', '<u1'),
+    ('exchange', '<i2'),
+    ('price', '<f8'),  # Trade price, bid or midpoint
+    ('size', '<f8'),  # Trade size or bid size
+    ('ask_price', '<f8'),
+    ('ask_size', '<f8'),
+])
+
+TRADE = 0
+BID_ASK = 1
+MIDPOINT = 2
+
+# Tick attributes, packed into 'flags'
+PAST_LIMIT = 1  # Trades
+UNREPORTED = 2
+BID_PAST_LOW = 1  # Bid/ask
+ASK_PAST_HIGH = 2
+
+CHUNK_HEADER = struct.Struct('<4sIII')  # magic, rows, compressed length, crc32 of the compressed bytes
+CHUNK_MAGIC = b'TCK1'
+
+
+def day_path(directory, day):
+    if not isinstance(day, str):
+        day = day.strftime('%Y-%m-%d')
+    return os.path.join(directory, day)
+
+
+def scan_chunks(data):
+    """
+    Return the intact chunks of a tick file as (rows, payload) pairs and the offset just past
+    the last one. Damaged bytes, e.g. a chunk cut short by a crash, are skipped up to the next
+    chunk header.
+    """
+    chunks = []
+    offset = end = 0
+    while offset + CHUNK_HEADER.size <= len(data):
+        magic, rows, length, crc = CHUNK_HEADER.unpack_from(data, offset)
+        start = offset + CHUNK_HEADER.size
+        payload = data[start:start + length]
+        if magic == CHUNK_MAGIC and len(payload) == length and zlib.crc32(payload) == crc:
+            chunks.append((rows, payload))
+            offset = end = start + length
+            continue
+        offset = data.find(CHUNK_MAGIC, offset + 1)
+        if offset < 0:
+            break
+    return chunks, end
+
+
+def read_ticks(directory, con_id, day, kinds=None):
+    """
+    Return every captured tick of a contract on a day (UTC) as a structured NumPy array with
+    TICK_DTYPE fields, optionally only ticks of the given kinds (TRADE, BID_ASK, MIDPOINT).
+    Damaged chunks are skipped; the intact chunks before and after them are returned.
+    """
+    path = os.path.join(day_path(directory, day), f"{con_id}.ticks")
+    try:
+        with open(path, 'rb') as file:
+            data = file.read()
+    except FileNotFoundError:
+        return np.empty(0, dtype=TICK_DTYPE)
+
+    found, _ = scan_chunks(data)
+    damaged = len(data) - sum(CHUNK_HEADER.size + len(payload) for _, payload in found)
+    if damaged:
+        logger.warning(f"Ignoring {damaged} bytes of damaged tick data in {path}")
+
+    chunks = []
+    for rows, payload in found:
+        raw = zlib.decompress(payload)
+        chunk = np.empty(rows, dtype=TICK_DTYPE)
+        position = 0
+        for name in TICK_DTYPE.names:
+            size = rows * TICK_DTYPE[name].itemsize
+            chunk[name] = np.frombuffer(raw, dtype=TICK_DTYPE[name], count=rows, offset=position)
+            position += size
+        chunks.append(chunk)
+
+    ticks = np.concatenate(chunks) if chunks else np.empty(0, dtype=TICK_DTYPE)
+    if kinds is not None:
+        ticks = ticks[np.isin(ticks['kind'], kinds)]
+    return ticks
+
+
+def read_exchanges(directory):
+    """
+    Return the exchange names indexed by the 'exchange' codes of the captured ticks.
+    """
+    try:
+        with open(os.path.join(directory, TickCapture.EXCHANGES_FILE), 'r') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return []
+
+
+class TickCapture:
+    """
+    Captures tick-by-tick data to compressed, chunked binary files per day and conId.
+
+    The reqTickByTickData callbacks run on the EClient dispatch thread and only write a row into
+    a preallocated ring buffer. A background writer drains it, groups the rows by day and conId
+    and appends one zlib-compressed chunk per file, with the columns stored one after another
+    so they compress well. If a burst fills the ring, rows go to an overflow queue instead of
+    blocking the dispatch thread or being dropped, and stay in order.
+    """
+
+    EXCHANGES_FILE = 'exchanges.json'
+
+    def __init__(self, broker, directory, ring_size=65536, flush_interval=1.0):
+        self.broker = broker
+        self.directory = directory
+        self.capacity = ring_size
+        self.flush_interval = flush_interval
+        self.ring = np.zeros(ring_size, dtype=TICK_DTYPE)
+        self.head = 0  # Written only by the dispatch thread
+        self.tail = 0  # Written only by the writer thread
+        self.overflow = deque()
+        self.wake = threading.Event()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.subscriptions = {}
+        self.files = {}
+        self.exchanges = read_exchanges(directory)
+        self.exchange_codes = {exchange: code for code, exchange in enumerate(self.exchanges)}
+        self.exchanges_saved = len(self.exchanges)
+        self.captured = 0
+        self.overflowed = 0
+        self.written = 0
+        self.bytes_written = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    # Dispatch thread
+
+    def _put(self, row):
+        if self.overflow or self.head - self.tail >= self.capacity:
+            self.overflow.append(row)
+            self.overflowed += 1
+            self.wake.set()
+        else:
+            self.ring[self.head % self.capacity] = row
+            self.head += 1
+            if self.head - self.tail == self.capacity // 2:
+                self.wake.set()
+        self.captured += 1
+
+    def _exchange_code(self, exchange):
+        code = self.exchange_codes.get(exchange)
+        if code is None:
+            code = len(self.exchanges)
+            self.exchanges.append(exchange)
+            self.exchange_codes[exchange] = code
+        return code
+
+    def handlers(self, con_id):
+        """
+        Return the bus handlers that capture the tick-by-tick callbacks of one contract.
+        """
+        def on_all_last(reqId, tickType, time_, price, size, attrib, exchange, specialConditions):
+            flags = (PAST_LIMIT if attrib.pastLimit else 0) | (UNREPORTED if attrib.unreported else 0)
+            self._put((con_id, time_, time.time(), TRADE, flags, self._exchange_code(exchange),
+                       price, float(size), 0.0, 0.0))
+
+        def on_bid_ask(reqId, time_, bidPrice, askPrice, bidSize, askSize, attrib):
+            flags = (BID_PAST_LOW if attrib.bidPastLow else 0) | (ASK_PAST_HIGH if attrib.askPastHigh else 0)
+            self._put((con_id, time_, time.time(), BID_ASK, flags, -1, bidPrice, float(bidSize),
+                       askPrice, float(askSize)))
+
+        def on_mid_point(reqId, time_, midPoint):
+            self._put((con_id, time_, time.time(), MIDPOINT, 0, -1, midPoint, 0.0, 0.0, 0.0))
+
+        return {'tickByTickAllLast': on_all_last, 'tickByTickBidAsk': on_bid_ask,
+                'tickByTickMidPoint': on_mid_point}
+
+    def subscribe(self, symbol, contract, tick_types=('AllLast', 'BidAsk')):
+        if symbol in self.subscriptions:
+            return
+        handlers = self.handlers(contract.conId)
+        self.subscriptions[symbol] = [self.broker.subscribe_tick_by_tick(contract, tick_type, handlers)
+                                      for tick_type in tick_types]
+        logger.info(f"Capturing {', '.join(tick_types)} ticks of {symbol} (conId {contract.conId})")
+
+    def unsubscribe(self, symbol):
+        for req_id in self.subscriptions.pop(symbol, []):
+            self.broker.cancel_tick_by_tick(req_id)
+
+    # Writer thread
+
+    def start(self):
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, name="TickCapture", daemon=True)
+        self.thread.start()
+        logger.info(f"Writing ticks to {self.directory}")
+
+    def stop(self):
+        for symbol in list(self.subscriptions):
+            self.unsubscribe(symbol)
+        self.stop_event.set()
+        self.wake.set()
+        if self.thread:
+            self.thread.join(timeout=30)
+            self.thread = None
+
+    def run(self):
+        try:
+            while not self.stop_event.is_set():
+                self.wake.wait(self.flush_interval)
+                self.wake.clear()
+                self.flush()
+            self.flush()
+        finally:
+            for file in self.files.values():
+                file.close()
+            self.files.clear()
+
+    def _take(self):
+        head = self.head
+        start, end = self.tail % self.capacity, head % self.capacity
+        if head == self.tail:
+            rows = self.ring[:0].copy()
+        elif start < end:
+            rows = self.ring[start:end].copy()
+        else:
+            rows = np.concatenate((self.ring[start:], self.ring[:end]))
+        self.tail = head
+
+        # Overflow rows arrived after everything in the ring that was taken
+        spilled = []
+        while self.overflow:
+            spilled.append(self.overflow.popleft())
+        if spilled:
+            rows = np.concatenate((rows, np.array(spilled, dtype=TICK_DTYPE)))
+        return rows
+
+    def _file(self, day, con_id):
+        key = (day, con_id)
+        if key not in self.files:
+            for old in [old for old in self.files if old[0] != day]:
+                self.files.pop(old).close()
+            directory = day_path(self.directory, datetime.fromtimestamp(day * 86400, timezone.utc).date())
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f"{con_id}.ticks")
+            self.truncate_damage(path)
+            self.files[key] = open(path, 'ab')
+        return self.files[key]
+
+    @staticmethod
+    def truncate_damage(path):
+        """
+        Cut a file reopened after a crash back to its last intact chunk, so new chunks are not
+        appended behind a torn one.
+        """
+        try:
+            with open(path, 'rb') as file:
+                data = file.read()
+        except FileNotFoundError:
+            return
+        _, end = scan_chunks(data)
+        if end < len(data):
+            logger.warning(f"Truncating {len(data) - end} bytes of damaged tick data at the end of {path}")
+            os.truncate(path, end)
+
+    def flush(self):
+        """
+        Append everything captured so far to the day and conId files.
+        """
+        rows = self._take()
+        if len(rows):
+            days = rows['time'] // 86400
+            order = np.lexsort((rows['con_id'], days))
+            rows, days = rows[order], days[order]
+            keys = np.stack((days, rows['con_id']), axis=1)
+            bounds = np.flatnonzero(np.any(keys[1:] != keys[:-1], axis=1)) + 1
+            for group in np.split(np.arange(len(rows)), bounds):
+                chunk = rows[group]
+                payload = zlib.compress(b''.join(chunk[name].tobytes() for name in TICK_DTYPE.names), 1)
+                file = self._file(int(days[group[0]]), int(chunk['con_id'][0]))
+                file.write(CHUNK_HEADER.pack(CHUNK_MAGIC, len(chunk), len(payload), zlib.crc32(payload)))
+                file.write(payload)
+                file.flush()
+                self.written += len(chunk)
+                self.bytes_written += CHUNK_HEADER.size + len(payload)
+
+        if len(self.exchanges) != self.exchanges_saved:
+            exchanges = list(self.exchanges)
+            path = os.path.join(self.directory, self.EXCHANGES_FILE)
+            with open(f"{path}.tmp", 'w') as file:
+                json.dump(exchanges, file)
+            os.replace(f"{path}.tmp", path)
+            self.exchanges_saved = len(exchanges)
+
+    def stats(self):
+        return {
+            'captured': self.captured,
+            'written': self.written,
+            'overflowed': self.overflowed,
+            'pending': self.head - self.tail + len(self.overflow),
+            'bytes_written': self.bytes_written,
+        }
@@ -0,0 +1,99 @@
+# tick_recorder.py
+
+import logging
+import time
+
+from utils.import_helper import add_vendor_to_path
+from utils.logging_setup import setup_logging
+
+add_vendor_to_path()
+
+from config import CONFIG
+from tradepost_api import TradepostAPI
+from constituents import ConstituentFile
+from broker import IBBroker
+from connection_supervisor import ConnectionSupervisor
+from tick_capture import TickCapture
+from trading_loop import process_top20_data
+
+logger = logging.getLogger(__name__)
+
+
+def update_subscriptions(capture, broker, stocks, max_symbols, tick_types):
+    """
+    Capture the Top20 stocks, up to `max_symbols`, and stop capturing stocks that left it.
+    """
+    for ticker in set(capture.subscriptions) - set(stocks):
+        logger.info(f"Stopping tick capture for {ticker}")
+        capture.unsubscribe(ticker)
+
+    for ticker, data in stocks.items():
+        if ticker in capture.subscriptions:
+            continue
+        if len(capture.subscriptions) >= max_symbols:
+            logger.warning(f"Not capturing {ticker}: already capturing {max_symbols} symbols")
+            continue
+        try:
+            contract = broker.get_contract(data['isin'], ticker, data['exchange'], data['name'])
+            capture.subscribe(ticker, contract, tick_types)
+        except Exception as e:
+            logger.warning(f"Could not capture {ticker} ({data['name']}): {e}")
+
+
+def main():
+    """
+    Capture process that records tick-by-tick data of the Top20 on its own TWS connection.
+    """
+    log_listener = setup_logging(CONFIG)
+    logger.info("Starting the tick capture")
+
+    ib_config = CONFIG.get('interactive_brokers')
+    broker = IBBroker(ib_config['host'], ib_config['port'], CONFIG.get('tick_capture.client_id', 91),
+                      ib_config['api_version'])
+    if CONFIG.get('tradepost.constituents_file'):
+        tradepost = ConstituentFile(CONFIG.get('tradepost.constituents_file'))
+    else:
+        tradepost = TradepostAPI(CONFIG.get('tradepost.api_key'), endpoint=CONFIG.get('tradepost.endpoint', 'top20'))
+    capture = TickCapture(broker, CONFIG.get('tick_capture.directory', 'data/ticks'),
+                          ring_size=CONFIG.get('tick_capture.ring_size', 65536),
+                          flush_interval=CONFIG.get('tick_capture.flush_interval', 1.0))
+    max_symbols = CONFIG.get('tick_capture.max_symbols', 5)
+    tick_types = tuple(CONFIG.get('tick_capture.tick_types', ['AllLast', 'BidAsk']))
+
+    try:
+        broker.connect()
+        supervisor = ConnectionSupervisor(
+            broker,
+            heartbeat_interval=CONFIG.get('connection.heartbeat_interval', 10),
+            heartbeat_timeout=CONFIG.get('connection.heartbeat_timeout', 5),
+            max_backoff=CONFIG.get('connection.max_backoff', 60)
+        )
+        broker.supervisor = supervisor
+        supervisor.start()
+        capture.start()
+
+        while True:
+            try:
+                broker.ensure_connection()
+                stocks = process_top20_data(tradepost.get_top20())
+                update_subscriptions(capture, broker, stocks, max_symbols, tick_types)
+                for _ in range(60):
+                    time.sleep(60)
+                    logger.info(f"Tick capture: {capture.stats()}")
+            except ConnectionError as e:
+                logger.error(f"Connection error: {e}. Waiting for the connection to be restored.")
+                supervisor.wait_until_connected(timeout=300)
+            except Exception as e:
+                logger.error(f"An error occurred: {e}", exc_info=True)
+                time.sleep(300)
+
+    except KeyboardInterrupt:
+        logger.info("Received keyboard interrupt. Shutting down...")
+    finally:
+        capture.stop()
+        broker.disconnect()
+        log_listener.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -5,13 +5,16 @@ import logging
 from datetime import datetime, timedelta
 from requests.exceptions import RequestException, HTTPError, ConnectionError, Timeout
 
+from constituents import CHUNK_SIZE, ConstituentSet
+
 logger = logging.getLogger(__name__)
 
 
 class TradepostAPI:
-    def __init__(self, api_key):
+    def __init__(self, api_key, endpoint="top20"):
         self.api_key = api_key
         self.base_url = "https://tradepost.ai/api/v1"
+        self.endpoint = endpoint
         logger.info(f"TradepostAPI initialized with base URL: {self.base_url}")
 
     def _make_request(self, endpoint, params=None):
@@ -22,15 +25,15 @@ class TradepostAPI:
         params = params or {}
         params['api_key'] = self.api_key
 
-        logger.info(f"Making GET request to {url}")
-        logger.debug(f"Request parameters: {params}")
+        logger.info("Making GET request to %s", url)
+        logger.debug("Request parameters: %s", [key for key in params if key != 'api_key'])
 
         try:
             response = requests.get(url, params=params, timeout=30)
             response.raise_for_status()
-            logger.info(f"Successful API call to {url}")
-            logger.debug(f"Response status code: {response.status_code}")
-            logger.debug(f"Response headers: {response.headers}")
+            logger.info("Successful API call to %s", url)
+            logger.debug("Response status code: %s", response.status_code)
+            logger.debug("Response headers: %s", response.headers)
             return response.json()
         except HTTPError as http_err:
             logger.error(f"HTTP error occurred: {http_err}")
@@ -50,14 +53,48 @@ class TradepostAPI:
             logger.error(f"Response content: {response.text}")
             raise
 
+    def _stream_constituents(self, endpoint, params=None):
+        """
+        Make a streamed GET request and parse the constituents while the response arrives.
+        """
+        url = f"{self.base_url}/{endpoint}"
+        params = params or {}
+        params['api_key'] = self.api_key
+
+        logger.info("Making streamed GET request to %s", url)
+        logger.debug("Request parameters: %s", [key for key in params if key != 'api_key'])
+
+        try:
+            with requests.get(url, params=params, timeout=30, stream=True) as response:
+                response.raise_for_status()
+                logger.debug("Response status code: %s", response.status_code)
+                constituents = ConstituentSet.from_stream(response.iter_content(chunk_size=CHUNK_SIZE))
+            logger.info("Successful API call to %s", url)
+            return constituents
+        except HTTPError as http_err:
+            logger.error(f"HTTP error occurred: {http_err}")
+            raise
+        except ConnectionError as conn_err:
+            logger.error(f"Error connecting to the API: {conn_err}")
+            raise
+        except Timeout as timeout_err:
+            logger.error(f"Timeout error: {timeout_err}")
+            raise
+        except RequestException as req_err:
+            logger.error(f"An error occurred while making the request: {req_err}")
+            raise
+        except ValueError as json_err:
+            logger.error(f"Error decoding JSON response: {json_err}")
+            raise
+
     def get_top20(self, date=None):
         """
-        Get the Top 20 stocks from Tradepost.
+        Get the constituents of the configured Tradepost list (the Top 20 by default).
 
         :param date: Optional date string in format 'YYYY-MM-DD'. If not provided, uses current date.
-        :return: Dictionary containing Top 20 data.
+        :return: Dictionary with the 'date' and the 'constituents' as a ConstituentSet.
         """
-        endpoint = "top20"
+        endpoint = self.endpoint
         params = {}
 
         if date:
@@ -69,10 +106,9 @@ class TradepostAPI:
                 raise ValueError("Invalid date format. Expected format: YYYY-MM-DD")
 
         try:
-            data = self._make_request(endpoint, params)
-            logger.info(f"Successfully retrieved Top 20 data for date: {data.get('date', 'Unknown')}")
-            logger.debug(f"Top 20 data: {data}")
-            return data
+            constituents = self._stream_constituents(endpoint, params)
+            logger.info(f"Successfully retrieved {endpoint}: {constituents.summary()}")
+            return {'date': constituents.date, 'constituents': constituents}
         except Exception as e:
             logger.error(f"Failed to retrieve Top 20 data: {e}")
             raise
@@ -112,7 +148,7 @@ class TradepostAPI:
         return historical_data
 
     def __str__(self):
-        return f"TradepostAPI(base_url={self.base_url})"
+        return f"TradepostAPI(base_url={self.base_url}, endpoint={self.endpoint})"
 
     def __repr__(self):
         return self.__str__()
\ No newline at end of file
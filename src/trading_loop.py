@@ -0,0 +1,164 @@
+# trading_loop.py
+
+import logging
+
+from clock import SYSTEM_CLOCK
+from constituents import ConstituentSet
+from symbol_resolver import UnresolvableSymbolError
+
+logger = logging.getLogger(__name__)
+
+def process_top20_data(data):
+    """
+    Return the constituents as a ConstituentSet ({ticker: data}). Sources that already stream
+    into a ConstituentSet are passed through; plain lists are validated and deduplicated.
+    """
+    constituents = data['constituents']
+    if not isinstance(constituents, ConstituentSet):
+        constituents = ConstituentSet.from_records(constituents, date=data.get('date'))
+    logger.info(f"Processed {constituents.summary()}")
+    return constituents
+
+def get_current_prices(broker, processed_top20, clock=SYSTEM_CLOCK):
+    prices = {}
+    for ticker, data in processed_top20.items():
+        retries = 3
+        while retries > 0:
+            try:
+                price = broker.get_market_price(data['isin'], ticker, data['exchange'], data['name'])
+                if price is not None:
+                    prices[ticker] = price
+                    logger.info(f"Got price for {ticker} ({data['name']}): {price}")
+                    break
+                else:
+                    logger.warning(f"Failed to get price for {ticker} ({data['name']}). Retries left: {retries - 1}")
+                    retries -= 1
+            except UnresolvableSymbolError as e:
+                # Every lookup was already tried concurrently, retrying the same ones will not help
+                logger.error(f"Skipping {ticker} ({data['name']}): {e}")
+                break
+            except Exception as e:
+                logger.error(f"Failed to get price for {ticker} ({data['name']}): {e}")
+                retries -= 1
+            clock.sleep(60)  # Wait for 1 minute before retrying
+
+        if ticker not in prices:
+            logger.error(f"Unable to get price for {ticker} ({data['name']}) after all retries. Skipping this stock.")
+
+    return prices
+
+def process_open_markets(broker, processed_top20, warm_up=None, clock=SYSTEM_CLOCK):
+    open_market_stocks = {}
+    closed_market_stocks = {}
+
+    for ticker, data in processed_top20.items():
+        if broker.is_market_open(data['exchange']):
+            open_market_stocks[ticker] = data
+        else:
+            closed_market_stocks[ticker] = data
+
+    # Stocks warmed up before the open already have a streamed price
+    current_prices = warm_up.prices(open_market_stocks) if warm_up else {}
+    cold_stocks = {ticker: data for ticker, data in open_market_stocks.items() if ticker not in current_prices}
+    current_prices.update(get_current_prices(broker, cold_stocks, clock))
+
+    return current_prices, closed_market_stocks
+
+def get_unique_markets_and_times(processed_top20, broker):
+    unique_markets = set(data['exchange'] for data in processed_top20.values())
+    market_times = {}
+    for market in unique_markets:
+        next_open = broker.get_next_market_open(market)
+        market_times[market] = next_open
+    return market_times
+
+
+def run_iteration(broker, tradepost, pm, warm_up, clock=SYSTEM_CLOCK, journal=None, executions=None):
+    """
+    Run one pass of the main loop: fetch the Top20, buy into each market as it opens and
+    rebalance once all markets were visited.
+
+    :return: Seconds to wait before the next pass.
+    """
+    broker.ensure_connection()
+
+    logger.info("Fetching Top20 data from Tradepost")
+    top20_data = tradepost.get_top20()
+    logger.info(f"Fetched Top20 data for date: {top20_data['date']}")
+    processed_top20 = process_top20_data(top20_data)
+    if journal:
+        journal.record('top20', {'date': top20_data['date'], 'constituents': processed_top20.to_records()})
+
+    if not processed_top20:
+        logger.warning("No valid stocks in Top20 data. Waiting before retry.")
+        return 300  # Wait for 5 minutes before retrying
+    broker.request_shared_prices(processed_top20)
+
+    # Get unique markets and their opening times
+    market_times = get_unique_markets_and_times(processed_top20, broker)
+
+    # Display current UTC time
+    logger.info(f"Current UTC time: {clock.now().strftime('%Y-%m-%d %H:%M:%S %Z')}")
+
+    # Display markets and their opening times
+    logger.info("Markets to check and their next opening times:")
+    for market, open_time in market_times.items():
+        logger.info(f"{market}: {open_time.strftime('%Y-%m-%d %H:%M:%S %Z')}")
+
+    all_prices = {}
+    remaining_stocks = processed_top20
+
+    for exchange in market_times.keys():
+        current_prices, remaining_stocks = process_open_markets(broker, remaining_stocks, warm_up, clock)
+        all_prices.update(current_prices)
+
+        if not remaining_stocks:
+            break
+
+        if current_prices:
+            # Calculate quantities and place orders for the current market
+            pm.calculate_and_execute_orders(current_prices, current_portfolio=warm_up.take_portfolio(),
+                                            stocks=processed_top20)
+            warm_up.release(current_prices)
+
+        if remaining_stocks:
+            next_market_open = min(broker.get_next_market_open(data['exchange'])
+                                   for data in remaining_stocks.values())
+            wait_time = (next_market_open - clock.now()).total_seconds()
+            next_market = min(remaining_stocks.values(), key=lambda x: broker.get_next_market_open(x['exchange']))['exchange']
+            logger.info(f"Current UTC time: {clock.now().strftime('%Y-%m-%d %H:%M:%S %Z')}")
+            logger.info(f"Waiting for {next_market} market to open. Sleep time: {wait_time / 60:.2f} minutes")
+
+            warm_up_wait = warm_up.seconds_until_warm_up(next_market_open, clock.now())
+            if warm_up_wait > 0:
+                clock.sleep(min(warm_up_wait, 3600))  # Wait until the warm-up or max 1 hour
+
+            if warm_up.seconds_until_warm_up(next_market_open, clock.now()) <= 0:
+                logger.info(f"Warming up {next_market} ahead of its open")
+                warm_up.prepare({ticker: data for ticker, data in remaining_stocks.items()
+                                 if data['exchange'] == next_market})
+                wait_time = (next_market_open - clock.now()).total_seconds()
+                clock.sleep(max(wait_time, 0))
+
+    if not all_prices:
+        logger.warning("No valid prices available. Waiting before retry.")
+        return 300  # Wait for 5 minutes
+
+    logger.debug("All prices: %s", all_prices)
+
+    valid_top20 = {ticker: data for ticker, data in processed_top20.items() if ticker in all_prices}
+    for ticker, data in valid_top20.items():
+        data['price'] = all_prices[ticker]
+
+    logger.info(f"Rebalancing {len(valid_top20)} of {len(processed_top20)} constituents with prices")
+
+    # After processing all markets, update the portfolio
+    pm.rebalance_portfolio(valid_top20)
+    logger.info("Request store stats: %s", broker.ib.request_store_stats())
+    logger.info("Message lane latency: %s", broker.ib.lane_latency_stats())
+    logger.info("Message queue: %s", broker.ib.message_queue_stats())
+    if executions:
+        executions.prune()
+        logger.info("Execution quality by exchange: %s", executions.summary(by=('exchange',)))
+
+    return 3600  # Wait for 1 hour before the next check
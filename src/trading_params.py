@@ -0,0 +1,62 @@
+# trading_params.py
+
+from decimal import Decimal, InvalidOperation
+
+
+class TradingParams:
+    """
+    Resolved and validated trading parameters. Instances are never modified, so a reload
+    swaps in a new instance with a single assignment.
+    """
+
+    __slots__ = ('cash_buffer', 'max_position_size', 'max_order_size', 'max_live_children', 'child_timeout',
+                 'fx_max_age', 'rebalance_solver', 'rebalance_band')
+
+    def __init__(self, cash_buffer, max_position_size, max_order_size, max_live_children, child_timeout,
+                 fx_max_age, rebalance_solver=False, rebalance_band=Decimal('0.1')):
+        self.cash_buffer = cash_buffer
+        self.max_position_size = max_position_size
+        self.max_order_size = max_order_size
+        self.max_live_children = max_live_children
+        self.child_timeout = child_timeout
+        self.fx_max_age = fx_max_age
+        self.rebalance_solver = rebalance_solver
+        self.rebalance_band = rebalance_band
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Build the parameters from a Config, raising ValueError if any of them is invalid.
+        """
+        rebalance_solver = config.get('trading.rebalance_solver', False)
+        if not isinstance(rebalance_solver, bool):
+            # bool() would turn the string "false" into True
+            raise ValueError(f"trading.rebalance_solver must be true or false, got {rebalance_solver!r}")
+        try:
+            params = cls(
+                cash_buffer=Decimal(str(config.get('trading.cash_buffer', '50'))),
+                max_position_size=Decimal(str(config.get('trading.max_position_size', '0.3'))),
+                max_order_size=int(config.get('trading.max_order_size', 50000)),
+                max_live_children=int(config.get('trading.max_live_children', 2)),
+                child_timeout=float(config.get('trading.child_timeout', 60)),
+                fx_max_age=float(config.get('trading.fx_max_age', 900)),
+                rebalance_solver=rebalance_solver,
+                rebalance_band=Decimal(str(config.get('trading.rebalance_band', '0.1')))
+            )
+        except (InvalidOperation, TypeError, ValueError) as e:
+            raise ValueError(f"Invalid trading configuration: {e}")
+
+        if not 0 < params.max_position_size <= 1:
+            raise ValueError("trading.max_position_size must be between 0 and 1")
+        if params.cash_buffer < 0:
+            raise ValueError("trading.cash_buffer must not be negative")
+        if params.max_order_size <= 0 or params.max_live_children <= 0:
+            raise ValueError("trading.max_order_size and trading.max_live_children must be positive")
+        if params.child_timeout <= 0 or params.fx_max_age <= 0:
+            raise ValueError("trading.child_timeout and trading.fx_max_age must be positive")
+        if not 0 <= params.rebalance_band < 1:
+            raise ValueError("trading.rebalance_band must be between 0 and 1")
+        return params
+
+    def __repr__(self):
+        return "TradingParams(" + ", ".join(f"{name}={getattr(self, name)}" for name in self.__slots__) + ")"
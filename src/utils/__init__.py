@@ -1,3 +1,4 @@
 from .import_helper import add_vendor_to_path
+from .logging_setup import setup_logging
 
-__all__ = ['add_vendor_to_path']
\ No newline at end of file
+__all__ = ['add_vendor_to_path', 'setup_logging']
\ No newline at end of file
@@ -0,0 +1,123 @@
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+from datetime import date, datetime, time as dt_time, timedelta
+from decimal import Decimal
+from enum import Enum
+
+DEFAULT_FORMAT = '%(asctime)s - %(levelname)s - %(name)s - %(message)s'
+
+# Only arguments of these types are left for the writer thread to format. Anything else, e.g.
+# an ibapi Contract or a dict, can change after the call, so it is rendered before the record
+# is handed over.
+_IMMUTABLE_ARG_TYPES = (str, bytes, int, float, complex, bool, type(None), Decimal, Enum,
+                        date, datetime, dt_time, timedelta)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Let through at most `burst` records per message template and logger within `interval`
+    seconds. Suppressed records are counted and reported once the window rolls over.
+    """
+
+    def __init__(self, interval=10.0, burst=20, max_windows=1000):
+        super().__init__()
+        self.interval = interval
+        self.burst = burst
+        self.max_windows = max_windows
+        self.lock = threading.Lock()
+        self.windows = {}
+        self.last_sweep = time.monotonic()
+
+    def filter(self, record):
+        if record.levelno >= logging.ERROR:
+            return True
+
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self.lock:
+            if now - self.last_sweep >= self.interval:
+                self._evict_expired(now)
+            window_start, count, suppressed = self.windows.pop(key, (now, 0, 0))
+            if now - window_start >= self.interval:
+                if suppressed:
+                    record.msg = f"{record.msg} [{suppressed} similar messages suppressed]"
+                window_start, count, suppressed = now, 0, 0
+
+            count += 1
+            allowed = count <= self.burst
+            if not allowed:
+                suppressed += 1
+            # Re-inserted so the dict stays ordered from least to most recently used
+            self.windows[key] = (window_start, count, suppressed)
+            while len(self.windows) > self.max_windows:
+                del self.windows[next(iter(self.windows))]
+        return allowed
+
+    def _evict_expired(self, now):
+        # Called with the lock held. Expired windows that suppressed records are kept until the
+        # next matching record reports the count, or until the size cap drops them.
+        self.windows = {key: window for key, window in self.windows.items()
+                        if now - window[0] < self.interval or window[2]}
+        self.last_sweep = now
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler that leaves %-style formatting to the writer thread instead of
+    formatting every record in the calling thread.
+    """
+
+    def prepare(self, record):
+        if record.args and not all(isinstance(arg, _IMMUTABLE_ARG_TYPES) for arg in _iter_args(record.args)):
+            record.msg = record.getMessage()
+            record.args = None
+        if record.exc_info:
+            # Tracebacks hold frame references, render them while they are still valid
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def _iter_args(args):
+    if isinstance(args, dict):
+        return args.values()
+    return args
+
+
+def setup_logging(config):
+    """
+    Route all logging through a queue to a background writer thread and apply the
+    per-subsystem levels from the `logging` section of the configuration.
+
+    :param config: Config instance.
+    :return: The started QueueListener; stop it on shutdown to flush pending records.
+    """
+    level = config.get('logging.level', 'INFO')
+    levels = config.get('logging.levels', {'ibapi': 'WARNING'}) or {}
+    log_format = config.get('logging.format', DEFAULT_FORMAT)
+    rate_interval = float(config.get('logging.rate_limit.interval', 10))
+    rate_burst = int(config.get('logging.rate_limit.burst', 20))
+    rate_windows = int(config.get('logging.rate_limit.max_windows', 1000))
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(log_format))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = LazyQueueHandler(log_queue)
+    queue_handler.addFilter(RateLimitFilter(rate_interval, rate_burst, rate_windows))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    for name, subsystem_level in levels.items():
+        logging.getLogger(name).setLevel(subsystem_level)
+
+    listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    listener.start()
+    return listener
@@ -0,0 +1,89 @@
+# valuation.py
+
+import logging
+import threading
+
+from clock import SYSTEM_CLOCK
+from utils.import_helper import add_vendor_to_path
+
+add_vendor_to_path()
+from ibapi.const import UNSET_DOUBLE
+
+logger = logging.getLogger(__name__)
+
+
+class ValuationCache:
+    """
+    Live mark-to-market values per holding, fed by the portfolio updates of reqAccountUpdates
+    and a reqPnLSingle stream per conId. Reads are single dict lookups, so sizing can use current
+    marks for every holding (including ones outside the Top20) without extra pricing requests.
+    """
+
+    def __init__(self, broker, account, max_age=900, clock=SYSTEM_CLOCK):
+        self.broker = broker
+        self.clock = clock
+        self.account = account
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.marks = {}
+        self.symbols = {}
+        self.pnl_streams = {}
+
+    def start(self):
+        self.broker.ib.bus.subscribe('updatePortfolio', self.on_update_portfolio)
+        self.broker.subscribe_account_updates(self.account)
+        logger.info(f"Valuation stream started for account {self.account}")
+
+    def on_update_portfolio(self, contract, position, marketPrice, marketValue, averageCost, unrealizedPNL,
+                            realizedPNL, accountName):
+        con_id = contract.conId
+        with self.lock:
+            self.symbols[contract.symbol] = con_id
+            self.marks[con_id] = {
+                'symbol': contract.symbol,
+                'currency': contract.currency,
+                'position': float(position),
+                'market_price': marketPrice,
+                'market_value': marketValue,
+                'unrealized_pnl': unrealizedPNL,
+                'updated': self.clock.monotonic()
+            }
+            new_stream = con_id not in self.pnl_streams and float(position) != 0
+
+        if new_stream:
+            self.pnl_streams[con_id] = self.broker.subscribe_pnl_single(self.account, con_id, self.on_pnl_single)
+
+    def on_pnl_single(self, reqId, pos, dailyPnL, unrealizedPnL, realizedPnL, value):
+        con_id = self.broker.pnl_subscriptions.get(reqId)
+        with self.lock:
+            mark = self.marks.get(con_id)
+            # TWS sends UNSET_DOUBLE until it has a value for the position
+            if mark is None or float(pos) == 0 or value == UNSET_DOUBLE:
+                return
+            mark['position'] = float(pos)
+            mark['market_value'] = value
+            mark['market_price'] = value / float(pos)
+            if unrealizedPnL != UNSET_DOUBLE:
+                mark['unrealized_pnl'] = unrealizedPnL
+            mark['updated'] = self.clock.monotonic()
+
+    def get_mark(self, symbol):
+        """
+        Return the current market price for a held symbol, or None if no fresh mark is known.
+        """
+        with self.lock:
+            mark = self.marks.get(self.symbols.get(symbol))
+            if mark is None or self.clock.monotonic() - mark['updated'] > self.max_age:
+                return None
+            return mark['market_price']
+
+    def get_valuation(self, con_id):
+        with self.lock:
+            mark = self.marks.get(con_id)
+            return dict(mark) if mark else None
+
+    def stop(self):
+        for con_id, req_id in list(self.pnl_streams.items()):
+            self.broker.cancel_pnl_single(req_id)
+        self.pnl_streams.clear()
+        self.broker.unsubscribe_account_updates()
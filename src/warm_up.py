@@ -0,0 +1,78 @@
+# warm_up.py
+
+import logging
+
+from clock import SYSTEM_CLOCK
+
+logger = logging.getLogger(__name__)
+
+
+class MarketWarmUp:
+    """
+    Prepares an exchange shortly before its next open: resolves contracts, opens market data
+    streams, refreshes positions and precomputes a provisional buy plan. At the open the plan is
+    refreshed from the streamed prices in memory, so orders go out without any round trips.
+    """
+
+    def __init__(self, broker, portfolio_manager, lead_minutes=10, price_wait=5, clock=SYSTEM_CLOCK):
+        self.broker = broker
+        self.clock = clock
+        self.pm = portfolio_manager
+        self.lead_seconds = lead_minutes * 60
+        self.price_wait = price_wait
+        self.prepared = {}
+        self.portfolio = None
+
+    def seconds_until_warm_up(self, next_open, now):
+        return (next_open - now).total_seconds() - self.lead_seconds
+
+    def prepare(self, stocks):
+        """
+        Warm up the given stocks ({ticker: data}) ahead of their exchange's open.
+        """
+        start = self.clock.monotonic()
+        for ticker, data in stocks.items():
+            if ticker in self.prepared:
+                continue
+            try:
+                contract = self.broker.get_contract(data['isin'], ticker, data['exchange'], data['name'])
+                self.broker.stream_price(ticker, contract)
+                self.prepared[ticker] = data
+            except Exception as e:
+                logger.warning(f"Warm-up failed for {ticker} ({data['name']}): {e}")
+
+        # Give the streams a moment to deliver a first price
+        deadline = self.clock.monotonic() + self.price_wait
+        while self.clock.monotonic() < deadline and not all(self.broker.latest_price(ticker) is not None
+                                                      for ticker in self.prepared):
+            self.clock.sleep(0.1)
+
+        self.portfolio = self.pm.get_current_portfolio()
+        self.pm.refresh_fx_rates(self.portfolio, stocks)
+        prices = self.prices(stocks)
+        if prices:
+            plan = self.pm.calculate_buy_orders(prices, self.portfolio, stocks)
+            logger.info(f"Provisional plan with {len(plan)} orders for {sorted(prices)}")
+
+        logger.info(f"Warm-up of {len(self.prepared)} stocks took {self.clock.monotonic() - start:.2f}s")
+
+    def prices(self, stocks):
+        """
+        Return the latest streamed prices for the warmed-up stocks among `stocks`.
+        """
+        prices = {ticker: self.broker.latest_price(ticker) for ticker in stocks if ticker in self.prepared}
+        return {ticker: price for ticker, price in prices.items() if price is not None}
+
+    def take_portfolio(self):
+        """
+        Return the positions snapshot of the last warm-up, only once: the orders placed with it
+        make it stale, so the next market fetches fresh positions.
+        """
+        portfolio, self.portfolio = self.portfolio, None
+        return portfolio
+
+    def release(self, stocks):
+        for ticker in stocks:
+            if self.prepared.pop(ticker, None) is not None:
+                self.broker.stop_price_stream(ticker)
+        self.portfolio = None
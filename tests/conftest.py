@@ -0,0 +1,12 @@
+# conftest.py
+
+import sys
+from pathlib import Path
+
+SRC = Path(__file__).resolve().parent.parent / 'src'
+if str(SRC) not in sys.path:
+    sys.path.insert(0, str(SRC))
+
+from utils.import_helper import add_vendor_to_path
+
+add_vendor_to_path()
@@ -0,0 +1,162 @@
+# test_broker.py
+
+import pytest
+
+pytest.importorskip('pandas')
+pytest.importorskip('exchange_calendars')
+
+from broker import IBApi  # noqa: E402
+
+
+@pytest.fixture
+def api():
+    api = IBApi()
+    api.historical_data.open(5)
+    return api
+
+
+@pytest.mark.parametrize('code', [2104, 2174, 2176, 10090, 10167, 10168])
+def test_warnings_do_not_fail_requests(api, code):
+    errors = []
+    api.bus.subscribe('error', lambda *args: errors.append(args), req_id=5)
+    api.error(5, code, 'notice')
+    api.historicalDataEnd(5, '', '')
+    assert api.historical_data.take(5) == []
+    assert errors == [(5, code, 'notice')]
+
+
+def test_errors_fail_requests(api):
+    api.error(5, 162, 'Historical Market Data Service error message:HMDS query returned no data')
+    with pytest.raises(ValueError, match='HMDS query returned no data'):
+        api.historical_data.take(5)
+
+
+class FakeBarCache:
+    def __init__(self, last_close):
+        self.close = last_close
+        self.appended = []
+
+    def missing_duration(self, con_id):
+        return '600 S'
+
+    def last_close(self, con_id):
+        return self.close
+
+    def append(self, con_id, bars):
+        self.appended.extend(bars)
+
+
+def broker_with(bar_cache, error):
+    from broker import IBBroker
+    from ibapi.contract import Contract
+
+    broker = IBBroker('127.0.0.1', 7497, 1, 'x', bar_cache=bar_cache)
+
+    def request_historical_bars(req_id, contract, duration, format_date):
+        raise error
+
+    broker.request_historical_bars = request_historical_bars
+    contract = Contract()
+    contract.conId, contract.symbol = 1, 'AAA'
+    return broker, contract
+
+
+def test_empty_tail_falls_back_to_the_cached_close():
+    broker, contract = broker_with(FakeBarCache(12.5), ValueError("No historical data received for AAA"))
+    assert broker.get_historical_price(1, contract) == 12.5
+
+
+def test_empty_tail_without_cached_close_fails():
+    broker, contract = broker_with(FakeBarCache(None), ValueError("No historical data received for AAA"))
+    with pytest.raises(ValueError):
+        broker.get_historical_price(1, contract)
+
+
+class FakeJournal:
+    def __init__(self):
+        self.records = []
+
+    def record(self, kind, data, sync=True):
+        self.records.append((kind, dict(data), sync))
+
+
+def test_order_is_journaled_pending_before_it_is_placed():
+    from broker import IBBroker
+
+    journal = FakeJournal()
+    broker = IBBroker('127.0.0.1', 7497, 1, 'x', journal=journal)
+    broker.ensure_connection = lambda: None
+    broker.ib.nextorderId = 10
+    placed = []
+    broker.ib.placeOrder = lambda order_id, contract, order: placed.append(list(journal.records))
+
+    assert broker.place_order('AAA', 'STK', 'SMART', 'BUY', 5) == 10
+    assert placed == [[('order', placed[0][0][1], True)]]
+    assert placed[0][0][1]['status'] == 'PendingSubmit'
+
+    broker.handle_order_status(10, {'status': 'Submitted', 'filled': 0.0})
+    assert journal.records[-1] == ('order_status', {'status': 'Submitted', 'filled': 0.0, 'orderId': 10}, False)
+
+
+def test_executed_shares_sum_fills_per_order():
+    from broker import IBBroker
+    from ibapi.contract import Contract
+    from ibapi.execution import Execution
+
+    broker = IBBroker('127.0.0.1', 7497, 1, 'x')
+    broker.ensure_connection = lambda: None
+
+    def execution(exec_id, order_id, shares):
+        result = Execution()
+        result.execId, result.orderId, result.shares = exec_id, order_id, shares
+        return result
+
+    def req_executions(req_id, execution_filter):
+        assert execution_filter.clientId == 1
+        broker.ib.execDetails(req_id, Contract(), execution('a', 10, 3))
+        broker.ib.execDetails(req_id, Contract(), execution('b', 10, 2))
+        broker.ib.execDetails(req_id, Contract(), execution('b', 10, 2))  # Replayed correction
+        broker.ib.execDetails(req_id, Contract(), execution('c', 11, 7))
+        broker.ib.execDetailsEnd(req_id)
+
+    broker.ib.reqExecutions = req_executions
+    assert broker.get_executed_shares() == {10: 5.0, 11: 7.0}
+
+
+def test_order_errors_do_not_fail_requests():
+    from broker import IBBroker
+
+    broker = IBBroker('127.0.0.1', 7497, 1, 'x')
+    broker.ib.nextorderId = 1
+    req_id = broker.allocate_req_id()
+    order_id = broker.reserve_order_id()
+    assert req_id >= broker.REQ_ID_BASE > order_id
+
+    result = broker.ib.historical_data.open(req_id)
+    broker.ib.error(order_id, 201, 'Order rejected')
+    assert not result.event.is_set()
+
+
+def test_timed_out_probe_is_not_repeated_until_it_expires():
+    from datetime import datetime
+
+    from broker import IBBroker
+    from clock import VirtualClock
+    from ibapi.contract import Contract
+
+    clock = VirtualClock(datetime(2024, 1, 8))
+    broker = IBBroker('127.0.0.1', 7497, 1, 'x', clock=clock)
+    probes = []
+    broker.request_market_data = lambda req_id, contract, snapshot=False: probes.append(req_id)
+    broker.ib.cancelMktData = lambda req_id: None
+    broker.wait_for_event = lambda event, timeout: False
+    contract = Contract()
+    contract.conId, contract.symbol = 1, 'AAA'
+
+    assert not broker.check_real_time_data_availability(contract)
+    assert not broker.check_real_time_data_availability(contract)
+    assert len(probes) == 1
+
+    clock.sleep(broker.PROBE_TIMEOUT_TTL)
+    assert not broker.check_real_time_data_availability(contract)
+    assert len(probes) == 2
@@ -0,0 +1,86 @@
+# test_callback_bus.py
+
+from callback_bus import CallbackBus
+
+
+def test_req_id_and_con_id_routing():
+    bus = CallbackBus()
+    received = []
+    bus.subscribe('tickPrice', lambda *args: received.append(('req 1',) + args), req_id=1)
+    bus.subscribe('tickPrice', lambda *args: received.append(('req 2',) + args), req_id=2)
+    bus.subscribe('tickPrice', lambda *args: received.append(('con 7',) + args), con_id=7)
+    bus.subscribe('tickPrice', lambda *args: received.append(('all',) + args))
+
+    bus.publish('tickPrice', 1, 10.0, req_id=1, con_id=7)
+    assert received == [('req 1', 1, 10.0), ('con 7', 1, 10.0), ('all', 1, 10.0)]
+
+    received.clear()
+    bus.publish('tickSize', 2, 100, req_id=2)
+    assert received == []
+
+
+def test_release_drops_every_handler_of_a_request():
+    bus = CallbackBus()
+    received = []
+    bus.subscribe('historicalData', received.append, req_id=1)
+    bus.subscribe('error', received.append, req_id=1)
+    bus.subscribe('historicalData', received.append, req_id=2)
+
+    bus.release(1)
+    bus.publish('historicalData', 'a', req_id=1)
+    bus.publish('error', 'b', req_id=1)
+    bus.publish('historicalData', 'c', req_id=2)
+    assert received == ['c']
+    assert bus.stats() == {'routes': 1, 'requests': 1}
+
+
+def test_end_message_releases_the_request():
+    bus = CallbackBus()
+    received = []
+    bus.subscribe('contractDetails', received.append, req_id=1)
+    bus.subscribe('contractDetailsEnd', lambda req_id: received.append('end'), req_id=1)
+    bus.publish('contractDetails', 'details', req_id=1)
+    bus.publish('contractDetailsEnd', 1, req_id=1)
+    bus.publish('contractDetails', 'late', req_id=1)
+    assert received == ['details', 'end']
+    assert bus.stats() == {'routes': 0, 'requests': 0}
+
+
+def test_unsubscribe_removes_the_route_and_its_request_key():
+    bus = CallbackBus()
+    received = []
+    first = bus.subscribe('tickPrice', lambda value: received.append(('first', value)), req_id=1)
+    second = bus.subscribe('tickPrice', lambda value: received.append(('second', value)), req_id=1)
+
+    bus.unsubscribe(first)
+    bus.publish('tickPrice', 1, req_id=1)
+    assert received == [('second', 1)]
+    assert bus.stats() == {'routes': 1, 'requests': 1}
+
+    bus.unsubscribe(second)
+    bus.unsubscribe(second)  # Unsubscribing twice is harmless
+    assert bus.stats() == {'routes': 0, 'requests': 0}
+
+
+def test_handler_may_unsubscribe_itself_while_publishing():
+    bus = CallbackBus()
+    received = []
+
+    def once(value):
+        received.append(value)
+        bus.unsubscribe(subscription)
+
+    subscription = bus.subscribe('currentTime', once)
+    bus.subscribe('currentTime', lambda value: received.append(('other', value)))
+    bus.publish('currentTime', 1)
+    bus.publish('currentTime', 2)
+    assert received == [1, ('other', 1), ('other', 2)]
+
+
+def test_failing_handler_does_not_stop_the_others():
+    bus = CallbackBus()
+    received = []
+    bus.subscribe('error', lambda *args: 1 / 0, req_id=1)
+    bus.subscribe('error', lambda *args: received.append(args), req_id=1)
+    bus.publish('error', 1, 200, 'No security definition', req_id=1)
+    assert received == [(1, 200, 'No security definition')]
@@ -0,0 +1,50 @@
+# test_clock.py
+
+import threading
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+pytest.importorskip('pytz')
+
+from clock import VirtualClock  # noqa: E402
+
+START = datetime(2026, 1, 5, 8, 0, tzinfo=timezone.utc)
+
+
+def test_naive_start_is_utc():
+    assert VirtualClock(datetime(2026, 1, 5, 8, 0)).now() == START
+
+
+def test_sleep_advances_virtual_time_only():
+    clock = VirtualClock(START)
+    clock.sleep(3600)
+    clock.sleep(-5)
+    assert clock.now() == START + timedelta(hours=1)
+    assert clock.monotonic() == 3600
+    assert clock.time() == START.timestamp() + 3600
+    assert clock.slept == 3600
+
+
+def test_timers_fire_in_time_order_at_their_time():
+    clock = VirtualClock(START)
+    fired = []
+    clock.call_at(START + timedelta(seconds=30), lambda: fired.append(('late', clock.monotonic())))
+    clock.call_at(START + timedelta(seconds=10), lambda: fired.append(('early', clock.monotonic())))
+    clock.call_at(START + timedelta(seconds=10), lambda: fired.append(('tied', clock.monotonic())))
+    clock.sleep(20)
+    assert fired == [('early', 10), ('tied', 10)]
+    clock.sleep(20)
+    assert fired[-1] == ('late', 30)
+    assert clock.monotonic() == 40
+
+
+def test_wait_returns_at_once_when_set_and_sleeps_otherwise():
+    clock = VirtualClock(START)
+    event = threading.Event()
+    assert clock.wait(event, 5) is False
+    assert clock.monotonic() == 5
+    clock.call_at(START + timedelta(seconds=7), event.set)
+    assert clock.wait(event, 10) is True
+    assert clock.wait(event, 10) is True
+    assert clock.monotonic() == 15
@@ -0,0 +1,130 @@
+# test_connection_supervisor.py
+
+import socket
+import struct
+import threading
+import time
+
+import pytest
+
+pytest.importorskip('pandas')
+pytest.importorskip('exchange_calendars')
+
+from broker import IBBroker  # noqa: E402
+from connection_supervisor import ConnectionSupervisor  # noqa: E402
+
+START_API = b'71'
+REQ_CURRENT_TIME = b'49'
+
+
+def message(*fields):
+    text = ''.join(f"{field}\0" for field in fields).encode()
+    return struct.pack('!I', len(text)) + text
+
+
+class StubTws:
+    """
+    Minimal TWS socket: answers the handshake, startApi with nextValidId and reqCurrentTime
+    with currentTime. kill() drops the current client connection like a TWS restart would.
+    """
+
+    def __init__(self):
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen()
+        self.port = self.server.getsockname()[1]
+        self.client = None
+        self.connections = 0
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+
+    def serve(self):
+        while True:
+            try:
+                client, _ = self.server.accept()
+            except OSError:
+                return
+            self.client = client
+            self.connections += 1
+            threading.Thread(target=self.handle, args=(client,), daemon=True).start()
+
+    def receive(self, client, size):
+        data = b''
+        while len(data) < size:
+            chunk = client.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("Client closed the connection")
+            data += chunk
+        return data
+
+    def handle(self, client):
+        try:
+            self.receive(client, 4)  # "API\0"
+            size = struct.unpack('!I', self.receive(client, 4))[0]
+            self.receive(client, size)  # Supported version range
+            client.sendall(message(176, '20260101 00:00:00 UTC'))
+            while True:
+                size = struct.unpack('!I', self.receive(client, 4))[0]
+                fields = self.receive(client, size).split(b'\0')
+                if fields[0] == START_API:
+                    client.sendall(message(9, 1, 1))
+                elif fields[0] == REQ_CURRENT_TIME:
+                    client.sendall(message(49, 1, int(time.time())))
+        except OSError:
+            pass
+        finally:
+            client.close()
+
+    def kill(self):
+        self.client.shutdown(socket.SHUT_RDWR)
+        self.client.close()
+
+    def close(self):
+        self.server.close()
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_dropped_connection_is_recovered_quickly():
+    tws = StubTws()
+    broker = IBBroker('127.0.0.1', tws.port, 1, 'x')
+    supervisor = ConnectionSupervisor(broker, heartbeat_interval=0.05, heartbeat_timeout=0.5,
+                                      initial_backoff=0.05, max_backoff=0.2)
+    try:
+        broker.connect()
+        assert broker.ping(timeout=2) > 0
+        supervisor.start()
+        assert supervisor.wait_until_connected(timeout=2)
+
+        tws.kill()
+        assert wait_until(lambda: len(supervisor.recovery_times) == 1)
+        assert tws.connections == 2
+        assert supervisor.recovery_times[0] < 2
+        assert broker.get_server_time(timeout=2) > 0
+    finally:
+        supervisor.stop()
+        broker.disconnect()
+        tws.close()
+
+
+def test_heartbeat_and_server_time_pings_do_not_interfere():
+    tws = StubTws()
+    broker = IBBroker('127.0.0.1', tws.port, 1, 'x')
+    try:
+        broker.connect()
+        results = []
+        pings = [threading.Thread(target=lambda: results.append(broker.ping(timeout=2))) for _ in range(5)]
+        for ping in pings:
+            ping.start()
+        for ping in pings:
+            ping.join()
+        assert len(results) == 5
+    finally:
+        broker.disconnect()
+        tws.close()
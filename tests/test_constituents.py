@@ -0,0 +1,75 @@
+# test_constituents.py
+
+import json
+
+import pytest
+
+from constituents import ConstituentFile, ConstituentSet, iter_json_array
+
+
+def chunked(document, size):
+    data = json.dumps(document).encode()
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+DOCUMENT = {
+    'date': '2026-01-05',
+    'constituents': [
+        {'ticker': 'AAA', 'isin': 'US0000000001', 'exchange': 'US', 'name': 'Ä Corp', 'rank': 1, 'weight': 3},
+        {'ticker': 'BBB', 'isin': 'GB0000000002', 'exchange': 'LSE', 'name': 'B plc', 'rank': 2, 'weight': 1},
+    ],
+    'source': 'test',
+}
+
+
+@pytest.mark.parametrize('size', [1, 3, 7, 64 * 1024])
+def test_iter_json_array_across_chunk_boundaries(size):
+    metadata = {}
+    items = list(iter_json_array(chunked(DOCUMENT, size), 'constituents', metadata))
+    assert items == DOCUMENT['constituents']
+    assert metadata == {'date': '2026-01-05', 'source': 'test'}
+
+
+def test_iter_json_array_without_the_key():
+    metadata = {}
+    assert list(iter_json_array(chunked({'date': 'x'}, 2), 'constituents', metadata)) == []
+    assert metadata == {'date': 'x'}
+
+
+def test_iter_json_array_truncated_document():
+    data = json.dumps(DOCUMENT).encode()[:60]
+    with pytest.raises(ValueError):
+        list(iter_json_array([data], 'constituents'))
+
+
+def test_constituent_set_validates_and_weights():
+    constituents = ConstituentSet.from_stream(chunked(dict(DOCUMENT, constituents=DOCUMENT['constituents'] + [
+        {'ticker': 'AAA', 'isin': 'US0000000009', 'exchange': 'US'},  # Duplicate ticker
+        {'ticker': 'CCC', 'isin': 'GB0000000002', 'exchange': 'LSE'},  # Duplicate ISIN
+        {'ticker': 'DDD', 'isin': 'DE0000000004'},  # No exchange
+        {'ticker': 'EEE', 'isin': 'DE0000000005', 'exchange': 'F', 'weight': -1},
+        'not a constituent',
+    ]), 5))
+    assert constituents.date == '2026-01-05'
+    assert list(constituents) == ['AAA', 'BBB']
+    assert (constituents.rejected, constituents.duplicates) == (3, 2)
+    assert constituents['AAA'] == {'isin': 'US0000000001', 'exchange': 'US', 'name': 'Ä Corp', 'rank': 1,
+                                   'weight': 0.75}
+    assert constituents.to_records()[1]['ticker'] == 'BBB'
+
+
+def test_constituents_without_weights_are_equal_weighted():
+    constituents = ConstituentSet.from_records([
+        {'ticker': 'AAA', 'isin': 'US0000000001', 'exchange': 'US', 'weight': 2},
+        {'ticker': 'BBB', 'isin': 'GB0000000002', 'exchange': 'LSE'},
+    ])
+    assert constituents['AAA']['weight'] == constituents['BBB']['weight'] == 0.5
+    assert 'lack a weight' in constituents.summary()
+
+
+def test_constituent_file(tmp_path):
+    path = tmp_path / 'constituents.json'
+    path.write_text(json.dumps(DOCUMENT))
+    top = ConstituentFile(str(path)).get_top20()
+    assert top['date'] == '2026-01-05'
+    assert sorted(top['constituents']) == ['AAA', 'BBB']
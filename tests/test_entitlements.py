@@ -0,0 +1,36 @@
+# test_entitlements.py
+
+import json
+from types import SimpleNamespace
+
+from entitlements import EntitlementRegistry
+
+
+def contract(con_id, exchange='LSE'):
+    return SimpleNamespace(conId=con_id, symbol=f"S{con_id}", primaryExchange=exchange, exchange='SMART')
+
+
+def test_live_answer_is_kept_for_its_contract_only(tmp_path):
+    registry = EntitlementRegistry(str(tmp_path / 'entitlements.json'))
+    registry.on_market_data_type(contract(1), 1)
+    assert registry.lookup(contract(1)) == registry.LIVE
+    assert registry.lookup(contract(2)) is None
+
+
+def test_delayed_answers_and_errors_cover_the_exchange(tmp_path):
+    registry = EntitlementRegistry(str(tmp_path / 'entitlements.json'))
+    registry.on_market_data_type(contract(1), 3)
+    assert registry.lookup(contract(2)) == registry.DELAYED
+    registry.on_error(contract(3, 'US'), 10168)
+    assert registry.lookup(contract(4, 'US')) == registry.NONE
+    registry.on_error(contract(5, 'F'), 2104)
+    assert registry.lookup(contract(5, 'F')) is None
+
+
+def test_changes_are_saved_and_reloaded(tmp_path):
+    path = tmp_path / 'entitlements.json'
+    registry = EntitlementRegistry(str(path))
+    registry.on_error(contract(1), 354)
+    registry.flush()
+    assert json.loads(path.read_text())['exchange'] == {'LSE': registry.entries['exchange']['LSE']}
+    assert EntitlementRegistry(str(path)).lookup(contract(2)) == registry.NONE
@@ -0,0 +1,87 @@
+# test_execution_store.py
+
+import os
+import time
+from types import SimpleNamespace
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from execution_store import ExecutionStore  # noqa: E402
+
+
+def fill(store, order_id, exec_id, shares, price, commission=1.0):
+    store.on_exec_details(1, None, SimpleNamespace(orderId=order_id, execId=exec_id, shares=shares, price=price))
+    store.on_commission_report(SimpleNamespace(execId=exec_id, commission=commission))
+
+
+def test_orders_are_recorded_by_market(tmp_path):
+    store = ExecutionStore(str(tmp_path))
+    store.order_submitted(1, 'AAA', 'LSE', 'BUY', 10, intended_price=100.0)
+    fill(store, 1, 'e1', 10, 101.0)
+    store.on_order_status(1, {'status': 'Filled'})
+    store.order_submitted(2, 'BBB', 'US', 'SELL', 5, intended_price=50.0)
+    fill(store, 2, 'e2', 5, 50.0)
+    store.on_order_status(2, {'status': 'Filled'})
+
+    summary = {row['exchange']: row for row in store.summary(by=('exchange',))}
+    assert sorted(summary) == ['LSE', 'US']
+    assert summary['LSE']['slippage_bps'] == pytest.approx(100.0)
+    assert summary['US']['fill_ratio'] == 1.0
+    assert store.pending == {} and store.fills == {}
+
+
+def test_torn_rows_are_cut_on_load_and_before_appending(tmp_path):
+    store = ExecutionStore(str(tmp_path))
+    store.order_submitted(1, 'AAA', 'US', 'BUY', 10)
+    store.on_order_status(1, {'status': 'Cancelled'})
+    partition = store._partitions('orders')[0]
+
+    # A crash after writing only some columns of the next row
+    for name in ('order_id', 'day'):
+        with open(os.path.join(partition, f"{name}.bin"), 'ab') as file:
+            file.write(np.zeros(1, dtype=ExecutionStore.ORDER_COLUMNS[name]).tobytes())
+    assert len(store.load('orders', ('order_id', 'quantity'))['order_id']) == 1
+
+    reopened = ExecutionStore(str(tmp_path))
+    reopened.order_submitted(2, 'BBB', 'US', 'SELL', 5)
+    reopened.on_order_status(2, {'status': 'Cancelled'})
+    data = reopened.load('orders', ('order_id', 'quantity'))
+    assert data['order_id'].tolist() == [1, 2]
+    assert data['quantity'].tolist() == [10.0, 5.0]
+
+
+def test_prune_records_orders_without_a_final_status(tmp_path):
+    store = ExecutionStore(str(tmp_path), max_pending_age=60)
+    store.order_submitted(1, 'AAA', 'US', 'BUY', 10)
+    store.order_submitted(2, 'BBB', 'US', 'BUY', 10)
+    store.pending[1]['submit_time'] = time.time() - 120
+    store.prune()
+    assert list(store.pending) == [2]
+    assert store.load('orders', ('order_id',))['order_id'].tolist() == [1]
+
+
+def test_fills_reported_after_the_final_status_are_waited_for(tmp_path):
+    store = ExecutionStore(str(tmp_path))
+    store.order_submitted(1, 'AAA', 'US', 'BUY', 10, intended_price=100.0)
+    store.on_order_status(1, {'status': 'Filled', 'filled': 10.0})
+    assert 1 in store.pending
+    fill(store, 1, 'e1', 4, 100.0)
+    assert 1 in store.pending
+    fill(store, 1, 'e2', 6, 102.0, commission=2.0)
+    assert store.pending == {}
+
+    row, = store.summary(by=('symbol',))
+    assert row['fill_ratio'] == 1.0
+    assert row['slippage_bps'] == pytest.approx(120.0)
+    assert row['commission'] == 3.0
+
+
+def test_flush_writes_orders_whose_fills_never_arrived(tmp_path):
+    store = ExecutionStore(str(tmp_path))
+    store.order_submitted(1, 'AAA', 'US', 'BUY', 10)
+    store.on_order_status(1, {'status': 'Filled', 'filled': 10.0})
+    store.flush()
+    assert store.pending == {}
+    assert store.load('orders', ('order_id',))['order_id'].tolist() == [1]
@@ -0,0 +1,70 @@
+# test_logging_setup.py
+
+import logging
+import queue
+
+from utils import logging_setup
+from utils.logging_setup import LazyQueueHandler, RateLimitFilter
+
+
+def make_record(msg, *args, level=logging.INFO, name='test'):
+    return logging.LogRecord(name, level, __file__, 1, msg, args, None)
+
+
+def test_burst_is_limited_and_suppressed_count_reported(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(logging_setup.time, 'monotonic', lambda: now[0])
+    rate_filter = RateLimitFilter(interval=10, burst=2)
+
+    assert [rate_filter.filter(make_record('tick %s', i)) for i in range(4)] == [True, True, False, False]
+    assert rate_filter.filter(make_record('failed', level=logging.ERROR))
+
+    now[0] += 10
+    record = make_record('tick %s', 5)
+    assert rate_filter.filter(record)
+    assert record.getMessage() == 'tick 5 [2 similar messages suppressed]'
+
+
+def test_expired_windows_are_evicted(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(logging_setup.time, 'monotonic', lambda: now[0])
+    rate_filter = RateLimitFilter(interval=10, burst=1)
+
+    rate_filter.filter(make_record('once'))
+    rate_filter.filter(make_record('twice'))
+    rate_filter.filter(make_record('twice'))
+    now[0] += 10
+    rate_filter.filter(make_record('later'))
+    # 'twice' is kept until its suppressed record has been reported
+    assert set(key[1] for key in rate_filter.windows) == {'twice', 'later'}
+
+
+def test_windows_are_capped_least_recently_used_first():
+    rate_filter = RateLimitFilter(interval=10, burst=5, max_windows=3)
+    for msg in ['a', 'b', 'c', 'a', 'd']:
+        rate_filter.filter(make_record(msg))
+    assert [key[1] for key in rate_filter.windows] == ['c', 'a', 'd']
+
+
+class Contract:
+    def __init__(self, symbol):
+        self.symbol = symbol
+
+    def __str__(self):
+        return self.symbol
+
+
+def test_mutable_arguments_are_rendered_before_queueing():
+    handler = LazyQueueHandler(queue.SimpleQueue())
+    contract = Contract('AAA')
+    record = handler.prepare(make_record('contract %s', contract))
+    contract.symbol = 'BBB'
+    assert record.msg == 'contract AAA'
+    assert record.args is None
+
+
+def test_immutable_arguments_are_formatted_lazily():
+    handler = LazyQueueHandler(queue.SimpleQueue())
+    record = handler.prepare(make_record('%s %s at %s', 'BUY', 10, 12.5))
+    assert record.msg == '%s %s at %s'
+    assert record.getMessage() == 'BUY 10 at 12.5'
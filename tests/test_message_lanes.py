@@ -0,0 +1,139 @@
+# test_message_lanes.py
+
+import threading
+
+import pytest
+
+from ibapi.message import IN
+from message_lanes import LaneQueue, ORDER_LANE, MARKET_DATA_LANE, classify
+
+
+def message(msg_id, *fields):
+    return b"\0".join(str(field).encode() for field in (msg_id,) + fields) + b"\0"
+
+
+def tick_price(req_id, tick_type, price):
+    return message(IN.TICK_PRICE, 6, req_id, tick_type, price, 100, 0)
+
+
+def drain(queue):
+    messages = []
+    while not queue.empty():
+        messages.extend(queue.get_batch(timeout=0))
+    return messages
+
+
+def test_classify():
+    assert classify(message(IN.ORDER_STATUS, 1)) == ORDER_LANE
+    assert classify(tick_price(1, 4, 10.0)) == MARKET_DATA_LANE
+
+
+def test_order_lane_is_served_first():
+    queue = LaneQueue()
+    queue.put(tick_price(1, 4, 10.0))
+    queue.put(message(IN.ORDER_STATUS, 7))
+    assert queue.get_batch(timeout=0) == [message(IN.ORDER_STATUS, 7)]
+
+
+def test_conflation_keeps_the_latest_tick_per_stream_in_place():
+    queue = LaneQueue()
+    queue.put(tick_price(1, 4, 10.0))
+    queue.put(tick_price(2, 4, 20.0))
+    queue.put(tick_price(1, 4, 11.0))
+    queue.put(tick_price(1, 1, 9.0))
+    assert drain(queue) == [tick_price(1, 4, 11.0), tick_price(2, 4, 20.0), tick_price(1, 1, 9.0)]
+    assert queue.stats()['conflated'] == 1
+
+    queue.put(tick_price(1, 4, 12.0))
+    assert drain(queue) == [tick_price(1, 4, 12.0)]
+
+
+def test_conflation_can_be_disabled():
+    queue = LaneQueue(conflate=False)
+    queue.put(tick_price(1, 4, 10.0))
+    queue.put(tick_price(1, 4, 11.0))
+    assert len(drain(queue)) == 2
+
+
+def test_drop_oldest_skips_end_markers():
+    queue = LaneQueue(max_pending=2, overflow='drop_oldest')
+    snapshot_end = message(IN.TICK_SNAPSHOT_END, 1, 5)
+    queue.put(snapshot_end)
+    queue.put(tick_price(1, 4, 10.0))
+    queue.put(tick_price(2, 4, 20.0))
+    assert drain(queue) == [snapshot_end, tick_price(2, 4, 20.0)]
+    assert queue.stats()['dropped'] == 1
+
+
+def test_drop_newest_drops_only_streaming_ticks():
+    queue = LaneQueue(max_pending=1, overflow='drop_newest')
+    queue.put(tick_price(1, 4, 10.0))
+    queue.put(tick_price(2, 4, 20.0))
+    assert queue.stats()['dropped'] == 1
+    assert drain(queue) == [tick_price(1, 4, 10.0)]
+
+
+@pytest.mark.parametrize('overflow', ['drop_oldest', 'drop_newest', 'block'])
+def test_control_messages_block_instead_of_being_dropped(overflow):
+    queue = LaneQueue(max_pending=1, overflow=overflow)
+    data_type = message(IN.MARKET_DATA_TYPE, 1, 5, 3)
+    snapshot_end = message(IN.TICK_SNAPSHOT_END, 1, 5)
+    queue.put(data_type)
+    writer = threading.Thread(target=queue.put, args=(snapshot_end,))
+    writer.start()
+    writer.join(0.1)
+    assert writer.is_alive()
+
+    assert queue.get_batch(timeout=0) == [data_type]
+    writer.join(5)
+    assert not writer.is_alive()
+    assert drain(queue) == [snapshot_end]
+    assert queue.stats()['dropped'] == 0
+    assert queue.stats()['blocked'] == 1
+
+
+def test_unknown_overflow_policy():
+    with pytest.raises(ValueError):
+        LaneQueue(overflow='drop_everything')
+
+
+def test_lanes_are_served_in_priority_order():
+    queue = LaneQueue()
+    contract_data = message(IN.CONTRACT_DATA, 8, 1)
+    queue.put(contract_data)
+    queue.put(tick_price(1, 4, 10.0))
+    queue.put(message(IN.ORDER_STATUS, 7))
+    assert [queue.get_batch(timeout=0) for _ in range(3)] == [
+        [message(IN.ORDER_STATUS, 7)], [tick_price(1, 4, 10.0)], [contract_data]]
+
+
+def test_overdue_bulk_lane_is_not_starved(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr('message_lanes.time.monotonic', lambda: now[0])
+    queue = LaneQueue(max_lane_wait=0.5, conflate=False)
+    contract_data = message(IN.CONTRACT_DATA, 8, 1)
+    queue.put(contract_data)
+
+    # A steady tick stream keeps the market data lane busy
+    served = []
+    for i in range(10):
+        now[0] += 0.1
+        queue.put(tick_price(1, 4, 10.0 + i))
+        served.extend(queue.get_batch(timeout=0))
+    assert contract_data in served
+    assert served.index(contract_data) <= 5
+    assert queue.stats()['aged'] == 1
+
+
+def test_overdue_lanes_are_served_oldest_first(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr('message_lanes.time.monotonic', lambda: now[0])
+    queue = LaneQueue(max_lane_wait=0.5)
+    contract_data = message(IN.CONTRACT_DATA, 8, 1)
+    queue.put(contract_data)
+    now[0] += 0.2
+    queue.put(tick_price(1, 4, 10.0))
+    now[0] += 1
+    queue.put(message(IN.ORDER_STATUS, 7))
+    assert [queue.get_batch(timeout=0) for _ in range(3)] == [
+        [contract_data], [tick_price(1, 4, 10.0)], [message(IN.ORDER_STATUS, 7)]]
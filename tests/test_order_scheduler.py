@@ -0,0 +1,130 @@
+# test_order_scheduler.py
+
+import threading
+from decimal import Decimal
+
+import pytest
+
+pytest.importorskip('pytz')
+
+from order_scheduler import OrderScheduler  # noqa: E402
+from trading_params import TradingParams  # noqa: E402
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+    def wait(self, event, timeout):
+        if not event.is_set():
+            self.now += timeout
+        return event.is_set()
+
+
+class FakeBus:
+    def subscribe(self, msg_type, handler, **kwargs):
+        return (msg_type, handler)
+
+    def unsubscribe(self, subscription):
+        pass
+
+
+class FakeBroker:
+    """
+    Accepts orders without filling them unless `fill` is set; markets in `open_markets` are open.
+    """
+
+    def __init__(self, open_markets=(), fill=False, latest=None):
+        self.ib = type('IB', (), {})()
+        self.ib.bus = FakeBus()
+        self.ib.order_statuses = {}
+        self.open_markets = set(open_markets)
+        self.fill = fill
+        self.latest = latest or {}
+        self.placed = []
+        self.cancelled = []
+
+    def is_market_open(self, exchange):
+        return exchange in self.open_markets
+
+    def latest_price(self, symbol):
+        return self.latest.get(symbol)
+
+    def place_order(self, **order):
+        order_id = len(self.placed) + 1
+        self.placed.append(order)
+        if self.fill:
+            self.ib.order_statuses[order_id] = {'status': 'Filled', 'filled': float(order['quantity'])}
+        return order_id
+
+    def cancel_order(self, order_id):
+        self.cancelled.append(order_id)
+
+
+def sell(symbol, shares, exchange):
+    return {'symbol': symbol, 'action': 'SELL', 'shares': Decimal(shares), 'orderType': 'MKT',
+            'price': Decimal('10'), 'exchange': exchange}
+
+
+def buy(symbol, shares, exchange, price='10', limit_price='10.20'):
+    return {'symbol': symbol, 'action': 'BUY', 'shares': Decimal(shares), 'orderType': 'LMT',
+            'price': Decimal(price), 'limit_price': Decimal(limit_price), 'exchange': exchange}
+
+
+def scheduler(broker, **kwargs):
+    return OrderScheduler(broker, clock=FakeClock(), **kwargs)
+
+
+def test_closed_market_orders_are_left_working_without_waiting():
+    broker = FakeBroker(open_markets=())
+    result = scheduler(broker, timeout=3600).execute([sell('AAA', 100, 'LSE'), sell('BBB', 5, None)])
+    assert result == {}
+    assert [order['symbol'] for order in broker.placed] == ['AAA', 'BBB']
+    assert broker.cancelled == []
+
+
+def test_open_market_orders_are_worked_to_completion():
+    broker = FakeBroker(open_markets=('US',), fill=True)
+    result = scheduler(broker, max_child_size=40).execute([sell('AAA', 100, 'US')])
+    assert result == {'AAA': Decimal('100')}
+    assert [order['quantity'] for order in broker.placed] == [40, 40, 20]
+
+
+def test_timeout_leaves_children_working():
+    broker = FakeBroker(open_markets=('US',))
+    sched = scheduler(broker, max_child_size=40, timeout=10)
+    sched.execute([sell('AAA', 100, 'US')])
+    assert len(broker.placed) == 2
+    assert broker.cancelled == []
+
+
+def test_no_repricing_without_a_quote():
+    broker = FakeBroker(open_markets=('US',))
+    sched = scheduler(broker, timeout=300, child_timeout=60, max_live_per_symbol=1)
+    sched.execute([buy('AAA', 10, 'US')])
+    assert broker.cancelled == []
+    assert len(broker.placed) == 1
+
+
+def test_repricing_with_a_new_quote():
+    class QuotedAfterSubmit(FakeBroker):
+        def place_order(self, **order):
+            order_id = super().place_order(**order)
+            self.latest['AAA'] = 11.0
+            return order_id
+
+    broker = QuotedAfterSubmit(open_markets=('US',))
+    sched = scheduler(broker, timeout=100, child_timeout=60, max_live_per_symbol=1)
+    sched.execute([buy('AAA', 10, 'US')])
+    assert broker.cancelled == [1]
+
+
+def test_configure_applies_trading_params():
+    values = {'trading.max_order_size': 7, 'trading.max_live_children': 3, 'trading.child_timeout': 5}
+    config = type('Config', (), {'get': lambda self, key, default=None: values.get(key, default)})()
+    sched = scheduler(FakeBroker())
+    sched.configure(TradingParams.from_config(config))
+    assert (sched.max_child_size, sched.max_live_per_symbol, sched.child_timeout) == (Decimal('7'), 3, 5.0)
@@ -0,0 +1,73 @@
+# test_portfolio_manager.py
+
+from decimal import Decimal
+
+import pytest
+
+pytest.importorskip('pytz')
+
+from portfolio_manager import PortfolioManager  # noqa: E402
+from trading_params import TradingParams  # noqa: E402
+
+
+class FakeFxRates:
+    RATES = {'USD': Decimal('1'), 'EUR': Decimal('1.1')}
+
+    def to_base(self, currency):
+        if currency not in self.RATES:
+            raise ValueError(f"No FX rate available for {currency} to USD")
+        return self.RATES[currency]
+
+
+class FakeBroker:
+    EXCHANGE_MAPPING = {'US': ('SMART', 'USD'), 'F': ('FWB', 'EUR'), 'ZW': ('ZSE', 'ZWL')}
+    clock = None
+
+    def get_currency(self, exchange):
+        return self.EXCHANGE_MAPPING.get(exchange, ('SMART', 'USD'))[1]
+
+
+class FakeConfig:
+    def __init__(self, **values):
+        self.values = {f"trading.{key}": value for key, value in values.items()}
+        self.trading = TradingParams.from_config(self)
+
+    def get(self, key, default=None):
+        return self.values.get(key, default)
+
+
+def manager(**trading):
+    return PortfolioManager(FakeBroker(), FakeConfig(cash_buffer=0, **trading), fx_rates=FakeFxRates(),
+                            clock=object())
+
+
+def portfolio(**positions):
+    result = {symbol: {'shares': Decimal(shares), 'price': Decimal(price), 'currency': currency}
+              for symbol, (shares, price, currency) in positions.items()}
+    result['CASH'] = Decimal('1000')
+    return result
+
+
+def test_symbols_without_fx_rate_are_skipped_not_fatal():
+    pm = manager(max_position_size='1')
+    current = portfolio(OLD=('10', '5', 'USD'), ZIM=('10', '5', 'ZWL'))
+    top = {'AAA': {'exchange': 'US', 'price': 10}, 'BBB': {'exchange': 'ZW', 'price': 10}}
+    sells, buys = pm.calculate_rebalance_orders(current, top)
+    assert [order['symbol'] for order in sells] == ['OLD']
+    assert [order['symbol'] for order in buys] == ['AAA']
+
+
+def test_solver_skips_symbols_without_fx_rate():
+    pm = manager(max_position_size='1', rebalance_solver=True)
+    current = portfolio(ZIM=('10', '5', 'ZWL'))
+    top = {'AAA': {'exchange': 'F', 'price': 10}, 'BBB': {'exchange': 'ZW', 'price': 10}}
+    sells, buys = pm.calculate_solved_orders(current, top)
+    assert sells == []
+    assert [order['symbol'] for order in buys] == ['AAA']
+
+
+def test_buy_orders_skip_symbols_without_fx_rate():
+    pm = manager(max_position_size='1')
+    orders = pm.calculate_buy_orders({'AAA': 10, 'BBB': 10}, portfolio(),
+                                     {'AAA': {'exchange': 'US'}, 'BBB': {'exchange': 'ZW'}})
+    assert [(order['symbol'], order['shares']) for order in orders] == [('AAA', Decimal('100'))]
@@ -0,0 +1,105 @@
+# test_pretrade.py
+
+from decimal import Decimal
+
+from pretrade import PreTradeValidator
+
+
+class FakeBus:
+    def __init__(self):
+        self.handlers = {}
+
+    def subscribe(self, msg_type, handler, req_id=None):
+        self.handlers[(msg_type, req_id)] = handler
+
+    def release(self, req_id):
+        for key in [key for key in self.handlers if key[1] == req_id]:
+            del self.handlers[key]
+
+
+class FakeOrderState:
+    initMarginChange = '100'
+    initMarginBefore = '0'
+    equityWithLoanBefore = '1000'
+    commission = '1'
+    maxCommission = ''
+    warningText = ''
+
+
+class FakeBroker:
+    """
+    Answers each whatIf order with the errors listed for it, then an OrderState unless one of
+    them was final.
+    """
+
+    def __init__(self, errors):
+        self.errors = errors
+        self.ib = self
+        self.bus = FakeBus()
+        self.next_order_id = 0
+
+    def ensure_connection(self):
+        pass
+
+    def reserve_order_id(self):
+        self.next_order_id += 1
+        return self.next_order_id
+
+    def create_contract(self, symbol, sec_type, exchange):
+        return symbol
+
+    def placeOrder(self, order_id, contract, order):
+        for code in self.errors.get(contract, []):
+            self.bus.handlers[('error', order_id)](order_id, code, 'error')
+        if ('error', order_id) in self.bus.handlers and not self.errors.get(contract):
+            self.bus.handlers[('openOrder', order_id)](order_id, contract, order, FakeOrderState())
+
+    def wait_for_event(self, event, timeout):
+        return event.is_set()
+
+
+def order(symbol, action='BUY', shares=10):
+    return {'symbol': symbol, 'action': action, 'shares': Decimal(shares), 'orderType': 'MKT'}
+
+
+def test_only_reject_codes_reject():
+    validator = PreTradeValidator(FakeBroker({'AAA': [201], 'BBB': [2174], 'CCC': [10167, 10090]}))
+    results = validator.what_if([order('AAA'), order('BBB'), order('CCC'), order('DDD')])
+    assert results[0] == {'ok': False, 'error': '201: error'}
+    assert results[1] == {'ok': False, 'error': None}
+    assert results[2] == {'ok': False, 'error': None}
+    assert results[3]['ok'] and results[3]['init_margin_change'] == 100.0
+
+
+class CannedValidator(PreTradeValidator):
+    def __init__(self, results):
+        super().__init__(broker=None)
+        self.results = results
+
+    def what_if(self, orders):
+        return [dict(self.results[order['symbol']]) for order in orders]
+
+
+def answer(margin_change, equity=1000.0, margin=0.0, commission=0.0):
+    return {'ok': True, 'error': None, 'init_margin_change': margin_change, 'init_margin_before': margin,
+            'equity_with_loan_before': equity, 'commission': commission, 'warning': ''}
+
+
+def test_adjust_drops_rejected_and_keeps_unanswered_orders():
+    validator = CannedValidator({'AAA': {'ok': False, 'error': '201: rejected'},
+                                 'BBB': {'ok': False, 'error': None}, 'CCC': answer(100.0)})
+    sells, buys = validator.adjust([order('AAA', 'SELL')], [order('BBB'), order('CCC')])
+    assert sells == []
+    assert [o['symbol'] for o in buys] == ['BBB', 'CCC']
+
+
+def test_adjust_scales_buys_to_the_available_funds():
+    validator = CannedValidator({'AAA': answer(600.0), 'BBB': answer(600.0)})
+    sells, buys = validator.adjust([], [order('AAA'), order('BBB', shares=1)])
+    assert [(o['symbol'], o['shares']) for o in buys] == [('AAA', Decimal('8'))]
+
+
+def test_adjust_without_margin_needed_keeps_the_buys():
+    validator = CannedValidator({'AAA': answer(0.0, equity=0.0, margin=10.0)})
+    sells, buys = validator.adjust([], [order('AAA')])
+    assert buys == [order('AAA')]
@@ -0,0 +1,150 @@
+# test_price_table.py
+
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from price_table import SharedPriceTable  # noqa: E402
+
+
+def contract(con_id, symbol):
+    return SimpleNamespace(conId=con_id, symbol=symbol, secType='STK', exchange='SMART', primaryExchange='NASDAQ',
+                           currency='USD', localSymbol=symbol)
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'prices.table')
+
+
+def test_reader_sees_contracts_and_prices_published_later(path):
+    writer = SharedPriceTable(path, capacity=4, writable=True)
+    reader = SharedPriceTable(path)
+    assert reader.get_price('AAA') is None
+
+    writer.publish_contract('AAA', contract(11, 'AAA'))
+    writer.publish_contract('BBB', contract(22, 'BBB'))
+    assert reader.get_price('AAA') is None  # Known, but no price yet
+    writer.publish_price('AAA', 12.5)
+    writer.publish_price('ZZZ', 1.0)  # Unknown symbols are ignored
+
+    assert reader.get_price('AAA') == 12.5
+    assert reader.get_contract(con_id=22) == {'symbol': 'BBB', 'secType': 'STK', 'exchange': 'SMART',
+                                              'primaryExchange': 'NASDAQ', 'currency': 'USD',
+                                              'localSymbol': 'BBB', 'conId': 22}
+    assert (reader.symbols, reader.con_ids) == ({'AAA': 0, 'BBB': 1}, {11: 0, 22: 1})
+
+    writer.publish_contract('AAA', contract(33, 'AAA'))  # Re-resolved contracts keep their slot
+    assert SharedPriceTable(path).get_contract(symbol='AAA')['conId'] == 33
+    assert reader.get_price('AAA') == 12.5
+
+
+def test_full_table_and_foreign_files(path, tmp_path):
+    writer = SharedPriceTable(path, capacity=1, writable=True)
+    writer.publish_contract('AAA', contract(11, 'AAA'))
+    with pytest.raises(ValueError):
+        writer.publish_contract('BBB', contract(22, 'BBB'))
+
+    other = tmp_path / 'other'
+    other.write_bytes(b'\0' * 64)
+    with pytest.raises(ValueError):
+        SharedPriceTable(str(other))
+
+
+def test_stale_prices_read_as_unknown(path):
+    writer = SharedPriceTable(path, writable=True)
+    writer.publish_contract('AAA', contract(11, 'AAA'))
+    writer.publish_price('AAA', 10.0)
+    reader = SharedPriceTable(path)
+    assert reader.get_price('AAA', max_age=60) == 10.0
+    writer._write(0, updated=time.time() - 120)
+    assert reader.get_price('AAA', max_age=60) is None
+    assert reader.get_price('AAA') == 10.0
+
+
+def test_a_slot_left_busy_reads_as_unknown(path, monkeypatch):
+    writer = SharedPriceTable(path, writable=True)
+    writer.publish_contract('AAA', contract(11, 'AAA'))
+    writer.publish_price('AAA', 10.0)
+    reader = SharedPriceTable(path)
+    monkeypatch.setattr(SharedPriceTable, 'READ_TIMEOUT', 0.01)
+
+    writer.slots['seq'][0] += 1  # A writer that stopped mid-update
+    assert reader.get_price('AAA') is None
+    assert reader.get_contract(symbol='AAA') is None
+    writer.slots['seq'][0] += 1
+    assert reader.get_price('AAA') == 10.0
+
+
+def test_reads_are_consistent_while_a_writer_runs(path):
+    writer = SharedPriceTable(path, writable=True)
+    writer.publish_contract('AAA', contract(11, 'AAA'))
+    reader = SharedPriceTable(path)
+    stop = threading.Event()
+
+    def write():
+        value = 0.0
+        while not stop.is_set():
+            value += 1
+            writer._write(0, price=value, updated=value)
+
+    thread = threading.Thread(target=write)
+    thread.start()
+    try:
+        for _ in range(20000):
+            row = reader._read(0)
+            if row is not None:
+                assert row['price'] == row['updated'] or np.isnan(row['price'])
+    finally:
+        stop.set()
+        thread.join()
+
+
+def test_symbol_requests_are_merged(path):
+    writer = SharedPriceTable(path, writable=True)
+    reader = SharedPriceTable(path)
+    reader.request_symbols('client1', {'AAA': {'isin': 'US1', 'exchange': 'US', 'name': 'A', 'rank': 1}})
+    reader.request_symbols('client2', {'BBB': {'isin': 'GB2', 'exchange': 'LSE', 'name': 'B'}})
+    assert writer.requested_symbols() == {'AAA': {'isin': 'US1', 'exchange': 'US', 'name': 'A'},
+                                          'BBB': {'isin': 'GB2', 'exchange': 'LSE', 'name': 'B'}}
+
+    old = os.path.join(f"{path}.requests", 'client1.json')
+    os.utime(old, (time.time() - 7200, time.time() - 7200))
+    assert list(writer.requested_symbols(max_age=3600)) == ['BBB']
+
+
+def test_tracker_falls_back_to_tws_for_unknown_or_stale_prices(path):
+    pytest.importorskip('pandas')
+    pytest.importorskip('exchange_calendars')
+    from broker import IBBroker
+
+    writer = SharedPriceTable(path, writable=True)
+    writer.publish_contract('AAA', contract(11, 'AAA'))
+    writer.publish_price('AAA', 10.0)
+    writer.publish_contract('OLD', contract(22, 'OLD'))
+    writer.publish_price('OLD', 5.0)
+    writer._write(1, updated=time.time() - 120)
+
+    broker = IBBroker('127.0.0.1', 7497, 1, 'x', price_table=SharedPriceTable(path), price_table_max_age=60)
+
+    def tws(*args, **kwargs):
+        raise ConnectionError("asked TWS")
+
+    broker.ensure_connection = tws
+    assert broker.get_market_price('US1', 'AAA', 'US', 'A') == 10.0
+    assert broker.get_contract('US1', 'AAA', 'US', 'A').conId == 11
+    for symbol in ('OLD', 'NEW'):
+        with pytest.raises(ConnectionError):
+            broker.get_market_price('XX', symbol, 'US', symbol)
+
+    broker.stream_price('AAA', None)
+    assert broker.latest_price('AAA') == 10.0
+    assert broker.price_streams == {}
+
+    broker.request_shared_prices({'NEW': {'isin': 'US9', 'exchange': 'US', 'name': 'New'}})
+    assert list(writer.requested_symbols()) == ['NEW']
@@ -0,0 +1,48 @@
+# test_rebalance_solver.py
+
+from decimal import Decimal
+
+from rebalance_solver import RebalanceSolver
+
+D = Decimal
+
+
+def holdings(**positions):
+    return {symbol: {'shares': D(shares), 'price': D(price)} for symbol, (shares, price) in positions.items()}
+
+
+def test_positions_within_their_band_are_not_traded():
+    trades, unresolved = RebalanceSolver(band=D('0.1')).solve(
+        holdings(AAA=(95, 10), BBB=(105, 10)), {'AAA': D(1000), 'BBB': D(1000)}, D(0), D(5000))
+    assert trades == {} and unresolved == []
+
+
+def test_positions_outside_their_band_go_back_to_target():
+    trades, _ = RebalanceSolver(band=D('0.1')).solve(
+        holdings(AAA=(50, 10), BBB=(150, 10)), {'AAA': D(1000), 'BBB': D(1000)}, D(0), D(5000))
+    assert trades == {'BBB': D(-50), 'AAA': D(50)}
+
+
+def test_former_constituents_are_sold():
+    trades, _ = RebalanceSolver().solve(holdings(OLD=(7, 3), AAA=(100, 10)), {'AAA': D(1000)}, D(0), D(5000))
+    assert trades == {'OLD': D(-7)}
+
+
+def test_max_position_value_caps_holdings():
+    trades, _ = RebalanceSolver(band=D('0.1')).solve(holdings(AAA=(100, 10)), {'AAA': D(1000)}, D(0), D(800))
+    assert trades == {'AAA': D(-20)}
+
+
+def test_buys_are_trimmed_and_funded_by_excess_when_cash_is_short():
+    trades, unresolved = RebalanceSolver(band=D('0.1')).solve(
+        holdings(AAA=(0, 10), BBB=(0, 10), CCC=(108, 10)),
+        {'AAA': D(1000), 'BBB': D(500), 'CCC': D(1000)}, D(500), D(5000))
+    # Trimming CCC to its target still leaves room only for BBB, which is then topped up to target
+    assert trades == {'CCC': D(-8), 'BBB': D(50)}
+    assert unresolved == ['AAA']
+
+
+def test_a_share_above_the_target_is_unresolved():
+    trades, unresolved = RebalanceSolver(band=D('0.1')).solve(holdings(AAA=(0, 500)), {'AAA': D(100)}, D(1000),
+                                                              D(5000))
+    assert trades == {} and unresolved == ['AAA']
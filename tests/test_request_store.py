@@ -0,0 +1,30 @@
+# test_request_store.py
+
+from datetime import datetime
+
+import pytest
+
+from clock import VirtualClock
+from request_store import RequestStore
+
+
+def test_open_entries_are_never_evicted_by_count():
+    store = RequestStore("test", max_entries=2)
+    entries = [store.open(req_id) for req_id in range(5)]
+    store.add(0, 'bar')
+    store.complete(0)
+    assert all(not entry.error for entry in entries)
+    assert store.take(0) == ['bar']
+    assert store.stats()['evicted'] == 0
+
+
+def test_abandoned_entries_are_evicted_after_max_age():
+    clock = VirtualClock(datetime(2024, 1, 8))
+    store = RequestStore("test", max_age=600, clock=clock)
+    abandoned = store.open(1)
+    clock.sleep(600)
+    store.open(2)
+    assert abandoned.event.is_set()
+    assert 1 not in store and 2 in store
+    with pytest.raises(ValueError):
+        store.take(1)
@@ -0,0 +1,72 @@
+# test_state_journal.py
+
+import os
+import threading
+import time
+
+from state_journal import StateJournal
+
+
+def order(order_id, status='PendingSubmit'):
+    return {'orderId': order_id, 'symbol': 'AAA', 'action': 'BUY', 'quantity': 10, 'status': status}
+
+
+def test_records_are_replayed_after_a_restart(tmp_path):
+    journal = StateJournal(str(tmp_path))
+    journal.load()
+    journal.record('order', order(1))
+    journal.record('order', order(2))
+    journal.record('order_status', {'orderId': 1, 'status': 'Submitted'}, sync=False)
+    journal.record('order_status', {'orderId': 2, 'status': 'Filled'}, sync=False)
+    journal.close()
+
+    restored = StateJournal(str(tmp_path))
+    restored.load()
+    assert restored.working_orders() == {'1': dict(order(1), status='Submitted')}
+
+
+def test_torn_last_record_is_ignored(tmp_path):
+    journal = StateJournal(str(tmp_path))
+    journal.load()
+    journal.record('order', order(1))
+    journal.close()
+    with open(os.path.join(str(tmp_path), StateJournal.JOURNAL_FILE), 'a') as file:
+        file.write('{"type": "order", "data": {"orderId"')
+
+    restored = StateJournal(str(tmp_path))
+    assert list(restored.load()['orders']) == ['1']
+
+
+def wait_until(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_unsynced_records_are_synced_in_the_background(tmp_path, monkeypatch):
+    synced = []
+    fsync = os.fsync
+    monkeypatch.setattr(os, 'fsync', lambda fd: (synced.append(threading.current_thread().name), fsync(fd)))
+    journal = StateJournal(str(tmp_path), sync_interval=0.01)
+    journal.load()
+    journal.record('order_status', {'orderId': 1, 'status': 'Submitted'}, sync=False)
+    assert wait_until(lambda: 'StateJournalSync' in synced)
+    journal.close()
+
+
+def test_unsynced_records_are_compacted_on_the_sync_thread(tmp_path, monkeypatch):
+    journal = StateJournal(str(tmp_path), compact_every=2, sync_interval=0.01)
+    journal.load()
+    compacted = []
+    compact = StateJournal._compact
+    monkeypatch.setattr(StateJournal, '_compact',
+                        lambda self: (compacted.append(threading.current_thread().name), compact(self)))
+    journal.record('order', order(1), sync=False)
+    journal.record('order_status', {'orderId': 1, 'status': 'Filled'}, sync=False)
+    assert wait_until(lambda: compacted == ['StateJournalSync'])
+    journal.close()
+
+    restored = StateJournal(str(tmp_path))
+    assert restored.load()['orders'] == {}
+    assert os.path.getsize(os.path.join(str(tmp_path), StateJournal.JOURNAL_FILE)) == 0
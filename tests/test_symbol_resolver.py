@@ -0,0 +1,46 @@
+# test_symbol_resolver.py
+
+from ibapi.contract import Contract
+
+from symbol_resolver import SymbolResolver
+
+
+def contract(symbol, currency='USD', primary_exchange='NASDAQ', sec_id='', sec_type='STK'):
+    result = Contract()
+    result.symbol = symbol
+    result.currency = currency
+    result.primaryExchange = primary_exchange
+    result.secId = sec_id
+    result.secType = sec_type
+    return result
+
+
+def test_bare_search_hit_is_rejected():
+    candidates = [('search', contract('AAPLX', currency='EUR', primary_exchange='IBIS'))]
+    assert SymbolResolver.select(candidates, 'US0378331005', 'AAPL', 'NASDAQ', 'USD') is None
+
+
+def test_symbol_in_wrong_currency_is_rejected():
+    candidates = [('ticker', contract('AAPL', currency='EUR'))]
+    assert SymbolResolver.select(candidates, None, 'AAPL', 'NASDAQ', 'USD') is None
+
+
+def test_exact_symbol_and_currency_is_accepted():
+    match = contract('AAPL')
+    candidates = [('search', contract('AAPLX', currency='EUR')), ('search', match)]
+    score, best = SymbolResolver.select(candidates, None, 'AAPL', 'NASDAQ', 'USD')
+    assert best is match
+    assert score >= SymbolResolver.MIN_SCORE
+
+
+def test_isin_match_wins():
+    by_isin = contract('AAPL', sec_id='US0378331005')
+    by_ticker = contract('AAPL')
+    score, best = SymbolResolver.select([('ticker', by_ticker), ('isin', by_isin)],
+                                        'US0378331005', 'AAPL', 'NASDAQ', 'USD')
+    assert best is by_isin
+
+
+def test_non_stock_is_rejected():
+    candidates = [('ticker', contract('AAPL', sec_type='OPT'))]
+    assert SymbolResolver.select(candidates, None, 'AAPL', 'NASDAQ', 'USD') is None
@@ -0,0 +1,57 @@
+# test_tick_capture.py
+
+import os
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from tick_capture import TickCapture, read_ticks, BID_ASK, TRADE  # noqa: E402
+
+DAY = '2026-01-05'
+TIME = 1767607200  # 2026-01-05 10:00 UTC
+
+
+def capture(directory, *prices, con_id=7):
+    ticks = TickCapture(None, str(directory), ring_size=4)
+    for i, price in enumerate(prices):
+        ticks._put((con_id, TIME + i, 0.0, TRADE, 0, -1, price, 1.0, 0.0, 0.0))
+    ticks.flush()
+    for file in ticks.files.values():
+        file.close()
+
+
+def path(directory, con_id=7):
+    return os.path.join(str(directory), DAY, f"{con_id}.ticks")
+
+
+def test_round_trip_with_overflow_and_kinds(tmp_path):
+    capture(tmp_path, 1.0, 2.0, 3.0, 4.0, 5.0, 6.0)
+    ticks = read_ticks(str(tmp_path), 7, DAY)
+    assert ticks['price'].tolist() == [1.0, 2.0, 3.0, 4.0, 5.0, 6.0]
+    assert ticks['time'].tolist() == list(range(TIME, TIME + 6))
+    assert len(read_ticks(str(tmp_path), 7, DAY, kinds=[BID_ASK])) == 0
+    assert len(read_ticks(str(tmp_path), 8, DAY)) == 0
+
+
+def test_torn_chunk_is_truncated_before_appending(tmp_path):
+    capture(tmp_path, 1.0, 2.0)
+    size = os.path.getsize(path(tmp_path))
+    capture(tmp_path, 3.0)
+    os.truncate(path(tmp_path), os.path.getsize(path(tmp_path)) - 5)  # Crash inside the second chunk
+
+    capture(tmp_path, 4.0)
+    assert read_ticks(str(tmp_path), 7, DAY)['price'].tolist() == [1.0, 2.0, 4.0]
+    assert os.path.getsize(path(tmp_path)) > size
+
+
+def test_read_resyncs_after_damage(tmp_path):
+    chunks = []
+    for price in (1.0, 2.0):
+        capture(tmp_path / str(price), price)
+        with open(path(tmp_path / str(price)), 'rb') as file:
+            chunks.append(file.read())
+    os.makedirs(os.path.dirname(path(tmp_path)))
+    with open(path(tmp_path), 'wb') as file:
+        file.write(chunks[0] + b'TCK1' + chunks[1][:10] + chunks[1])
+    assert read_ticks(str(tmp_path), 7, DAY)['price'].tolist() == [1.0, 2.0]
@@ -0,0 +1,60 @@
+# test_trading_params.py
+
+from decimal import Decimal
+
+import pytest
+
+from trading_params import TradingParams
+
+
+class FakeConfig:
+    def __init__(self, **values):
+        self.values = {f"trading.{key}": value for key, value in values.items()}
+
+    def get(self, key, default=None):
+        return self.values.get(key, default)
+
+
+def test_defaults():
+    params = TradingParams.from_config(FakeConfig())
+    assert params.cash_buffer == Decimal('50')
+    assert params.max_position_size == Decimal('0.3')
+    assert (params.max_order_size, params.max_live_children) == (50000, 2)
+    assert (params.child_timeout, params.fx_max_age) == (60.0, 900.0)
+    assert params.rebalance_solver is False
+    assert params.rebalance_band == Decimal('0.1')
+
+
+def test_values_are_converted():
+    params = TradingParams.from_config(FakeConfig(cash_buffer=100.5, max_position_size='0.2', max_order_size='10',
+                                                  rebalance_solver=True, rebalance_band=0.05))
+    assert params.cash_buffer == Decimal('100.5')
+    assert params.max_position_size == Decimal('0.2')
+    assert params.max_order_size == 10
+    assert params.rebalance_solver is True
+    assert params.rebalance_band == Decimal('0.05')
+
+
+@pytest.mark.parametrize('values', [
+    {'cash_buffer': 'lots'},
+    {'max_order_size': None},
+    {'max_position_size': 0},
+    {'max_position_size': '1.5'},
+    {'cash_buffer': -1},
+    {'max_live_children': 0},
+    {'child_timeout': 0},
+    {'fx_max_age': -5},
+    {'rebalance_band': 1},
+    {'rebalance_solver': 'false'},
+    {'rebalance_solver': 1},
+])
+def test_invalid_values_are_rejected(values):
+    with pytest.raises(ValueError):
+        TradingParams.from_config(FakeConfig(**values))
+
+
+def test_instances_cannot_grow_attributes():
+    params = TradingParams.from_config(FakeConfig())
+    with pytest.raises(AttributeError):
+        params.unknown = 1
+    assert repr(params).startswith('TradingParams(cash_buffer=50, ')
@@ -0,0 +1,42 @@
+# test_valuation.py
+
+import sys
+
+from valuation import ValuationCache
+
+
+class FakeContract:
+    conId = 42
+    symbol = 'AAA'
+    currency = 'USD'
+
+
+class FakeBroker:
+    def __init__(self):
+        self.pnl_subscriptions = {}
+
+    def subscribe_pnl_single(self, account, con_id, handler):
+        self.pnl_subscriptions[7] = con_id
+        return 7
+
+
+def cache():
+    valuation = ValuationCache(FakeBroker(), 'DU1')
+    valuation.on_update_portfolio(FakeContract(), 10, 5.0, 50.0, 4.0, 10.0, 0.0, 'DU1')
+    return valuation
+
+
+def test_pnl_single_updates_the_mark():
+    valuation = cache()
+    valuation.on_pnl_single(7, 10, 1.0, 20.0, 0.0, 60.0)
+    assert valuation.get_mark('AAA') == 6.0
+    assert valuation.get_valuation(42)['unrealized_pnl'] == 20.0
+
+
+def test_pnl_single_ignores_unset_values():
+    valuation = cache()
+    valuation.on_pnl_single(7, 10, 1.0, sys.float_info.max, 0.0, sys.float_info.max)
+    assert valuation.get_mark('AAA') == 5.0
+    valuation.on_pnl_single(7, 10, 1.0, sys.float_info.max, 0.0, 70.0)
+    assert valuation.get_mark('AAA') == 7.0
+    assert valuation.get_valuation(42)['unrealized_pnl'] == 10.0
@@ -0,0 +1,66 @@
+# test_warm_up.py
+
+from datetime import datetime, timezone
+
+import pytest
+
+pytest.importorskip('pytz')
+
+from clock import VirtualClock  # noqa: E402
+from warm_up import MarketWarmUp  # noqa: E402
+
+
+class FakeBroker:
+    def __init__(self):
+        self.streams = set()
+
+    def get_contract(self, isin, ticker, exchange, name):
+        return ticker
+
+    def stream_price(self, ticker, contract):
+        self.streams.add(ticker)
+
+    def stop_price_stream(self, ticker):
+        self.streams.discard(ticker)
+
+    def latest_price(self, ticker):
+        return 10.0 if ticker in self.streams else None
+
+
+class FakePortfolioManager:
+    def __init__(self):
+        self.fetched = 0
+
+    def get_current_portfolio(self):
+        self.fetched += 1
+        return {'CASH': 1000, 'fetch': self.fetched}
+
+    def refresh_fx_rates(self, portfolio, stocks):
+        pass
+
+    def calculate_buy_orders(self, prices, portfolio, stocks):
+        return []
+
+
+STOCKS = {ticker: {'isin': f"XX{ticker}", 'exchange': exchange, 'name': ticker}
+          for ticker, exchange in (('AAA', 'LSE'), ('BBB', 'LSE'), ('CCC', 'US'))}
+
+
+def warm_up():
+    return MarketWarmUp(FakeBroker(), FakePortfolioManager(), clock=VirtualClock(datetime(2026, 1, 5, 7, 50, tzinfo=timezone.utc)))
+
+
+def test_portfolio_snapshot_is_used_once():
+    warm = warm_up()
+    warm.prepare({ticker: STOCKS[ticker] for ticker in ('AAA', 'BBB')})
+    assert warm.take_portfolio()['fetch'] == 1
+    assert warm.take_portfolio() is None
+
+
+def test_release_invalidates_the_snapshot_even_with_stocks_left():
+    warm = warm_up()
+    warm.prepare({ticker: STOCKS[ticker] for ticker in ('AAA', 'BBB')})
+    warm.release(['AAA'])
+    assert warm.portfolio is None
+    assert warm.prices(STOCKS) == {'BBB': 10.0}
+    assert warm.broker.streams == {'BBB'}